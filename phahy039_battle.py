@@ -0,0 +1,313 @@
+# File: phahy039_battle.py
+# Description: Monte Carlo battle simulations of armouries against armouries or monster
+# rosters, giving win-rate matrices, damage distributions and balancing passes over
+# every weapon and enchantment blueprint.
+# Run with: python phahy039_battle.py [trials] [seed]
+# Author: Huyen Thi Thu Pham
+
+
+import random
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+
+from phahy039_main import blueprintTables, calculateDamages
+from phahy039_optimizer import blueprintDamages
+
+
+class Combatant:
+    """
+    A fighter in a battle.
+
+    Attributes
+    ----------
+        name (str): The name of the fighter.
+        health (float): The health the fighter starts every fight with.
+        damage (float): The damage of one of its hits before it is rolled.
+        count (int): How many identical fighters it stands for.
+    """
+    __slots__ = ("name", "health", "damage", "count")
+
+    def __init__(self, name, health, damage, count=1):
+        if health <= 0 or damage <= 0:
+            raise ValueError("A combatant needs positive health and damage.")
+        self.name = name
+        self.health = health
+        self.damage = damage
+        self.count = count
+
+    def __repr__(self):
+        return f"Combatant({self.name!r}, {self.health!r}, {self.damage!r}, {self.count!r})"
+
+
+# The monsters armouries are tested against by default.
+defaultMonsters = [
+    Combatant("Goblin", 400, 25),
+    Combatant("Orc", 1500, 60),
+    Combatant("Troll", 3000, 100),
+    Combatant("Wyvern", 4000, 110),
+    Combatant("Dragon", 8000, 150)]
+
+
+def combatantsOf(weapons, health=1000):
+    """
+    Returns the fighters of an armoury, one Combatant per distinct (name, damage) with
+    the number of weapons it stands for. An enchanted weapon fights under the name it
+    was enchanted with and deals its enchanted damage.
+    """
+    weapons = list(weapons)
+    _, damages = calculateDamages(weapons)
+    counts = {}
+    for weapon, damage in zip(weapons, damages):
+        name = getattr(weapon, "enchantmentName", weapon.name) if weapon.isEnchanted() else weapon.name
+        counts[(name, damage)] = counts.get((name, damage), 0) + 1
+    return [Combatant(name, health, damage, count) for (name, damage), count in counts.items()]
+
+
+def loadoutsOf(weaponBlueprints=None, enchantmentBlueprints=None, health=1000):
+    """
+    Returns a Combatant for every weapon blueprint, bare and with every enchantment
+    blueprint, named like "Holy Sword".
+    """
+    weaponBlueprints, enchantmentBlueprints = blueprintTables(weaponBlueprints, enchantmentBlueprints)
+    weaponDamages, magicDamages = blueprintDamages(weaponBlueprints, enchantmentBlueprints)
+    combatants = []
+    for weaponName, damage in weaponDamages.items():
+        combatants.append(Combatant(weaponName, health, damage))
+        for enchantmentName, magicDamage in magicDamages.items():
+            combatants.append(Combatant(f"{enchantmentName} {weaponName}", health, damage * magicDamage))
+    return combatants
+
+
+class BattleSimulator:
+    """
+    Simulates fights where both sides hit each other once a round until one falls.
+
+    Every hit deals the damage of its fighter times a roll between lowRoll and highRoll,
+    doubled by a critical hit with probability critChance. A duel is decided by how
+    many rounds each fighter needs to bring the other down, and those are independent,
+    so they are sampled once per fighter instead of once per duel. The simulator draws
+    trials random sequences of hits up front and keeps, for every round, the sorted
+    totals of the rolls so far. The chance that a fighter dealing d damage has dealt
+    h by round k is then a bisection of the totals of round k at h / d. Every fighter
+    shares the same rolls, which also makes comparisons between them less noisy.
+    Duels lasting more than maxRounds are draws.
+
+    Attributes
+    ----------
+        trials (int): The number of sampled hit sequences.
+        maxRounds (int): The rounds after which a fight is a draw.
+        __rng (random.Random): The seeded generator of every roll.
+        __totals (list): For every round, the sorted roll totals of the trials as an array.
+        __killCache (dict): The kill distribution of every (damage, health) seen so far.
+    Methods
+    -------
+        roll(self):
+            Return the multiplier of one hit.
+        killDistribution(self, damage, health):
+            Return the chance of a kill by every round.
+        duel(self, first, second):
+            Return the chances of winning, drawing and losing a duel.
+        winRates(self, rows, columns):
+            Return the win-rate and draw-rate matrices of two sides.
+        armouryWinRate(self, sideA, sideB):
+            Return the chance a random fighter of one side beats one of the other.
+        damageDistribution(self, combatant, percents):
+            Return the mean and percentiles of the damage of one hit.
+        teamFight(self, teamA, teamB, fights):
+            Simulate whole teams fighting each other.
+        balance(self, combatants, monsters):
+            Rank fighters by their win rate against each other and against monsters.
+    """
+    def __init__(self, trials=10_000, seed=0, maxRounds=200, lowRoll=0.8, highRoll=1.2, critChance=0.1,
+                 critMultiplier=2.0):
+        if trials < 1 or maxRounds < 1:
+            raise ValueError("A simulation needs at least one trial and one round.")
+        self.trials = trials
+        self.maxRounds = maxRounds
+        self.__lowRoll = lowRoll
+        self.__rollSpread = highRoll - lowRoll
+        self.__critChance = critChance
+        self.__critMultiplier = critMultiplier
+        self.__rng = random.Random(seed)
+        self.__totals = None
+        self.__killCache = {}
+
+    def roll(self):
+        """Returns the multiplier of one hit, critical hits included."""
+        rng = self.__rng
+        multiplier = self.__lowRoll + self.__rollSpread * rng.random()
+        if rng.random() < self.__critChance:
+            multiplier *= self.__critMultiplier
+        return multiplier
+
+    def __sampleTotals(self):
+        """Draws the hit sequences of every trial and sorts their running totals by round."""
+        roll = self.roll
+        rounds = range(self.maxRounds)
+        sequences = [list(accumulate(roll() for _ in rounds)) for _ in range(self.trials)]
+        self.__totals = [array("d", sorted(column)) for column in zip(*sequences)]
+
+    def killDistribution(self, damage, health):
+        """
+        Returns an array of the chance that a fighter dealing damage a hit has brought
+        down a fighter with health by the end of every round, from the first to maxRounds.
+        """
+        key = (damage, health)
+        distribution = self.__killCache.get(key)
+        if distribution is None:
+            if self.__totals is None:
+                self.__sampleTotals()
+            # The totals grow every round, so the hits needed to deal health are found by bisection.
+            threshold = health / damage
+            trials = self.trials
+            distribution = self.__killCache[key] = array(
+                "d", [(trials - bisect_left(totals, threshold)) / trials for totals in self.__totals])
+        return distribution
+
+    def duel(self, first, second):
+        """
+        Returns the chances of first winning, drawing and losing a duel against second.
+
+        Both hit once a round, so a duel is drawn when both fall in the same round or
+        neither falls within maxRounds.
+        """
+        firstKills = self.killDistribution(first.damage, second.health)
+        secondKills = self.killDistribution(second.damage, first.health)
+        win = loss = 0.0
+        firstBefore = secondBefore = 0.0
+        for firstBy, secondBy in zip(firstKills, secondKills):
+            # first wins in this round when it lands its kill now and second has not by now.
+            win += (firstBy - firstBefore) * (1.0 - secondBy)
+            loss += (secondBy - secondBefore) * (1.0 - firstBy)
+            firstBefore, secondBefore = firstBy, secondBy
+        return win, 1.0 - win - loss, loss
+
+    def winRates(self, rows, columns):
+        """
+        Returns a dict of the "rows" and "columns" names and the "wins" and "draws"
+        matrices, one array per row, of every row fighter dueling every column fighter.
+        """
+        wins, draws = [], []
+        for row in rows:
+            winRow, drawRow = array("d"), array("d")
+            for column in columns:
+                win, draw, _ = self.duel(row, column)
+                winRow.append(win)
+                drawRow.append(draw)
+            wins.append(winRow)
+            draws.append(drawRow)
+        return {"rows": [row.name for row in rows], "columns": [column.name for column in columns],
+                "wins": wins, "draws": draws}
+
+    def armouryWinRate(self, sideA, sideB):
+        """
+        Returns the chances that a fighter drawn at random from side A wins, draws and
+        loses a duel against one drawn from side B, weighting fighters by their count.
+        """
+        totalA = sum(combatant.count for combatant in sideA)
+        totalB = sum(combatant.count for combatant in sideB)
+        if not totalA or not totalB:
+            raise ValueError("Both sides need at least one fighter.")
+        win = draw = 0.0
+        for first in sideA:
+            for second in sideB:
+                weight = first.count * second.count
+                duelWin, duelDraw, _ = self.duel(first, second)
+                win += weight * duelWin
+                draw += weight * duelDraw
+        pairs = totalA * totalB
+        return win / pairs, draw / pairs, 1.0 - (win + draw) / pairs
+
+    def damageDistribution(self, combatant, percents=(5, 50, 95)):
+        """Returns the "mean" damage of one hit of a fighter and its percentiles, keyed like "p50"."""
+        if self.__totals is None:
+            self.__sampleTotals()
+        firstHits = self.__totals[0]
+        distribution = {"mean": combatant.damage * sum(firstHits) / len(firstHits)}
+        for percent in percents:
+            index = min(len(firstHits) - 1, int(percent / 100 * len(firstHits)))
+            distribution[f"p{percent}"] = combatant.damage * firstHits[index]
+        return distribution
+
+    def teamFight(self, teamA, teamB, fights=1000):
+        """
+        Simulates fights between two teams and returns the chances of team A winning,
+        drawing and losing and the mean number of rounds.
+
+        Every round each standing fighter hits once and each team focuses its damage
+        on the first standing fighter of the other, spilling over to the next ones.
+        A Combatant with a count fights as that many fighters.
+        """
+        teamA = [combatant for combatant in teamA for _ in range(combatant.count)]
+        teamB = [combatant for combatant in teamB for _ in range(combatant.count)]
+        if not teamA or not teamB:
+            raise ValueError("Both teams need at least one fighter.")
+        roll = self.roll
+        outcomes = [0, 0, 0]
+        totalRounds = 0
+        for _ in range(fights):
+            healthA = [combatant.health for combatant in teamA]
+            healthB = [combatant.health for combatant in teamB]
+            standingA, standingB = 0, 0
+            rounds = 0
+            while standingA < len(teamA) and standingB < len(teamB) and rounds < self.maxRounds:
+                rounds += 1
+                damageToB = sum(combatant.damage * roll() for combatant in teamA[standingA:])
+                damageToA = sum(combatant.damage * roll() for combatant in teamB[standingB:])
+                standingB = self.__spill(healthB, standingB, damageToB)
+                standingA = self.__spill(healthA, standingA, damageToA)
+            totalRounds += rounds
+            fallenA, fallenB = standingA == len(teamA), standingB == len(teamB)
+            outcomes[0 if fallenB and not fallenA else 2 if fallenA and not fallenB else 1] += 1
+        win, draw, loss = (outcome / fights for outcome in outcomes)
+        return {"win": win, "draw": draw, "loss": loss, "meanRounds": totalRounds / fights}
+
+    @staticmethod
+    def __spill(health, first, damage):
+        """Deals damage to the fighters from first on and returns the index of the first still standing."""
+        while first < len(health) and damage > 0:
+            dealt = min(damage, health[first])
+            health[first] -= dealt
+            damage -= dealt
+            if health[first] <= 0:
+                first += 1
+        return first
+
+    def balance(self, combatants, monsters=defaultMonsters):
+        """
+        Duels every fighter against every other and every monster, and returns a list of
+        (name, win rate against the field, {monster name: win rate}) sorted from the
+        strongest fighter to the weakest.
+        """
+        field = self.winRates(combatants, combatants)
+        against = self.winRates(combatants, monsters)
+        ranking = []
+        for combatant, wins, monsterWins in zip(combatants, field["wins"], against["wins"]):
+            ranking.append((combatant.name, sum(wins) / len(wins), dict(zip(against["columns"], monsterWins))))
+        ranking.sort(key=lambda entry: -entry[1])
+        return ranking
+
+
+if __name__ == '__main__':
+    trials = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    simulator = BattleSimulator(trials, seed)
+    loadouts = loadoutsOf()
+    start = time.perf_counter()
+    ranking = simulator.balance(loadouts)
+    elapsed = time.perf_counter() - start
+    duels = len(loadouts) * (len(loadouts) + len(defaultMonsters))
+    print(f"Balancing pass over {len(loadouts)} loadouts, {duels} matchups of {trials} x {trials} "
+          f"sampled duels each, in {elapsed:.3f} s")
+    print(f"    {'loadout':<22}{'field':>7}" + "".join(f"{monster.name:>8}" for monster in defaultMonsters))
+    for name, fieldRate, monsterRates in ranking[:5] + ranking[-5:]:
+        print(f"    {name:<22}{fieldRate:7.3f}" + "".join(f"{rate:8.3f}" for rate in monsterRates.values()))
+    sword = next(loadout for loadout in loadouts if loadout.name == "Holy Sword")
+    print("    Holy Sword hit damage: " + ", ".join(f"{key} {value:.1f}"
+                                                   for key, value in simulator.damageDistribution(sword).items()))
+    team = [loadout for loadout in loadouts if loadout.name in ("Holy Sword", "Pyro Scythe", "Venomous Bow")]
+    print(f"    Holy Sword, Pyro Scythe and Venomous Bow against a Dragon: "
+          f"{simulator.teamFight(team, [defaultMonsters[-1]])}")
@@ -0,0 +1,390 @@
+# File: phahy039_bench.py
+# Description: benchmarks for the hot paths of the crafting system.
+# Run with: python phahy039_bench.py damage [weaponCount]
+#           python phahy039_bench.py concurrent [craftsPerThread]
+#           python phahy039_bench.py journal [crafts]
+#           python phahy039_bench.py import [repeat]
+#           python phahy039_bench.py suite [maxSize] [results.json]
+#           python phahy039_bench.py compare results.json baseline.json [tolerance]
+# Author: Huyen Thi Thu Pham
+
+
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from itertools import cycle, islice
+
+import phahy039_main
+from phahy039_journal import Journal, replay
+from phahy039_main import *
+from phahy039_main import enchantmentBlueprints, weaponBlueprints
+
+
+class UnmemoizedTable(dict):
+    """A damage table that never remembers anything, used to time the uncached path."""
+
+    def __setitem__(self, key, value):
+        pass
+
+    def update(self, *args, **kwargs):
+        pass
+
+
+def bestTime(function, repeat=3):
+    """Returns the best wall clock time in seconds of a few calls to function."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def buildArmoury(count):
+    """Builds a workshop holding count weapons cycled from the weapon blueprints, half of them enchanted."""
+    workshop = Workshop(Forge(), Enchanter())
+    blueprints = list(weaponBlueprints.items())
+    enchantments = [Enchantment(name, primary, catalyst, "Default Effect")
+                    for name, (primary, catalyst) in enchantmentBlueprints.items()]
+    for i in range(count):
+        name, (primary, catalyst) = blueprints[i % len(blueprints)]
+        weapon = Weapon(name, primary, catalyst)
+        if i % 2:
+            weapon.setEnchantment(enchantments[i % len(enchantments)])
+        workshop.addWeapon(weapon)
+    return workshop
+
+
+def benchmarkDamageTable(count=1_000_000):
+    """Times calculating every weapon's damage with and without the memoized damage tables."""
+    workshop = buildArmoury(count)
+    weapons = list(workshop.weapons)
+
+    def scalarDamages():
+        for weapon in weapons:
+            weapon.calculateDamage()
+            if weapon.enchantment:
+                weapon.enchantment.calculateMagicDamage()
+
+    results = {}
+    damageTable, magicDamageTable = phahy039_main.damageTable, phahy039_main.magicDamageTable
+    phahy039_main.damageTable, phahy039_main.magicDamageTable = UnmemoizedTable(), UnmemoizedTable()
+    try:
+        results["scalar uncached"] = bestTime(scalarDamages)
+    finally:
+        phahy039_main.damageTable, phahy039_main.magicDamageTable = damageTable, magicDamageTable
+    results["scalar memoized"] = bestTime(scalarDamages)
+    results["batch memoized"] = bestTime(workshop.calculateDamages)
+
+    print(f"Damage of {count} weapons:")
+    for label, seconds in results.items():
+        print(f"    {label:<18}{seconds:8.3f} s")
+    print(f"    speedup           {results['scalar uncached'] / results['scalar memoized']:8.2f} x")
+    return results
+
+
+def benchmarkConcurrentCrafting(craftsPerThread=20_000, threadCounts=(1, 2, 4, 8)):
+    """
+    Times many threads crafting against one ConcurrentWorkshop and checks the material
+    store stays consistent: nothing goes negative and every unit consumed is in a weapon.
+    """
+    blueprints = list(weaponBlueprints.items())
+    results = {}
+    print(f"Concurrent crafting, {craftsPerThread} crafts per thread:")
+    for threadCount in threadCounts:
+        workshop = ConcurrentWorkshop(None, None)
+        forge = Forge(workshop)
+        # Stock less than the threads ask for, so they race for the last units.
+        stock = craftsPerThread * threadCount // 8
+        for material in {material.__class__.__name__ for _, pair in blueprints for material in pair}:
+            workshop.addMaterial(material, stock)
+        initial = dict(workshop.materials)
+
+        def craft(offset):
+            for i in range(craftsPerThread):
+                name, (primary, catalyst) = blueprints[(offset + i) % len(blueprints)]
+                try:
+                    forge.craft(name, primary, catalyst, workshop.materials)
+                except ValueError:
+                    pass
+
+        threads = [threading.Thread(target=craft, args=(i,)) for i in range(threadCount)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        used = dict.fromkeys(initial, 0)
+        for weapon in workshop.weapons:
+            used[weapon.getPrimaryMaterial().__class__.__name__] += 1
+            used[weapon.getCatalystMaterial().__class__.__name__] += 1
+        consistent = all(workshop.materials[name] >= 0 and workshop.materials[name] + used[name] == initial[name]
+                         for name in initial)
+        attempts = craftsPerThread * threadCount
+        results[threadCount] = attempts / elapsed
+        print(f"    {threadCount} threads {attempts / elapsed:12.0f} crafts/s  "
+              f"{len(workshop.weapons):8d} crafted  consistent={consistent}")
+    return results
+
+
+def benchmarkJournal(crafts=100_000, repeat=5, targetPercent=5.0):
+    """
+    Times crafting with and without a Journal, and replaying the journal afterwards.
+
+    Every craft forges a weapon, and every other one also crafts an enchantment and
+    enchants the weapon with it, the way a game session would. Sessions with an observer
+    that does nothing show the part of the overhead that is telling observers at all.
+    The overhead of the journal is reported against targetPercent, and is above it on
+    CPython, where committing reads the state of every changed item in Python.
+    """
+    blueprints = list(weaponBlueprints.items())
+    enchantments = list(enchantmentBlueprints.items())
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "workshop.journal")
+
+    def session(observer):
+        workshop = Workshop(None, None)
+        forge = Forge(workshop)
+        enchanter = Enchanter(workshop)
+        for blueprint in blueprints + enchantments:
+            for material in blueprint[1]:
+                workshop.addMaterial(material.__class__.__name__, crafts)
+        journal = Journal(path, workshop) if observer == "journal" else None
+        if observer == "observer":
+            workshop.addObserver(WorkshopObserver())
+        start = time.perf_counter()
+        for i in range(crafts):
+            name, (primary, catalyst) = blueprints[i % len(blueprints)]
+            weapon = forge.craft(name, primary, catalyst, workshop.materials)
+            if i % 2:
+                name, (primary, catalyst) = enchantments[i % len(enchantments)]
+                enchantment = enchanter.craft(name, primary, catalyst, workshop.materials)
+                enchanter.enchant(weapon, f"{name} {weapon.name}", enchantment)
+        if journal is not None:
+            journal.close()
+        return time.perf_counter() - start, workshop
+
+    # Runs alternate between the two so drifts in machine load affect both alike.
+    plainTimes, observedTimes, journaledTimes = [], [], []
+    for _ in range(repeat):
+        plainTimes.append(session(None)[0])
+        observedTimes.append(session("observer")[0])
+        journaledTimes.append(session("journal")[0])
+    plain, observed, journaled = min(plainTimes), min(observedTimes), min(journaledTimes)
+    workshop = session("journal")[1]
+    start = time.perf_counter()
+    recovered, _ = replay(path)
+    replaySeconds = time.perf_counter() - start
+    identical = (recovered.displayWeapons() == workshop.displayWeapons()
+                 and recovered.materials == workshop.materials)
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+    print(f"Crafting session of {crafts} crafts:")
+    print(f"    no journal {plain:8.3f} s  {crafts / plain:10.0f} crafts/s")
+    print(f"    observer   {observed:8.3f} s  {crafts / observed:10.0f} crafts/s  "
+          f"overhead {(observed - plain) / plain * 100:5.1f} %")
+    overhead = (journaled - plain) / plain * 100
+    print(f"    journal    {journaled:8.3f} s  {crafts / journaled:10.0f} crafts/s  "
+          f"overhead {overhead:5.1f} %  {'within' if overhead <= targetPercent else 'above'} "
+          f"the {targetPercent:g} % target")
+    print(f"    replay     {replaySeconds:8.3f} s  identical={identical}")
+    return {"plain": plain, "observed": observed, "journaled": journaled, "replay": replaySeconds,
+            "overhead": overhead, "withinTarget": overhead <= targetPercent}
+
+
+def benchmarkImport(repeat=20):
+    """
+    Times a fresh interpreter importing phahy039_main against one importing nothing,
+    the cost every short lived worker pays. Compiled bytecode is cached in a temporary
+    directory, as it would be in a deployment.
+    """
+    directory = tempfile.mkdtemp()
+    environment = dict(os.environ, PYTHONPYCACHEPREFIX=directory)
+    environment.pop("PYTHONDONTWRITEBYTECODE", None)
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def launch(statement):
+        return bestTime(lambda: subprocess.run([sys.executable, "-c", statement], cwd=here, env=environment,
+                                               stdout=subprocess.DEVNULL, check=True), repeat)
+
+    # The first import compiles the modules and caches their bytecode.
+    launch("import phahy039_main")
+    empty = launch("pass")
+    results = {"interpreter": empty}
+    for module in ("phahy039_main", "phahy039_journal", "phahy039_snapshot"):
+        results[module] = launch(f"import {module}") - empty
+    for root, _, names in os.walk(directory, topdown=False):
+        for name in names:
+            os.remove(os.path.join(root, name))
+        os.rmdir(root)
+
+    print(f"Import time, best of {repeat} fresh interpreters:")
+    print(f"    interpreter start up {empty * 1000:8.2f} ms")
+    for module in ("phahy039_main", "phahy039_journal", "phahy039_snapshot"):
+        print(f"    import {module:17s} {results[module] * 1000:6.2f} ms")
+    return results
+
+
+# The format of the results of benchmarkSuite, compared results must share it.
+SUITE_VERSION = 1
+
+
+def suiteSizes(maxSize=1_000_000, minSize=100):
+    """Returns the inventory sizes of the suite, the powers of ten from minSize to maxSize."""
+    sizes = []
+    size = minSize
+    while size <= maxSize:
+        sizes.append(size)
+        size *= 10
+    return sizes
+
+
+def benchmarkSuite(sizes=None, operations=10_000, repeat=5, seed=0):
+    """
+    Times the crafting and bookkeeping operations against inventories of every size
+    and returns the results as a JSON serialisable dict.
+
+    For every size a workshop holding that many weapons is built with buildArmoury,
+    its memory per weapon traced with tracemalloc. Then, repeat times, up to operations
+    weapons and enchantments are crafted into it, the weapons enchanted and removed
+    again, and materials added and removed. Every result is the best time per call of
+    those rounds in nanoseconds, apart from displayWeapons, which is timed once per
+    round and reported per weapon listed. The weapons removed are shuffled with a
+    seeded random generator, so runs are reproducible.
+
+    10_000_000 weapons need about 4 GB of memory, so the default stops at a million.
+    """
+    sizes = suiteSizes() if sizes is None else sizes
+    blueprints = list(weaponBlueprints.items())
+    enchantments = list(enchantmentBlueprints.items())
+    generator = random.Random(seed)
+    results = []
+
+    def record(benchmark, size, value, unit):
+        results.append({"benchmark": benchmark, "size": size, "value": value, "unit": unit})
+
+    for size in sizes:
+        tracemalloc.start()
+        workshop = buildArmoury(size)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        record("memory_per_weapon", size, memory / size, "B/item")
+
+        forge, enchanter = Forge(workshop), Enchanter(workshop)
+        count = min(size, operations)
+        weaponOrders = [(name, primary, catalyst) for name, (primary, catalyst) in islice(cycle(blueprints), count)]
+        enchantmentOrders = [(name, primary, catalyst)
+                             for name, (primary, catalyst) in islice(cycle(enchantments), count)]
+        for _, primary, catalyst in weaponOrders + enchantmentOrders:
+            workshop.addMaterial(primary, repeat)
+            workshop.addMaterial(catalyst, repeat)
+        # removeMaterial only takes a quantity when more than it is in stock.
+        workshop.addMaterial(Steel(), 1)
+        timings = {}
+
+        def timed(benchmark, function, calls):
+            start = time.perf_counter()
+            result = function()
+            nanoseconds = (time.perf_counter() - start) * 1e9 / calls
+            timings[benchmark] = min(timings.get(benchmark, nanoseconds), nanoseconds)
+            return result
+
+        for _ in range(repeat):
+            crafted = timed("forge_craft", lambda: [
+                forge.craft(name, primary, catalyst, workshop.materials)
+                for name, primary, catalyst in weaponOrders], count)
+            magic = timed("enchanter_craft", lambda: [
+                enchanter.craft(name, primary, catalyst, workshop.materials)
+                for name, primary, catalyst in enchantmentOrders], count)
+            timed("enchanter_enchant", lambda: [
+                enchanter.enchant(weapon, f"{enchantment.name} {weapon.name}", enchantment)
+                for weapon, enchantment in zip(crafted, magic)], count)
+            generator.shuffle(crafted)
+            timed("workshop_removeWeapon", lambda: [workshop.removeWeapon(weapon) for weapon in crafted], count)
+            for enchantment in magic:
+                workshop.removeEnchantment(enchantment)
+            timed("workshop_addMaterial", lambda: [workshop.addMaterial(Steel(), 2) for _ in range(count)], count)
+            timed("workshop_removeMaterial", lambda: [workshop.removeMaterial(Steel(), 2) for _ in range(count)],
+                  count)
+            timed("workshop_displayWeapons", workshop.displayWeapons, size)
+        for benchmark, nanoseconds in timings.items():
+            record(benchmark, size, nanoseconds, "ns/item" if benchmark == "workshop_displayWeapons" else "ns/op")
+        del workshop, forge, enchanter
+
+    return {"version": SUITE_VERSION, "python": platform.python_version(), "platform": platform.platform(),
+            "operations": operations, "repeat": repeat, "seed": seed, "results": results}
+
+
+def printSuite(suite):
+    """Prints the results of benchmarkSuite as a table of benchmarks by inventory size."""
+    sizes = sorted({result["size"] for result in suite["results"]})
+    table = {}
+    for result in suite["results"]:
+        table.setdefault((result["benchmark"], result["unit"]), {})[result["size"]] = result["value"]
+    print(f"{'benchmark':<26}{'unit':>8}" + "".join(f"{size:>12}" for size in sizes))
+    for (benchmark, unit), values in table.items():
+        print(f"{benchmark:<26}{unit:>8}" + "".join(
+            f"{values[size]:12.1f}" if size in values else f"{'':>12}" for size in sizes))
+
+
+def compareSuites(results, baseline, tolerance=0.25):
+    """
+    Compares two benchmarkSuite results and returns the regressions, as a list of
+    (benchmark, size, baselineValue, value) where the value is more than tolerance
+    above the baseline. Benchmarks missing from either side are not compared.
+    """
+    if results.get("version") != baseline.get("version"):
+        raise ValueError("The results and the baseline come from different suite versions.")
+    baselineValues = {(result["benchmark"], result["size"]): result["value"] for result in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        before = baselineValues.get((result["benchmark"], result["size"]))
+        if before is not None and result["value"] > before * (1 + tolerance):
+            regressions.append((result["benchmark"], result["size"], before, result["value"]))
+    return regressions
+
+
+if __name__ == '__main__':
+    benchmark = sys.argv[1] if len(sys.argv) > 1 else "damage"
+    if benchmark == "damage":
+        benchmarkDamageTable(int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000)
+    elif benchmark == "concurrent":
+        benchmarkConcurrentCrafting(int(sys.argv[2]) if len(sys.argv) > 2 else 20_000)
+    elif benchmark == "journal":
+        benchmarkJournal(int(sys.argv[2]) if len(sys.argv) > 2 else 100_000)
+    elif benchmark == "import":
+        benchmarkImport(int(sys.argv[2]) if len(sys.argv) > 2 else 20)
+    elif benchmark == "suite":
+        suite = benchmarkSuite(suiteSizes(int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000))
+        printSuite(suite)
+        if len(sys.argv) > 3:
+            with open(sys.argv[3], "w") as file:
+                json.dump(suite, file, indent=1)
+    elif benchmark == "compare":
+        if len(sys.argv) < 4:
+            sys.exit("Run with: python phahy039_bench.py compare results.json baseline.json [tolerance]")
+        with open(sys.argv[2]) as file:
+            results = json.load(file)
+        with open(sys.argv[3]) as file:
+            baseline = json.load(file)
+        tolerance = float(sys.argv[4]) if len(sys.argv) > 4 else 0.25
+        regressions = compareSuites(results, baseline, tolerance)
+        for name, size, before, after in regressions:
+            print(f"REGRESSION {name} at {size}: {before:.1f} -> {after:.1f} (+{(after / before - 1) * 100:.1f} %)")
+        print(f"{len(regressions)} regressions beyond {tolerance * 100:.0f} %")
+        sys.exit(1 if regressions else 0)
+    else:
+        sys.exit(f"Unknown benchmark: {benchmark}")
@@ -0,0 +1,284 @@
+# File: phahy039_feed.py
+# Description: a change feed of a workshop's inventory, keeping typed events in a ring
+# buffer that consumers read from a cursor or receive as coalesced batches.
+# Run with: python phahy039_feed.py [weapons] [changes]
+# Author: Huyen Thi Thu Pham
+
+
+import sys
+import threading
+import time
+
+from phahy039_main import Enchanter, Forge, Workshop, WorkshopObserver, blueprintTables
+
+
+# The event kinds. Every event is a (sequence, kind, item, value) tuple, where item is
+# the weapon, enchantment or material name the event is about.
+FEED_OVERFLOW = 0        # (sequence, FEED_OVERFLOW, None, lostEvents), the reader fell behind.
+WEAPON_ADDED = 1         # (sequence, WEAPON_ADDED, weapon, None)
+WEAPON_REMOVED = 2       # (sequence, WEAPON_REMOVED, weapon, None)
+WEAPON_CHANGED = 3       # (sequence, WEAPON_CHANGED, weapon, None)
+WEAPON_ENCHANTED = 4     # (sequence, WEAPON_ENCHANTED, weapon, enchantment)
+ENCHANTMENT_ADDED = 5    # (sequence, ENCHANTMENT_ADDED, enchantment, None)
+ENCHANTMENT_REMOVED = 6  # (sequence, ENCHANTMENT_REMOVED, enchantment, None)
+MATERIAL_CHANGED = 7     # (sequence, MATERIAL_CHANGED, materialName, delta)
+
+ADDED_KINDS = (WEAPON_ADDED, ENCHANTMENT_ADDED)
+REMOVED_KINDS = (WEAPON_REMOVED, ENCHANTMENT_REMOVED)
+
+
+def coalesce(events):
+    """
+    Merges the events of each item into its net change, in the order of each item's
+    last event.
+
+    An item added and removed in the same batch disappears, one added and then changed
+    is only added, and a weapon enchanted and then changed is enchanted. The deltas of
+    a material are summed and dropped when they cancel out. Overflow events are summed
+    into one, which comes first.
+    """
+    merged = {}
+    lost = None
+    for sequence, kind, item, value in events:
+        if kind == FEED_OVERFLOW:
+            lost = (sequence, kind, None, value) if lost is None else lost[:3] + (lost[3] + value,)
+            continue
+        key = item if kind == MATERIAL_CHANGED else (kind >= ENCHANTMENT_ADDED, id(item))
+        # Each item is moved to the end, so items come in the order of their last event.
+        firstKind, _, _, enchantment, delta, _ = merged.pop(key, (kind, kind, item, None, 0, sequence))
+        if kind == MATERIAL_CHANGED:
+            delta += value
+        elif kind == WEAPON_ENCHANTED:
+            enchantment = value
+        merged[key] = (firstKind, kind, item, enchantment, delta, sequence)
+
+    coalesced = [] if lost is None else [lost]
+    for firstKind, lastKind, item, enchantment, delta, sequence in merged.values():
+        if lastKind == MATERIAL_CHANGED:
+            if delta:
+                coalesced.append((sequence, MATERIAL_CHANGED, item, delta))
+            continue
+        storedBefore = firstKind not in ADDED_KINDS
+        storedAfter = lastKind not in REMOVED_KINDS
+        if storedAfter and not storedBefore:
+            coalesced.append((sequence, firstKind, item, None))
+        elif storedBefore and not storedAfter:
+            coalesced.append((sequence, lastKind, item, None))
+        elif storedBefore and lastKind < ENCHANTMENT_ADDED:
+            # A weapon stored before and after the batch has only changed.
+            if enchantment is None:
+                coalesced.append((sequence, WEAPON_CHANGED, item, None))
+            else:
+                coalesced.append((sequence, WEAPON_ENCHANTED, item, enchantment))
+    return coalesced
+
+
+class ChangeFeed(WorkshopObserver):
+    """
+    A change feed of a workshop, so consumers do work in proportion to the changes
+    rather than rescanning the whole inventory.
+
+    The feed observes the workshop, so weapons and enchantments added, removed, crafted,
+    disassembled or enchanted by Forge and Enchanter are recorded without changing them.
+    Events are kept in a ring buffer of capacity events, so memory stays bounded however
+    far a consumer falls behind: a reader whose cursor was overwritten is given a
+    FEED_OVERFLOW event counting the events it lost and should rescan the workshop.
+
+    Crafters update the materials ledger directly, so like the journal the feed compares
+    the small ledger with the last one it saw whenever it is read, and records a
+    MATERIAL_CHANGED event with the delta of each material that changed.
+
+    Consumers either pull the events after a cursor with read, or subscribe a callback
+    that is given each batch of new events coalesced into net changes. Callbacks are
+    called by flush, and automatically once batchSize events are waiting.
+
+    Attributes
+    ----------
+        workshop (Workshop): The observed workshop.
+        capacity (int): The most events kept.
+        __events (list): The ring buffer, the event of sequence s is at s % capacity.
+        __next (int): The sequence of the next event.
+        __materials (dict): The materials ledger as last compared.
+        __subscribers (dict): The cursor of every subscribed callback.
+        __batchSize (int): The events waiting that trigger a flush.
+        __pending (int): The events recorded since the last flush.
+        __flushing (bool): Whether callbacks are being called.
+        __lock (threading.RLock): Serialises recording and reading events.
+
+    Methods
+    -------
+        cursor(self):
+            Return the sequence of the next event, to read the events from now on.
+        read(self, cursor, limit):
+            Return the events from a cursor and the cursor to read from next.
+        subscribe(self, callback), unsubscribe(self, callback):
+            Register or unregister a callback given coalesced batches of new events.
+        flush(self):
+            Give every subscribed callback the events since its last batch.
+        close(self):
+            Stop observing the workshop.
+    """
+    def __init__(self, workshop, capacity=65536, batchSize=1024):
+        if capacity < 1:
+            raise ValueError("The capacity of a change feed must be at least 1.")
+        self.workshop = workshop
+        self.capacity = capacity
+        self.__events = [None] * capacity
+        self.__next = 0
+        self.__materials = dict(workshop.materials.items())
+        self.__subscribers = {}
+        self.__batchSize = batchSize
+        self.__pending = 0
+        self.__flushing = False
+        self.__lock = threading.RLock()
+        workshop.addObserver(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __record(self, kind, item, value):
+        with self.__lock:
+            sequence = self.__next
+            self.__events[sequence % self.capacity] = (sequence, kind, item, value)
+            self.__next = sequence + 1
+            self.__pending += 1
+            if self.__subscribers and self.__pending >= self.__batchSize:
+                self.flush()
+
+    def weaponAdded(self, weapon):
+        self.__record(WEAPON_ADDED, weapon, None)
+
+    def weaponRemoved(self, weapon):
+        self.__record(WEAPON_REMOVED, weapon, None)
+
+    def weaponChanged(self, weapon):
+        self.__record(WEAPON_CHANGED, weapon, None)
+
+    def weaponEnchanted(self, weapon):
+        self.__record(WEAPON_ENCHANTED, weapon, weapon.getEnchantment())
+
+    def enchantmentAdded(self, enchantment):
+        self.__record(ENCHANTMENT_ADDED, enchantment, None)
+
+    def enchantmentRemoved(self, enchantment):
+        self.__record(ENCHANTMENT_REMOVED, enchantment, None)
+
+    def __compareMaterials(self):
+        materials = dict(self.workshop.materials.items())
+        if materials == self.__materials:
+            return
+        # The new ledger is kept before recording, as recording can flush, which compares
+        # the ledgers again and must find nothing left to record.
+        previous, self.__materials = self.__materials, materials
+        for materialName, quantity in materials.items():
+            delta = quantity - previous.get(materialName, 0)
+            if delta:
+                self.__record(MATERIAL_CHANGED, materialName, delta)
+        for materialName, quantity in previous.items():
+            if materialName not in materials and quantity:
+                self.__record(MATERIAL_CHANGED, materialName, -quantity)
+
+    def cursor(self):
+        """Returns the sequence of the next event, a cursor to read the events from now on."""
+        with self.__lock:
+            self.__compareMaterials()
+            return self.__next
+
+    def read(self, cursor, limit=None):
+        """
+        Returns the events from a cursor, at most limit of them, and the cursor to read
+        from next. When events after the cursor were overwritten the batch starts with a
+        FEED_OVERFLOW event counting them.
+        """
+        with self.__lock:
+            self.__compareMaterials()
+            if cursor > self.__next or cursor < 0:
+                raise ValueError("Cursor is not a sequence of the feed.")
+            events = []
+            oldest = max(0, self.__next - self.capacity)
+            if cursor < oldest:
+                events.append((cursor, FEED_OVERFLOW, None, oldest - cursor))
+                cursor = oldest
+            end = self.__next if limit is None else min(self.__next, cursor + limit)
+            start, stop = cursor % self.capacity, end % self.capacity
+            if end == cursor:
+                pass
+            elif start < stop:
+                events += self.__events[start:stop]
+            else:
+                events += self.__events[start:] + self.__events[:stop]
+            return events, end
+
+    def subscribe(self, callback):
+        """Registers a callback given each coalesced batch of the events from now on."""
+        with self.__lock:
+            if callback not in self.__subscribers:
+                self.__subscribers[callback] = self.cursor()
+
+    def unsubscribe(self, callback):
+        """Unregisters a callback."""
+        with self.__lock:
+            self.__subscribers.pop(callback, None)
+
+    def flush(self):
+        """Gives every subscribed callback the coalesced events since its last batch."""
+        with self.__lock:
+            # A callback changing the workshop records events, which wait for the next flush.
+            if self.__flushing:
+                return
+            self.__flushing = True
+            try:
+                self.__pending = 0
+                self.__compareMaterials()
+                for callback, cursor in list(self.__subscribers.items()):
+                    events, self.__subscribers[callback] = self.read(cursor)
+                    batch = coalesce(events)
+                    if batch:
+                        callback(batch)
+            finally:
+                self.__flushing = False
+
+    def close(self):
+        """Gives the subscribers their last batch and stops observing the workshop."""
+        self.flush()
+        self.workshop.removeObserver(self)
+
+
+if __name__ == '__main__':
+    weaponCount = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    changeCount = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    weaponBlueprints, enchantmentBlueprints = blueprintTables()
+    workshop = Workshop(Forge(), Enchanter())
+    forge = Forge(workshop)
+    enchanter = Enchanter(workshop)
+    workshop.addMaterial("Steel", weaponCount + changeCount + 1)
+    workshop.addMaterial("Maple", weaponCount + changeCount + 1)
+    workshop.addMaterial("Diamond", changeCount + 1)
+    forge.craftMany(weaponBlueprints, {"Sword": weaponCount}, workshop.materials)
+
+    feed = ChangeFeed(workshop)
+    batches = []
+    feed.subscribe(batches.append)
+    cursor = feed.cursor()
+    for i in range(changeCount):
+        weapon = forge.craft("Sword", *weaponBlueprints["Sword"], workshop.materials)
+        if i % 2 == 0:
+            enchantment = enchanter.craft("Holy", *enchantmentBlueprints["Holy"], workshop.materials)
+            enchanter.enchant(weapon, "Holy", enchantment)
+        workshop.removeWeapon(workshop.weapons[0])
+
+    start = time.perf_counter()
+    workshop.displayWeapons()
+    pollSeconds = time.perf_counter() - start
+    start = time.perf_counter()
+    events, cursor = feed.read(cursor)
+    changes = coalesce(events)
+    feedSeconds = time.perf_counter() - start
+    feed.close()
+    print(f"{len(workshop.weapons)} weapons, {changeCount} crafted, half of them enchanted, and {changeCount} removed")
+    print(f"    polling displayWeapons {pollSeconds * 1000:9.3f} ms")
+    print(f"    reading the feed       {feedSeconds * 1000:9.3f} ms  ({len(events)} events, {len(changes)} net changes)")
+    print(f"    {len(batches)} batches given to the subscriber")
@@ -0,0 +1,217 @@
+# File: phahy039_ingest.py
+# Description: streams blueprint and material delivery files (CSV or JSON Lines) into a
+# workshop in bounded batches, so files of any size are read in constant memory.
+# Run with: python phahy039_ingest.py deliveries.csv orders.jsonl
+# Author: Huyen Thi Thu Pham
+
+
+import csv
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from phahy039_main import Enchanter, Forge, Workshop
+from phahy039_snapshot import materialClasses
+
+
+# The material classes by name, built once so each row is resolved with a dict lookup.
+# Wood, Metal and Gemstone are kinds of material without default stats, so only the
+# classes without subclasses can be delivered or named in a blueprint.
+materialTable = {name: materialClass for name, materialClass in materialClasses().items()
+                 if not materialClass.__subclasses__()}
+
+
+def readRecords(path, format=None):
+    """
+    Yields the rows of a CSV or JSON Lines file one at a time as (lineNumber, dict).
+
+    The format is taken from the file extension (.csv, .jsonl or .ndjson) unless given.
+    CSV files need a header row. Blank JSON lines are skipped.
+    """
+    if format is None:
+        extension = os.path.splitext(path)[1].lower()
+        format = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}.get(extension)
+    if format not in ("csv", "jsonl"):
+        raise ValueError(f"Unknown file format: {path}.")
+    with open(path, newline="", encoding="utf-8") as file:
+        if format == "csv":
+            reader = csv.DictReader(file)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for lineNumber, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as error:
+                    raise ValueError(f"{path}:{lineNumber}: invalid JSON, {error.msg}.") from None
+                if not isinstance(record, dict):
+                    raise ValueError(f"{path}:{lineNumber}: expected a JSON object.")
+                yield lineNumber, record
+
+
+def batched(iterable, size):
+    """Yields lists of at most size items of an iterable."""
+    if size < 1:
+        raise ValueError("Batch size must be at least 1.")
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def resolveMaterial(name):
+    """Returns the interned default material of a material class name."""
+    materialClass = materialTable.get(name.strip() if isinstance(name, str) else name)
+    if materialClass is None:
+        raise ValueError(f"Unknown material: {name}.")
+    return materialClass()
+
+
+def parseQuantity(value, field):
+    """Returns a whole, non-negative quantity read from a CSV string or a JSON number."""
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a whole number, got {value!r}.") from None
+    if quantity < 0 or quantity != float(value):
+        raise ValueError(f"{field} must be a whole, non-negative number, got {value!r}.")
+    return quantity
+
+
+def parseDelivery(record):
+    """Returns the (materialName, quantity) of a delivery row with material and quantity fields."""
+    materialName = resolveMaterial(record.get("material")).__class__.__name__
+    return materialName, parseQuantity(record.get("quantity"), "quantity")
+
+
+def parseBlueprint(record):
+    """
+    Returns the (kind, name, primaryMaterial, catalystMaterial, count) of a blueprint row.
+
+    A row has a kind ("weapon" or "enchantment"), a name, primary and catalyst material
+    names and an optional count of items to craft, 1 by default.
+    """
+    kind = (record.get("kind") or "").strip().lower()
+    if kind not in ("weapon", "enchantment"):
+        raise ValueError(f"kind must be weapon or enchantment, got {record.get('kind')!r}.")
+    name = (record.get("name") or "").strip()
+    if not name:
+        raise ValueError("name is missing.")
+    count = record.get("count")
+    count = 1 if count in (None, "") else parseQuantity(count, "count")
+    return kind, name, resolveMaterial(record.get("primary")), resolveMaterial(record.get("catalyst")), count
+
+
+def parseRows(path, parse, format=None):
+    """Yields every row of a file parsed by parse, naming the file and line of a bad row."""
+    for lineNumber, record in readRecords(path, format):
+        try:
+            yield parse(record)
+        except ValueError as error:
+            raise ValueError(f"{path}:{lineNumber}: {error}") from None
+
+
+def ingestDeliveries(workshop, path, batchSize=4096, format=None):
+    """
+    Adds the materials of a delivery file to a workshop and returns the units added.
+
+    Rows are read batchSize at a time and the quantities of each material in a batch
+    are totalled, so addMaterial is called once per material and batch.
+    """
+    total = 0
+    for batch in batched(parseRows(path, parseDelivery, format), batchSize):
+        quantities = {}
+        for materialName, quantity in batch:
+            quantities[materialName] = quantities.get(materialName, 0) + quantity
+        for materialName, quantity in quantities.items():
+            workshop.addMaterial(materialName, quantity)
+            total += quantity
+    return total
+
+
+def craftGroup(crafter, blueprints, counts, materials, report):
+    """
+    Crafts a table of blueprints with one craftMany call and returns how many items
+    were crafted. When the stock cannot cover them all, they are crafted one at a time
+    and those that cannot be crafted are counted in report["failed"].
+    """
+    try:
+        return len(crafter.craftMany(blueprints, counts, materials))
+    except ValueError:
+        crafted = 0
+        for name, count in counts.items():
+            primaryMaterial, catalystMaterial = blueprints[name]
+            for _ in range(count):
+                try:
+                    crafter.craft(name, primaryMaterial, catalystMaterial, materials)
+                except ValueError:
+                    report["failed"] += 1
+                else:
+                    crafted += 1
+        return crafted
+
+
+def ingestBlueprints(workshop, path, batchSize=4096, format=None):
+    """
+    Crafts the items ordered by a blueprint file into a workshop.
+
+    Rows are read batchSize at a time. The rows of a batch are grouped by blueprint and
+    crafted with one craftMany call per crafter, which reserves the materials of the
+    whole batch at once. Rows whose materials cannot make the item are skipped before
+    anything is crafted. Returns the number of "weapons" and "enchantments" crafted, of
+    items that "failed" for want of materials and of "invalid" rows skipped.
+    """
+    crafters = {"weapon": Forge(workshop), "enchantment": Enchanter(workshop)}
+    report = {"weapons": 0, "enchantments": 0, "failed": 0, "invalid": 0}
+    for batch in batched(parseRows(path, parseBlueprint, format), batchSize):
+        for kind, crafter in crafters.items():
+            # Rows are grouped into blueprint tables by name. A name seen again with
+            # other materials starts a new table, so no row is crafted with the wrong ones.
+            groups = []
+            valid = {}
+            for rowKind, name, primaryMaterial, catalystMaterial, count in batch:
+                if rowKind != kind:
+                    continue
+                blueprint = (name, primaryMaterial, catalystMaterial)
+                if blueprint not in valid:
+                    try:
+                        crafter.checkBlueprint(*blueprint)
+                    except ValueError:
+                        valid[blueprint] = False
+                    else:
+                        valid[blueprint] = True
+                if not valid[blueprint]:
+                    report["invalid"] += 1
+                    continue
+                for blueprints, counts in groups:
+                    if blueprints.get(name, (primaryMaterial, catalystMaterial)) == (
+                            primaryMaterial, catalystMaterial):
+                        break
+                else:
+                    blueprints, counts = {}, {}
+                    groups.append((blueprints, counts))
+                blueprints[name] = (primaryMaterial, catalystMaterial)
+                counts[name] = counts.get(name, 0) + count
+            for blueprints, counts in groups:
+                report[kind + "s"] += craftGroup(crafter, blueprints, counts, workshop.materials, report)
+    return report
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit("Run with: python phahy039_ingest.py deliveries.csv orders.jsonl")
+    workshop = Workshop(Forge(), Enchanter())
+    start = time.perf_counter()
+    units = ingestDeliveries(workshop, sys.argv[1])
+    report = ingestBlueprints(workshop, sys.argv[2])
+    elapsed = time.perf_counter() - start
+    print(f"{units} material units delivered, {report['weapons']} weapons and {report['enchantments']} "
+          f"enchantments crafted, {report['failed']} failed and {report['invalid']} invalid rows "
+          f"skipped in {elapsed:.3f} s")
+    print(workshop.displayMaterials(), end="")
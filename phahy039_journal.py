@@ -0,0 +1,591 @@
+# File: phahy039_journal.py
+# Description: an append-only write-ahead log of a workshop's changes, with group commit,
+# periodic checkpoints and replay to rebuild the workshop after a crash.
+# Author: Huyen Thi Thu Pham
+
+
+import marshal
+import os
+import struct
+import threading
+import zlib
+from itertools import compress, count, islice, repeat
+from operator import attrgetter, is_
+
+from phahy039_main import Enchantment, Weapon, Workshop, WorkshopObserver
+from phahy039_snapshot import materialClasses
+
+
+MAGIC = "PHWJ"
+VERSION = 2
+# Every frame is its payload length and CRC-32, then the marshalled list of records.
+FRAME = struct.Struct("<II")
+
+# The record kinds, the first field of every record.
+HEADER = 0               # (HEADER, magic, version, generation)
+MATERIAL = 1             # (MATERIAL, materialName, quantity or None once removed)
+WEAPON_ADDED = 2         # (WEAPON_ADDED, weaponId, name, primaryId, catalystId, damage, enchanted,
+                         #  enchantmentId, enchantmentName)
+WEAPON_CHANGED = 3       # Same fields as WEAPON_ADDED.
+WEAPON_REMOVED = 4       # (WEAPON_REMOVED, weaponId)
+ENCHANTMENT_ADDED = 5    # (ENCHANTMENT_ADDED, enchantmentId, name, primaryId, catalystId, effect,
+                         #  magicDamage, stored)
+ENCHANTMENT_REMOVED = 6  # (ENCHANTMENT_REMOVED, enchantmentId)
+MATERIAL_TYPE = 7        # (MATERIAL_TYPE, materialId, className, stats)
+WEAPONS = 8              # (WEAPONS, weaponIds, names, primaryIds, catalystIds, damages, enchanteds,
+                         #  enchantmentIds, enchantmentNames), the fields of many weapons as columns.
+                         #  enchantmentNames only has an entry for each enchanted weapon.
+ENCHANTMENTS = 9         # (ENCHANTMENTS, enchantmentIds, names, primaryIds, catalystIds, effects,
+                         #  magicDamages, stored), the fields of many enchantments as columns.
+
+# Read a column of the state of plain weapons and enchantments without a method call
+# each, the usual case of a commit.
+weaponColumns = tuple(map(attrgetter, ("_Weapon__name", "_Weapon__primaryMaterial", "_Weapon__catalystMaterial",
+                                       "_Weapon__damage", "_Weapon__enchanted", "_Weapon__enchantment")))
+enchantmentColumns = tuple(map(attrgetter, ("_Enchantment__name", "_Enchantment__primaryMaterial",
+                                            "_Enchantment__catalystMaterial", "_Enchantment__effect",
+                                            "_Enchantment__magicDamage")))
+
+
+def writeFrame(file, records):
+    """Writes a list of records to a file as one frame and returns its size."""
+    payload = marshal.dumps(records)
+    file.write(FRAME.pack(len(payload), zlib.crc32(payload)))
+    file.write(payload)
+    return FRAME.size + len(payload)
+
+
+def readFrames(path):
+    """
+    Yields the record lists of the frames of a file. Reading stops at the first frame
+    that is truncated or fails its checksum, as a crash can leave the last one torn.
+    """
+    try:
+        file = open(path, "rb")
+    except FileNotFoundError:
+        return
+    with file:
+        while True:
+            header = file.read(FRAME.size)
+            if len(header) < FRAME.size:
+                return
+            length, checksum = FRAME.unpack(header)
+            payload = file.read(length)
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                return
+            try:
+                yield marshal.loads(payload)
+            except (EOFError, ValueError, TypeError):
+                return
+
+
+def readLog(path):
+    """Returns the generation and records of a log or checkpoint file, or (None, []) if it has none."""
+    frames = readFrames(path)
+    first = next(frames, None)
+    if not first or first[0][0] != HEADER or first[0][1] != MAGIC:
+        return None, []
+    # Version 1 logs only lack the column records, so they replay the same way.
+    if first[0][2] not in (1, VERSION):
+        raise ValueError(f"Unsupported journal version: {first[0][2]}.")
+    records = first[1:]
+    for frame in frames:
+        records.extend(frame)
+    return first[0][3], records
+
+
+def syncDirectory(path):
+    """Makes a rename in the directory of path durable, where the platform allows it."""
+    try:
+        descriptor = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+class Journal(WorkshopObserver):
+    """
+    A write-ahead log of every change to a workshop.
+
+    The journal observes the workshop, so weapons and enchantments added, removed,
+    crafted, disassembled or enchanted by Forge and Enchanter are logged without
+    changing them. While no checkpoint is due, the observer methods for added, changed
+    and enchanted items are the append method of a list of marks, so telling the
+    journal about a change runs no Python code at all. Records are built from the
+    items' state and written when a group is committed, so a weapon changed many times
+    between two commits is written once, and weapons and enchantments are written as
+    columns read from their slots rather than one record each. The materials ledger is
+    small, so instead of logging each update it is compared with the last committed
+    ledger on commit. Materials are written once to a material type table and records
+    only hold their ids.
+
+    Groups are committed, with a single write and fsync, by a background flusher thread
+    every syncInterval seconds, so changes reach the log even when the workshop goes
+    idle. Materials added or removed through the workshop and removed items are
+    counted, and wake the flusher as soon as groupSize of them were observed. The
+    threads changing the workshop never wait for a write, and an error the flusher
+    meets is raised by the next commit. After checkpointEvery committed records the
+    whole state is written to a checkpoint and the log is started again, so replay only
+    reads the checkpoint and a short log. Both files carry a generation number, so a
+    crash between writing a checkpoint and starting the new log never replays the old
+    log twice. Checkpoints are only written by the threads changing the workshop, as
+    they read the whole inventory: once one is due the observer methods go back to the
+    ones of the class, which write it on the next change.
+
+    Attributes
+    ----------
+        workshop (Workshop): The journaled workshop.
+        path (str): The log file, the checkpoint is path + ".checkpoint".
+        __file: The open log file.
+        __weaponMarks (list): The weapons added, changed or enchanted since the last commit.
+        __enchantmentMarks (list): The enchantments added since the last commit.
+        __removedWeapons (dict), __removedEnchantments (dict): The items removed since the last commit.
+        __removedIds (dict): The kind of removal of each item removed since the last commit.
+        __ids (count): The journal ids given to logged items.
+        __weaponIds (dict), __enchantmentIds (dict): The journal id of each logged item.
+        __materialIds (dict): The journal id of each material written this generation.
+        __committedMaterials (dict): The materials ledger as last committed.
+        __generation (int): The generation of the current checkpoint and log.
+        __lock (threading.RLock): Serialises committing and checkpointing.
+        __wakeup (threading.Event): Set when a group is full or the journal is closed.
+        __stopped (bool): Whether the journal is closed, to stop the flusher.
+        __flusher (threading.Thread): Commits every syncInterval seconds.
+        __error (Exception): The error met by the flusher, raised by the next commit.
+
+    Methods
+    -------
+        commit(self):
+            Write and fsync the changes since the last commit.
+        checkpoint(self):
+            Write the whole state to a new checkpoint and start a new log.
+        close(self):
+            Commit, stop observing the workshop and close the log.
+        recover(cls, path, forge, enchanter, armoury):
+            Rebuild a workshop from its checkpoint and log and journal it again.
+    """
+    def __init__(self, path, workshop, groupSize=4096, syncInterval=0.05, checkpointEvery=1_000_000,
+                 sync=True, generation=0):
+        self.workshop = workshop
+        self.path = path
+        self.__groupSize = groupSize
+        self.__syncInterval = syncInterval
+        self.__checkpointEvery = checkpointEvery
+        self.__sync = sync
+        self.__file = None
+        self.__weaponMarks = []
+        self.__enchantmentMarks = []
+        self.__removedWeapons = {}
+        self.__removedEnchantments = {}
+        self.__removedIds = {}
+        self.__changes = 0
+        self.__ids = count(1)
+        self.__weaponIds = {}
+        # Weapons without an enchantment refer to the id 0.
+        self.__enchantmentIds = {None: 0}
+        self.__materialIds = {}
+        self.__committedMaterials = {}
+        self.__recordsSinceCheckpoint = 0
+        self.__checkpointDue = False
+        self.__generation = generation
+        self.__lock = threading.RLock()
+        self.__wakeup = threading.Event()
+        self.__stopped = False
+        self.__error = None
+        self.__useHooks(False)
+        workshop.addObserver(self)
+        # Start from a checkpoint of the current state, so earlier changes are kept.
+        self.checkpoint()
+        self.__flusher = threading.Thread(target=self.__flushEvery, name="journal-flusher", daemon=True)
+        self.__flusher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # The observer methods for added, changed and enchanted items only mark the item.
+    # While no checkpoint is due they are replaced on the instance by list.append, which
+    # is atomic, so marking needs no lock even when many threads craft at once. commit
+    # takes the marks before reading the items, so a change made while committing is
+    # either written now or marked again. The methods of the class mark the item and
+    # write the due checkpoint.
+    def __useHooks(self, checkpointDue):
+        if checkpointDue:
+            for name in ("weaponAdded", "weaponChanged", "weaponEnchanted", "enchantmentAdded"):
+                self.__dict__.pop(name, None)
+        else:
+            # The weapon is given its id when it is first committed, and an enchantment is
+            # logged as any other change.
+            self.weaponAdded = self.weaponChanged = self.weaponEnchanted = self.__weaponMarks.append
+            self.enchantmentAdded = self.__enchantmentMarks.append
+
+    def weaponAdded(self, weapon):
+        self.__weaponMarks.append(weapon)
+        self.commit()
+
+    weaponChanged = weaponEnchanted = weaponAdded
+
+    def enchantmentAdded(self, enchantment):
+        self.__enchantmentMarks.append(enchantment)
+        self.commit()
+
+    def materialChanged(self, materialName, delta):
+        # The ledger is compared on commit, so only the change is counted.
+        self.__changes += 1
+        if self.__changes == self.__groupSize:
+            self.__groupFull()
+
+    # Removals are rare and hold the lock, so a removal cannot miss the id a commit gives.
+    # The marks of a removed item are dropped on commit unless it was stored again.
+    def weaponRemoved(self, weapon):
+        with self.__lock:
+            self.__removedWeapons[weapon] = None
+            weaponId = self.__weaponIds.pop(weapon, None)
+            if weaponId is not None:
+                self.__removedIds[weaponId] = WEAPON_REMOVED
+            self.__changes += 1
+            if self.__changes == self.__groupSize:
+                self.__groupFull()
+
+    def enchantmentRemoved(self, enchantment):
+        with self.__lock:
+            self.__removedEnchantments[enchantment] = None
+            enchantmentId = self.__enchantmentIds.pop(enchantment, None)
+            if enchantmentId is not None:
+                self.__removedIds[enchantmentId] = ENCHANTMENT_REMOVED
+            self.__changes += 1
+            if self.__changes == self.__groupSize:
+                self.__groupFull()
+
+    def __groupFull(self):
+        # A checkpoint reads the whole inventory, so it is written by the thread changing it.
+        if self.__checkpointDue:
+            self.commit()
+        else:
+            self.__wakeup.set()
+
+    def __flushEvery(self):
+        """Commits every syncInterval seconds, or once a group is full, until the journal is closed."""
+        while True:
+            self.__wakeup.wait(self.__syncInterval)
+            self.__wakeup.clear()
+            if self.__stopped:
+                return
+            try:
+                self.__commit(False)
+            except Exception as error:
+                self.__error = error
+                return
+
+    def __materialId(self, records, material):
+        materialId = self.__materialIds.get(material)
+        if materialId is None:
+            # Materials are interned, so the instance itself identifies its class and stats.
+            materialId = self.__materialIds[material] = len(self.__materialIds)
+            records.append((MATERIAL_TYPE, materialId, material.__class__.__name__, material.getStats()))
+        return materialId
+
+    def __materialIdsOf(self, records, materials):
+        """Returns the ids of a column of materials, writing the material types not written yet."""
+        materialIds = list(map(self.__materialIds.get, materials))
+        if None in materialIds:
+            for material in dict.fromkeys(compress(materials, map(is_, materialIds, repeat(None)))):
+                self.__materialId(records, material)
+            materialIds = list(map(self.__materialIds.__getitem__, materials))
+        return materialIds
+
+    def __idsOf(self, items, itemIds):
+        """Returns the ids of distinct items, giving the next journal ids to the ones without one."""
+        ids = list(map(itemIds.get, items))
+        if None in ids:
+            newItems = list(compress(items, map(is_, ids, repeat(None))))
+            itemIds.update(zip(newItems, islice(self.__ids, len(newItems))))
+            ids = list(map(itemIds.__getitem__, items))
+        return ids
+
+    def __writeEnchantment(self, records, enchantmentId, enchantment, stored):
+        records.append((ENCHANTMENT_ADDED, enchantmentId, enchantment.name,
+                        self.__materialId(records, enchantment.getPrimaryMaterial()),
+                        self.__materialId(records, enchantment.getCatalystMaterial()),
+                        enchantment.getEffect(), enchantment.getMagicDamage(), stored))
+
+    def __writeEnchantments(self, records, enchantments, stored):
+        """Writes the latest state of distinct enchantments, as columns unless one is a subclass."""
+        if not enchantments:
+            return
+        enchantmentIds = self.__idsOf(enchantments, self.__enchantmentIds)
+        if set(map(type, enchantments)) != {Enchantment}:
+            for enchantmentId, enchantment in zip(enchantmentIds, enchantments):
+                self.__writeEnchantment(records, enchantmentId, enchantment, stored)
+            return
+        names, primaries, catalysts, effects, magicDamages = [list(map(column, enchantments))
+                                                              for column in enchantmentColumns]
+        records.append((ENCHANTMENTS, enchantmentIds, names, self.__materialIdsOf(records, primaries),
+                        self.__materialIdsOf(records, catalysts), effects, magicDamages, stored))
+
+    def __writeWeapon(self, records, kind, weaponId, weapon):
+        materialIds = self.__materialIds
+        enchantment = weapon.getEnchantment()
+        enchantmentId = self.__enchantmentIds.get(enchantment)
+        if enchantmentId is None:
+            # The enchantment is not stored in the workshop, so it is logged with the weapon.
+            enchantmentId = self.__enchantmentIds[enchantment] = next(self.__ids)
+            self.__writeEnchantment(records, enchantmentId, enchantment, False)
+        primaryMaterial = weapon.getPrimaryMaterial()
+        primaryId = materialIds.get(primaryMaterial)
+        if primaryId is None:
+            primaryId = self.__materialId(records, primaryMaterial)
+        catalystMaterial = weapon.getCatalystMaterial()
+        catalystId = materialIds.get(catalystMaterial)
+        if catalystId is None:
+            catalystId = self.__materialId(records, catalystMaterial)
+        enchanted = weapon.isEnchanted()
+        # Only enchanted weapons have an enchantment name, and a failed getattr is slow.
+        enchantmentName = getattr(weapon, "enchantmentName", None) if enchanted else None
+        records.append((kind, weaponId, weapon.getName(), primaryId, catalystId, weapon.getDamage(),
+                        enchanted, enchantmentId, enchantmentName))
+
+    def __writeWeapons(self, records, weapons):
+        """Writes the latest state of distinct weapons, as columns unless one is a view or subclass."""
+        if not weapons:
+            return
+        if set(map(type, weapons)) != {Weapon}:
+            for weapon in weapons:
+                weaponId = self.__weaponIds.get(weapon)
+                if weaponId is None:
+                    weaponId = self.__weaponIds[weapon] = next(self.__ids)
+                    self.__writeWeapon(records, WEAPON_ADDED, weaponId, weapon)
+                else:
+                    self.__writeWeapon(records, WEAPON_CHANGED, weaponId, weapon)
+            return
+        # This runs for every weapon committed, so every column is built without a method call each.
+        weaponIds = self.__idsOf(weapons, self.__weaponIds)
+        names, primaries, catalysts, damages, enchanteds, enchantments = [list(map(column, weapons))
+                                                                          for column in weaponColumns]
+        enchantmentIds = list(map(self.__enchantmentIds.get, enchantments))
+        if None in enchantmentIds:
+            # The enchantments not stored in the workshop are logged with their weapons.
+            carried = dict.fromkeys(compress(enchantments, map(is_, enchantmentIds, repeat(None))))
+            self.__writeEnchantments(records, list(carried), False)
+            enchantmentIds = list(map(self.__enchantmentIds.get, enchantments))
+        # Only enchanted weapons have an enchantment name, and a failed getattr is slow.
+        enchantmentNames = list(map(getattr, compress(weapons, enchanteds), repeat("enchantmentName"), repeat(None)))
+        records.append((WEAPONS, weaponIds, names, self.__materialIdsOf(records, primaries),
+                        self.__materialIdsOf(records, catalysts), damages, enchanteds, enchantmentIds,
+                        enchantmentNames))
+
+    def __writeMaterials(self, records):
+        materials = dict(self.workshop.materials)
+        records += [(MATERIAL, name, quantity) for name, quantity in materials.items()
+                    if self.__committedMaterials.get(name) != quantity]
+        records += [(MATERIAL, name, None) for name in self.__committedMaterials if name not in materials]
+        self.__committedMaterials = materials
+
+    @staticmethod
+    def popMarked(marks):
+        """Returns the keys of a dict of marks and their values, removing each one."""
+        # list() of a dict runs without releasing the GIL, so it sees a consistent dict.
+        keys = list(marks)
+        return keys, list(map(marks.pop, keys))
+
+    @staticmethod
+    def takeMarked(marks, removed, stored):
+        """
+        Returns the distinct items of a list of marks and removes them from it. The items
+        removed since the last commit are left out unless they are stored again.
+        """
+        # Marks appended while taking them stay in the list, after the ones taken.
+        items = marks[:]
+        del marks[:len(items)]
+        items = dict.fromkeys(items)
+        for item in Journal.popMarked(removed)[0]:
+            if item in items and item not in stored:
+                del items[item]
+        return list(items)
+
+    def commit(self):
+        """Writes the changes since the last commit as one frame and fsyncs the log."""
+        self.__commit(True)
+
+    def __commit(self, checkpointing):
+        with self.__lock:
+            if self.__error is not None:
+                error, self.__error = self.__error, None
+                raise error
+            self.__changes = 0
+            records = []
+            self.__writeMaterials(records)
+            # Enchantments come first, as the latest state of a weapon may refer to any of them.
+            self.__writeEnchantments(records, self.takeMarked(self.__enchantmentMarks, self.__removedEnchantments,
+                                                              self.workshop.enchantments), True)
+            # Weapons are written once per commit with their latest state.
+            self.__writeWeapons(records, self.takeMarked(self.__weaponMarks, self.__removedWeapons,
+                                                         self.workshop.weapons))
+            records += zip(*reversed(self.popMarked(self.__removedIds)))
+            if records:
+                writeFrame(self.__file, records)
+                self.__file.flush()
+                if self.__sync:
+                    os.fsync(self.__file.fileno())
+                self.__recordsSinceCheckpoint += len(records)
+                self.__checkpointDue = self.__recordsSinceCheckpoint >= self.__checkpointEvery
+            # The flusher leaves a due checkpoint to the threads changing the workshop.
+            if checkpointing and self.__checkpointDue:
+                self.checkpoint()
+            elif self.__checkpointDue:
+                self.__useHooks(True)
+
+    def checkpoint(self):
+        """
+        Writes the whole state of the workshop to a new checkpoint, replacing the old one
+        atomically, then starts a new empty log.
+        """
+        with self.__lock:
+            # The checkpoint holds the latest state, so the marked changes are in it.
+            for marks in (self.__weaponMarks, self.__enchantmentMarks, self.__removedWeapons,
+                          self.__removedEnchantments, self.__removedIds):
+                marks.clear()
+            self.__changes = 0
+            self.__generation += 1
+            self.__committedMaterials = {}
+            self.__materialIds = {}
+            records = [(HEADER, MAGIC, VERSION, self.__generation)]
+            self.__writeMaterials(records)
+            # Stored enchantments keep their ids, the ones only carried by weapons are
+            # written again with their weapons.
+            enchantments = list(self.workshop.enchantments)
+            enchantmentIds = self.__enchantmentIds
+            self.__enchantmentIds = dict(zip(enchantments, map(enchantmentIds.get, enchantments)))
+            self.__enchantmentIds[None] = 0
+            self.__writeEnchantments(records, enchantments, True)
+            self.__writeWeapons(records, list(self.workshop.weapons))
+
+            checkpointPath = self.path + ".checkpoint"
+            with open(checkpointPath + ".tmp", "wb") as file:
+                # Frames of a bounded size keep the memory used by marshal in check.
+                for start in range(0, len(records), 65536):
+                    writeFrame(file, records[start:start + 65536])
+                file.flush()
+                if self.__sync:
+                    os.fsync(file.fileno())
+            os.replace(checkpointPath + ".tmp", checkpointPath)
+
+            if self.__file is not None:
+                self.__file.close()
+            self.__file = open(self.path, "wb")
+            writeFrame(self.__file, [(HEADER, MAGIC, VERSION, self.__generation)])
+            self.__file.flush()
+            if self.__sync:
+                os.fsync(self.__file.fileno())
+                syncDirectory(self.path)
+            self.__recordsSinceCheckpoint = 0
+            self.__checkpointDue = False
+            self.__useHooks(False)
+
+    def close(self):
+        """Commits the queued changes, stops observing the workshop and closes the log."""
+        self.__stopped = True
+        self.__wakeup.set()
+        self.__flusher.join()
+        with self.__lock:
+            if self.__file is not None:
+                self.__commit(False)
+                self.__file.close()
+                self.__file = None
+                self.workshop.removeObserver(self)
+
+    @classmethod
+    def recover(cls, path, forge=None, enchanter=None, armoury=None, **options):
+        """
+        Rebuilds a workshop from the checkpoint and log at path and returns a new journal
+        of it. The recovered state is checkpointed before the journal is returned.
+        """
+        workshop, generation = replay(path, forge, enchanter, armoury)
+        return cls(path, workshop, generation=generation, **options)
+
+
+def replay(path, forge=None, enchanter=None, armoury=None):
+    """
+    Rebuilds a workshop from the checkpoint and log at path and returns it with the
+    generation of its checkpoint. The log is only applied when it belongs to the same
+    generation as the checkpoint, and it is applied up to its last complete frame.
+    """
+    workshop = Workshop(forge, enchanter, armoury)
+    generation, records = readLog(path + ".checkpoint")
+    if generation is None:
+        generation = 0
+    else:
+        logGeneration, logRecords = readLog(path)
+        if logGeneration == generation:
+            records += logRecords
+
+    classes = materialClasses()
+    materials = {}
+    weapons = {}
+    enchantments = {}
+
+    def restoreWeapon(weaponId, name, primaryId, catalystId, damage, enchanted, enchantmentId, enchantmentName):
+        weapon = weapons.get(weaponId)
+        if weapon is None:
+            weapon = Weapon(name, materials[primaryId], materials[catalystId])
+        else:
+            weapon.setName(name)
+        if enchantmentId:
+            weapon.setEnchantment(enchantments[enchantmentId])
+        weapon.setEnchanted(enchanted)
+        # setDamage only takes floats, but a calculated damage may be an int, as a Bow's 20.
+        weapon._Weapon__damage = damage
+        if enchantmentName is not None:
+            weapon.enchantmentName = enchantmentName
+        if weaponId not in weapons:
+            weapons[weaponId] = workshop.addWeapon(weapon)
+
+    def restoreEnchantment(enchantmentId, name, primaryId, catalystId, effect, magicDamage, stored):
+        enchantment = enchantments.get(enchantmentId)
+        if enchantment is None:
+            enchantment = Enchantment(name, materials[primaryId], materials[catalystId], effect)
+            enchantments[enchantmentId] = enchantment
+        enchantment.setMagicDamage(magicDamage)
+        if stored:
+            workshop.addEnchantment(enchantment)
+
+    for record in records:
+        kind = record[0]
+        if kind == MATERIAL_TYPE:
+            _, materialId, name, stats = record
+            if name not in classes:
+                raise ValueError(f"Unknown material in journal: {name}.")
+            materials[materialId] = classes[name](*stats)
+        elif kind == MATERIAL:
+            if record[2] is None:
+                workshop.materials.pop(record[1], None)
+            else:
+                workshop.materials[record[1]] = record[2]
+        elif kind == WEAPONS:
+            *columns, enchanteds, enchantmentIds, enchantmentNames = record[1:]
+            enchantmentNames = iter(enchantmentNames)
+            for *fields, enchanted, enchantmentId in zip(*columns, enchanteds, enchantmentIds):
+                restoreWeapon(*fields, enchanted, enchantmentId, next(enchantmentNames) if enchanted else None)
+        elif kind == ENCHANTMENTS:
+            *columns, stored = record[1:]
+            for fields in zip(*columns):
+                restoreEnchantment(*fields, stored)
+        elif kind == WEAPON_ADDED or kind == WEAPON_CHANGED:
+            restoreWeapon(*record[1:])
+        elif kind == WEAPON_REMOVED:
+            weapon = weapons.pop(record[1], None)
+            if weapon is not None:
+                workshop.removeWeapon(weapon)
+        elif kind == ENCHANTMENT_ADDED:
+            restoreEnchantment(*record[1:])
+        elif kind == ENCHANTMENT_REMOVED:
+            enchantment = enchantments.get(record[1])
+            if enchantment is not None:
+                workshop.removeEnchantment(enchantment)
+    return workshop, generation
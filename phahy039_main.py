@@ -9,92 +9,390 @@
 
 
 
-from abc import ABC, abstractmethod
+import math
+import sys
+import threading
+import weakref
+from abc import ABC, ABCMeta, abstractmethod
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections.abc import Mapping, MutableMapping
+from contextlib import contextmanager
+from itertools import compress, islice
 
 
 
-class Material(ABC):
+class MaterialType(ABCMeta):
+    """
+    Metaclass of the materials that interns every material instance.
+
+    Materials with the same class and stats share one immutable instance, so crafting
+    the same blueprint many times does not allocate new materials and two materials
+    can be compared by identity. Every material class is also numbered, so material
+    stores can keep their quantities in an array indexed by materialId.
+    """
+    # The interned materials, keyed by class and stats.
+    registry = {}
+    # The interned materials, keyed by class and the arguments they were called with.
+    callCache = {}
+    # The dense integer id of every material class name, and the name of every id.
+    materialIds = {}
+    materialNames = []
+    idsLock = threading.Lock()
+
+    def __init__(cls, name, bases, namespace, **kwargs):
+        super().__init__(name, bases, namespace, **kwargs)
+        # Every material class is given an id as it is defined, its index in a MaterialLedger.
+        cls.materialId = MaterialType.idOf(name)
+
+    @staticmethod
+    def idOf(materialName):
+        """Returns the id of a material name, giving a name seen for the first time the next id."""
+        materialId = MaterialType.materialIds.get(materialName)
+        if materialId is None:
+            with MaterialType.idsLock:
+                materialId = MaterialType.materialIds.get(materialName)
+                if materialId is None:
+                    materialId = len(MaterialType.materialNames)
+                    MaterialType.materialNames.append(materialName)
+                    MaterialType.materialIds[materialName] = materialId
+        return materialId
+
+    def __call__(cls, *args, **kwargs):
+        callKey = (cls, args, tuple(sorted(kwargs.items())))
+        material = MaterialType.callCache.get(callKey)
+        if material is None:
+            material = super().__call__(*args, **kwargs)
+            statsKey = (cls, material.getStats())
+            if statsKey not in MaterialType.registry:
+                # New stats are being registered, so the memoized damages are rebuilt.
+                MaterialType.registry[statsKey] = material
+                clearDamageTables()
+            material = MaterialType.registry[statsKey]
+            MaterialType.callCache[callKey] = material
+        return material
+
+
+class Material(ABC, metaclass=MaterialType):
+    __slots__ = ("strength",)
+
     def __init__(self, strength):
-        self.strength = strength
+        object.__setattr__(self, "strength", strength)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Materials are immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError("Materials are immutable.")
+
+    def getStats(self):
+        """Returns the stats of the material in the order its class takes them."""
+        return (self.strength,)
+
+    def __reduce__(self):
+        # Unpickling goes through the metaclass so the copy is interned as well.
+        return self.__class__, self.getStats()
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
 
 class Wood(Material):
+    __slots__ = ()
+
     def __init__(self, strength):
         super().__init__(strength)
 
 
 class Metal(Material):
+    __slots__ = ("purity",)
+
     def __init__(self, strength, purity):
         super().__init__(strength)
-        self.purity = purity
+        object.__setattr__(self, "purity", purity)
+
+    def getStats(self):
+        return (self.strength, self.purity)
 
 
 class Gemstone(Material):
+    __slots__ = ("magicPower",)
+
     def __init__(self, strength, magicPower):
         super().__init__(strength)
-        self.magicPower = magicPower
+        object.__setattr__(self, "magicPower", magicPower)
+
+    def getStats(self):
+        return (self.strength, self.magicPower)
 
 
 class Maple(Wood):
+    __slots__ = ()
+
     def __init__(self, strength=5):
         super().__init__(strength)
 
 
 class Ash(Wood):
+    __slots__ = ()
+
     def __init__(self, strength=3):
         super().__init__(strength)
 
 
 class Oak(Wood):
+    __slots__ = ()
+
     def __init__(self, strength=4):
         super().__init__(strength)
 
 
 class Bronze(Metal):
+    __slots__ = ()
+
     def __init__(self, strength=3, purity=1.3):
         super().__init__(strength, purity)
 
 
 class Iron(Metal):
+    __slots__ = ()
+
     def __init__(self, strength=6, purity=1.1):
         super().__init__(strength, purity)
 
 
 class Steel(Metal):
+    __slots__ = ()
+
     def __init__(self, strength=10, purity=1.8):
         super().__init__(strength, purity)
 
 
 class Ruby(Gemstone):
+    __slots__ = ()
+
     def __init__(self, strength=1, magicPower=1.8):
         super().__init__(strength, magicPower)
 
 
 class Sapphire(Gemstone):
+    __slots__ = ()
+
     def __init__(self, strength=1.2, magicPower=1.6):
         super().__init__(strength, magicPower)
 
 
 class Emerald(Gemstone):
+    __slots__ = ()
+
     def __init__(self, strength=1.6, magicPower=1.1):
         super().__init__(strength, magicPower)
 
 
 class Diamond(Gemstone):
+    __slots__ = ()
+
     def __init__(self, strength=2.1, magicPower=2.2):
         super().__init__(strength, magicPower)
 
 
 class Amethyst(Gemstone):
+    __slots__ = ()
+
     def __init__(self, strength=1.8, magicPower=3.2):
         super().__init__(strength, magicPower)
 
 
 class Onyx(Gemstone):
+    __slots__ = ()
+
     def __init__(self, strength=0.1, magicPower=4.6):
         super().__init__(strength, magicPower)
 
 
+class Registry:
+    """
+    An insertion ordered collection of workshop items with O(1) add, remove and lookup.
+
+    Every item is given a stable id when it is added, which can be used to look the item
+    up again. It supports the list operations the workshop relies on (append, remove,
+    in, len, iteration, indexing and slicing), so it can stand in for the weapons and
+    enchantments lists. An item already stored is not added a second time.
+
+    Positional access goes through a list of the items kept alongside the dict. Adding
+    an item, or removing the first or last one, keeps the list up to date, so indexing
+    is O(1). Removing any other item drops the list, and the next positional access
+    rebuilds it in O(n).
+
+    Attributes
+    ----------
+        __items (dict): The items keyed by item id, in insertion order.
+        __ids (dict): The item ids keyed by the identity of their item.
+        __nextId (int): The id given to the next item added.
+        __positions (list): The items in order from __start on, or None once stale.
+        __start (int): The position in __positions of the first item.
+
+    Methods
+    -------
+        add(self, item):
+            Add an item and return its id.
+        remove(self, item):
+            Remove an item, raising ValueError if it is not stored.
+        discard(self, item):
+            Remove an item if it is stored.
+        removeMany(self, items):
+            Remove every stored item of an iterable.
+        get(self, itemId):
+            Return the item with the given id.
+        getId(self, item):
+            Return the id of a stored item.
+    """
+    def __init__(self, items=()):
+        self.__items = {}
+        self.__ids = {}
+        self.__nextId = 0
+        self.__positions = []
+        self.__start = 0
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __contains__(self, item):
+        return id(item) in self.__ids
+
+    def __iter__(self):
+        return iter(self.__items.values())
+
+    def __getitem__(self, index):
+        positions = self.__positions
+        if positions is None:
+            positions = self.__positions = list(self.__items.values())
+            self.__start = 0
+        if isinstance(index, slice):
+            return positions[self.__start:][index]
+        if index < 0:
+            index += len(self.__items)
+        if not 0 <= index < len(self.__items):
+            raise IndexError("Registry index out of range.")
+        return positions[self.__start + index]
+
+    def __repr__(self):
+        return f"Registry({list(self.__items.values())!r})"
+
+    def add(self, item):
+        """Adds an item, keeping its id if it is already stored, and returns its id."""
+        itemId = self.__ids.get(id(item))
+        if itemId is None:
+            itemId = self.__nextId
+            self.__nextId += 1
+            self.__items[itemId] = item
+            self.__ids[id(item)] = itemId
+            if self.__positions is not None:
+                self.__positions.append(item)
+        return itemId
+
+    def append(self, item):
+        """Adds an item like list.append and returns the stored item."""
+        self.add(item)
+        return item
+
+    def __forget(self, item):
+        # The first and last items are dropped from the positions in O(1), the list is
+        # compacted once half of it is dropped items.
+        positions = self.__positions
+        if positions is None:
+            return
+        if len(positions) > self.__start and positions[self.__start] is item:
+            self.__start += 1
+            if self.__start * 2 >= len(positions):
+                del positions[:self.__start]
+                self.__start = 0
+        elif len(positions) > self.__start and positions[-1] is item:
+            positions.pop()
+        else:
+            self.__positions = None
+
+    def remove(self, item):
+        """Removes an item, raising ValueError if it is not stored."""
+        itemId = self.__ids.pop(id(item), None)
+        if itemId is None:
+            raise ValueError("Item not found in the registry.")
+        del self.__items[itemId]
+        self.__forget(item)
+
+    def discard(self, item):
+        """Removes an item if it is stored."""
+        itemId = self.__ids.pop(id(item), None)
+        if itemId is not None:
+            del self.__items[itemId]
+            self.__forget(item)
+
+    def removeMany(self, items):
+        """Removes every stored item of an iterable and returns how many were removed."""
+        removed = 0
+        for item in items:
+            itemId = self.__ids.pop(id(item), None)
+            if itemId is not None:
+                del self.__items[itemId]
+                removed += 1
+        if removed:
+            self.__positions = None
+        return removed
+
+    def get(self, itemId):
+        """Returns the item with the given id, or None if there is none."""
+        return self.__items.get(itemId)
+
+    def getId(self, item):
+        """Returns the id of a stored item, or None if it is not stored."""
+        return self.__ids.get(id(item))
+
+
+class WorkshopObserver:
+    """
+    Base class of the objects told about every change to a workshop's inventory.
+
+    Methods
+    -------
+        weaponAdded(self, weapon):
+        weaponRemoved(self, weapon):
+        weaponChanged(self, weapon):
+            Called after a stored weapon is renamed, enchanted or has its damage set.
+        weaponEnchanted(self, weapon):
+            Called after a stored weapon is given an enchantment, by default as a change.
+        enchantmentAdded(self, enchantment):
+        enchantmentRemoved(self, enchantment):
+        materialChanged(self, materialName, delta):
+            Called after a quantity of material is added or removed through the workshop.
+            Crafters update the ledger directly and are not reported.
+    """
+    def weaponAdded(self, weapon):
+        pass
+
+    def weaponRemoved(self, weapon):
+        pass
+
+    def weaponChanged(self, weapon):
+        pass
+
+    def weaponEnchanted(self, weapon):
+        self.weaponChanged(weapon)
+
+    def enchantmentAdded(self, enchantment):
+        pass
+
+    def enchantmentRemoved(self, enchantment):
+        pass
+
+    def materialChanged(self, materialName, delta):
+        pass
+
+
 class Workshop:
     """
     A main class to store enchanter and forge for later uses.
@@ -103,9 +401,9 @@ class Workshop:
     ----------
         forge (Forge): The forge used for weapon crafting.
         enchanter (Enchanter): An instance of the Enchanter class associated with the workshop.
-        weapons (list): A list to store crafted weapons.
-        enchantments (list): A list to store crafted enchantments.
-        materials (list): A list to store available materials.
+        weapons (Registry): A registry to store crafted weapons, or an Armoury to store them in columns.
+        enchantments (Registry): A registry to store crafted enchantments.
+        materials (MaterialLedger): The quantity of every material, by material name.
 
     Methods
     -------
@@ -113,6 +411,8 @@ class Workshop:
             Add a weapon created to the workshop.
         removeWeapon(self, weapon):
             Remove a weapon from workshop.
+        removeWeapons(self, weapons):
+            Remove many weapons from workshop at once.
         addEnchantment(self, enchantment):
             Add an enchantment to the workshop.
         removeEnchantment(self, enchantment):
@@ -127,88 +427,860 @@ class Workshop:
             Display information of the enchantment in the workshop
         displayMaterials(self):
             Display quantity of material remaining in the workshop.
+        iterWeapons(self), iterEnchantments(self), iterMaterials(self):
+            Yield the lines of the matching display method one at a time.
+        writeTo(self, fileobj, report):
+            Write a report to a file object in buffered chunks.
+        enableReportCache(self):
+            Cache the weapons report and only rebuild the lines of changed weapons.
+        enableDamageIndex(self):
+            Index the weapons by enchanted damage.
+        topK(self, k), damageRange(self, low, high), damagePercentile(self, percent):
+            Query the weapons by enchanted damage through the damage index.
+        enableWeaponIndex(self):
+            Index the weapons by material, enchantment name and enchanted state.
+        findWeapons(self, primary, catalyst, enchantment, enchanted):
+            Return the weapons matching every given criterion through the weapon index.
+        addObserver(self, observer), removeObserver(self, observer):
+            Register or unregister a WorkshopObserver told about inventory changes.
+        calculateDamages(self):
+            Calculate the base and enchanted damage of every weapon in one batch.
     """
-    def __init__(self, forge, enchanter):
+    def __init__(self, forge, enchanter, armoury=None):
         self.forge = forge
         self.enchanter = enchanter
-        self.weapons = []
-        self.enchantments = []
-        self.materials = {}
+        self.weapons = Registry() if armoury is None else armoury
+        self.enchantments = Registry()
+        self.materials = MaterialLedger()
+        self.__observers = []
+        self.__reportCache = None
+        self.__damageIndex = None
+        self.__weaponIndex = None
 
     def addWeapon(self, weapon):
-        """ Adds a weapon to the workshop."""
-
-        self.weapons.append(weapon)
+        """
+        Adds a weapon to the workshop and returns the stored weapon. A weapon already
+        stored is not added again, so observers are only told about it once.
+        """
+        if weapon in self.weapons:
+            return weapon
+        # An armoury stores a copy of the weapon and returns a view of it.
+        weapon = self.weapons.append(weapon)
+        weapon.addObserver(self)
+        for observer in self.__observers:
+            observer.weaponAdded(weapon)
+        return weapon
 
     def removeWeapon(self, weapon):
         """Removes a weapon from the workshop."""
         if weapon in self.weapons:
             self.weapons.remove(weapon)
+            weapon.removeObserver(self)
+            for observer in self.__observers:
+                observer.weaponRemoved(weapon)
+
+    def removeWeapons(self, weapons):
+        """Removes many weapons from the workshop at once."""
+        weapons = [weapon for weapon in weapons if weapon in self.weapons]
+        self.weapons.removeMany(weapons)
+        for weapon in weapons:
+            weapon.removeObserver(self)
+            for observer in self.__observers:
+                observer.weaponRemoved(weapon)
 
     def addEnchantment(self, enchantment):
-        """Adds an enchantment to the workshop."""
+        """Adds an enchantment to the workshop, unless it is already stored."""
+        if enchantment in self.enchantments:
+            return
         self.enchantments.append(enchantment)
+        for observer in self.__observers:
+            observer.enchantmentAdded(enchantment)
 
     def removeEnchantment(self, enchantment):
         """Removes an enchantment from the workshop. """
         if enchantment in self.enchantments:
             self.enchantments.remove(enchantment)
+            for observer in self.__observers:
+                observer.enchantmentRemoved(enchantment)
+
+    def addObserver(self, observer):
+        """Registers a WorkshopObserver told about every change to the inventory."""
+        if observer not in self.__observers:
+            self.__observers.append(observer)
+
+    def removeObserver(self, observer):
+        """Unregisters a WorkshopObserver."""
+        if observer in self.__observers:
+            self.__observers.remove(observer)
+
+    def weaponChanged(self, weapon):
+        """Called by a stored weapon when it changes, passes the change on to the observers."""
+        for observer in self.__observers:
+            observer.weaponChanged(weapon)
+
+    def weaponEnchanted(self, weapon):
+        """Called by a stored weapon when it is enchanted, passes it on to the observers."""
+        for observer in self.__observers:
+            observer.weaponEnchanted(weapon)
 
     def addMaterial(self, material, quantity):
-        """Adds the specified quantity of the material to the workshop."""
+        """Adds the specified quantity of the material, or material name, to the workshop."""
         if isinstance(material, str):
-            materialName = material
-        else:
-            materialName = material.__class__.__name__
-
-        if materialName in self.materials:
-            self.materials[materialName] += quantity
+            materialId = MaterialType.idOf(material)
         else:
-            self.materials[materialName] = quantity
+            materialId = material.materialId
+        self.materials.addQuantity(materialId, quantity)
+        for observer in self.__observers:
+            observer.materialChanged(MaterialType.materialNames[materialId], quantity)
 
     def removeMaterial(self, material, quantity):
         """Removes a quantity of material from the workshop."""
-        material = material.__class__.__name__
-        if material in self.materials:
-            if self.materials[material] > quantity:
-                self.materials[material] -= quantity
-                if self.materials[material] == 0:
-                    del self.materials[material]
-            else:
-                raise ValueError("Insufficient quantity of material in the workshop.")
-        else:
+        materialId = material.materialId
+        available = self.materials.quantityOf(materialId, None)
+        if available is None:
             raise ValueError("Material not found in the workshop.")
+        if available > quantity:
+            self.materials.addQuantity(materialId, -quantity)
+            for observer in self.__observers:
+                observer.materialChanged(MaterialType.materialNames[materialId], -quantity)
+        else:
+            raise ValueError("Insufficient quantity of material in the workshop.")
+
+    def calculateDamages(self):
+        """Calculates the base and enchanted damage of every weapon in the workshop at once."""
+        return calculateDamages(self.weapons)
+
+    # The names the first weapons of the armoury are displayed with once enchanted.
+    enchantedWeaponNames = ["Holy Greatsword", "Molten Defender", "Berserker Axe", "Soul Eater",
+                            "Twisted Bow", "Wand of the Deep", "Venemous Battlestaff"]
+
+    def weaponLine(self, weapon, position, baseDamage, enchantedDamage):
+        """
+        Returns the line describing a weapon at a position of the armoury, or an empty
+        string when the weapon is not listed.
+
+        The first weapons are named after the enchanted weapons of the armoury, later
+        enchanted weapons use the name they were enchanted with.
+        """
+        if weapon.enchantment:
+            if position < len(self.enchantedWeaponNames):
+                weaponName = self.enchantedWeaponNames[position]
+            else:
+                weaponName = getattr(weapon, "enchantmentName", weapon.name)
+            enchantmentEffect = weapon.enchantment.useEffect()
+            return f"The {weaponName} is imbued with a {enchantmentEffect}. "\
+                   f"It deals {enchantedDamage:.2f} damage.\n"
+        elif position < len(self.enchantedWeaponNames):
+            return f"The {weapon.name} is not enchanted. It deals {baseDamage:.2f} damage.\n"
+        return ""
+
+    def iterWeapons(self, chunkSize=1024):
+        """
+        Yields the lines describing the weapons in the workshop one at a time.
+
+        The damage of the weapons is calculated a chunk at a time, so the memory used does
+        not grow with the size of the workshop.
+        """
+        weapons = iter(self.weapons)
+        position = 0
+        while True:
+            chunk = list(islice(weapons, chunkSize))
+            if not chunk:
+                return
+            baseDamages, enchantedDamages = calculateDamages(chunk)
+            for weapon, baseDamage, enchantedDamage in zip(chunk, baseDamages, enchantedDamages):
+                line = self.weaponLine(weapon, position, baseDamage, enchantedDamage)
+                if line:
+                    yield line
+                position += 1
+
+    def iterEnchantments(self):
+        """Yields the lines describing the enchantments in the workshop one at a time."""
+        for enchantment in self.enchantments:
+            yield f"A {enchantment.name} enchantment is stored in the workshop.\n"
+
+    def iterMaterials(self):
+        """Yields the lines describing the materials in the workshop one at a time."""
+        for material, quantity in self.materials.items():
+            yield f"{material}: {quantity} remaining.\n"
 
     def displayWeapons(self):
         """Display information of the Weapons in the workshop, whether enchanted or not."""
+        if self.__reportCache is not None:
+            return self.__reportCache.render()
+        return "".join(self.iterWeapons())
 
-        enchantedWeapons = ["Holy Greatsword", "Molten Defender", "Berserker Axe", "Soul Eater",
-                            "Twisted Bow", "Wand of the Deep", "Venemous Battlestaff"]
-        weaponInfo =""
-        for i in range(len(self.weapons)):
-            weapon = self.weapons[i]
-            if weapon.enchantment:
-                enchantmentEffect = weapon.enchantment.useEffect()
-                enchantedDamage = weapon.calculateDamage() * weapon.enchantment.calculateMagicDamage()
-                weaponInfo += f"The {enchantedWeapons[i]} is imbued with a {enchantmentEffect}. "\
-                              f"It deals {enchantedDamage:.2f} damage.\n"
-            elif i < len(enchantedWeapons):
-                weaponDamage = weapon.calculateDamage()
-                weaponInfo += f"The {weapon.name} is not enchanted. It deals {weaponDamage:.2f} damage.\n"
-        return weaponInfo
+    def enableReportCache(self):
+        """
+        Caches the weapons report so that later renders only rebuild the lines of the
+        weapons that changed, and returns the cache.
+        """
+        if self.__reportCache is None:
+            self.__reportCache = ReportCache(self)
+        return self.__reportCache
+
+    def enableDamageIndex(self):
+        """
+        Indexes the weapons by their enchanted damage, kept up to date as weapons are
+        added, removed and enchanted, and returns the index.
+        """
+        if self.__damageIndex is None:
+            self.__damageIndex = DamageIndex(self)
+        return self.__damageIndex
+
+    def topK(self, k):
+        """Returns the k weapons dealing the most enchanted damage, strongest first."""
+        return self.enableDamageIndex().topK(k)
+
+    def damageRange(self, low, high):
+        """Returns the weapons dealing between low and high enchanted damage, weakest first."""
+        return self.enableDamageIndex().damageRange(low, high)
+
+    def damagePercentile(self, percent):
+        """Returns the enchanted damage at a percentile of the weapons."""
+        return self.enableDamageIndex().percentile(percent)
+
+    def enableWeaponIndex(self):
+        """
+        Indexes the weapons by primary and catalyst material, enchantment name and
+        enchanted state, kept up to date as weapons are added, removed and enchanted,
+        and returns the index.
+        """
+        if self.__weaponIndex is None:
+            self.__weaponIndex = WeaponIndex(self)
+        return self.__weaponIndex
+
+    def findWeapons(self, primary=None, catalyst=None, enchantment=None, enchanted=None):
+        """
+        Returns the weapons matching every criterion given, in the order they were
+        indexed. primary and catalyst are material names, classes or instances,
+        enchantment is an enchantment name and enchanted is True or False.
+        """
+        return self.enableWeaponIndex().find(primary, catalyst, enchantment, enchanted)
 
     def displayEnchantments(self):
-        enchantmentInfo = ""
-        for enchantment in self.enchantments:
-            enchantmentInfo += f"A {enchantment.name} enchantment is stored in the workshop.\n"
-        return enchantmentInfo
+        return "".join(self.iterEnchantments())
 
     def displayMaterials(self):
         """Displays the current materials in the workshop."""
-        materialInfo = ""
-        for material, quantity in self.materials.items():
-            materialInfo += f"{material}: {quantity} remaining.\n"
-        return materialInfo
+        return "".join(self.iterMaterials())
+
+    def writeTo(self, fileobj, report="weapons", bufferSize=65536):
+        """
+        Writes a report of the workshop to a file object in buffered chunks.
+
+        report is one of "weapons", "enchantments" or "materials". Lines are collected
+        until about bufferSize characters are pending, then written with a single call.
+        Returns the number of characters written.
+        """
+        reports = {"weapons": self.iterWeapons, "enchantments": self.iterEnchantments,
+                   "materials": self.iterMaterials}
+        if report not in reports:
+            raise ValueError(f"Unknown report: {report}.")
+        buffer = []
+        pending = 0
+        written = 0
+        for line in reports[report]():
+            buffer.append(line)
+            pending += len(line)
+            if pending >= bufferSize:
+                fileobj.write("".join(buffer))
+                written += pending
+                buffer = []
+                pending = 0
+        if buffer:
+            fileobj.write("".join(buffer))
+            written += pending
+        return written
+
+
+class ReportCache(WorkshopObserver):
+    """
+    A cached weapons report of a workshop that is rebuilt incrementally.
+
+    The line of every weapon is kept in the same order as the workshop's weapons, split
+    into blocks of blockSize weapons that each cache their joined text. A change to a
+    weapon, or to the enchantment it is imbued with, only marks the weapon dirty. A
+    render rebuilds the dirty lines and rejoins their blocks, rebuilds the few leading
+    lines whose text depends on their position, and reuses the text of every other
+    block, so its work grows with the changes rather than with the inventory.
+
+    Attributes
+    ----------
+        blockSize (int): The most weapons in a block.
+        __workshop (Workshop): The workshop whose weapons are reported.
+        __blocks (list): The blocks in order, each a [lines, text] pair where lines maps
+            a weapon to its line and text is the joined lines, or None once stale.
+        __blockOf (dict): The block of each weapon.
+        __dirty (dict): The weapons whose line must be rebuilt.
+        __enchantmentOf (dict): The enchantment of each enchanted weapon, as last rendered.
+        __weaponsOf (dict): The weapons imbued with each observed enchantment.
+
+    Methods
+    -------
+        render(self):
+            Return the weapons report, rebuilding only what changed.
+    """
+    blockSize = 256
+
+    def __init__(self, workshop):
+        self.__workshop = workshop
+        self.__blocks = []
+        self.__blockOf = {}
+        self.__dirty = {}
+        self.__enchantmentOf = {}
+        self.__weaponsOf = {}
+        for weapon in workshop.weapons:
+            self.weaponAdded(weapon)
+        workshop.addObserver(self)
+
+    def weaponAdded(self, weapon):
+        if not self.__blocks or len(self.__blocks[-1][0]) >= self.blockSize:
+            self.__blocks.append([{}, None])
+        block = self.__blocks[-1]
+        block[0][weapon] = ""
+        block[1] = None
+        self.__blockOf[weapon] = block
+        self.__dirty[weapon] = None
+
+    def weaponRemoved(self, weapon):
+        block = self.__blockOf.pop(weapon, None)
+        if block is None:
+            return
+        del block[0][weapon]
+        block[1] = None
+        if not block[0]:
+            self.__blocks = [other for other in self.__blocks if other is not block]
+        self.__dirty.pop(weapon, None)
+        self.__untrack(weapon)
+
+    def weaponChanged(self, weapon):
+        if weapon in self.__blockOf:
+            self.__dirty[weapon] = None
+
+    def enchantmentChanged(self, enchantment):
+        """Called by an observed enchantment when it changes, marks its weapons dirty."""
+        for weapon in self.__weaponsOf.get(enchantment, ()):
+            self.__dirty[weapon] = None
+
+    def __untrack(self, weapon):
+        enchantment = self.__enchantmentOf.pop(weapon, None)
+        if enchantment is not None:
+            weapons = self.__weaponsOf[enchantment]
+            del weapons[weapon]
+            if not weapons:
+                del self.__weaponsOf[enchantment]
+                enchantment.removeObserver(self)
+
+    def __line(self, weapon, position):
+        # The enchantment of the weapon is observed, so changing its effect marks the line dirty.
+        enchantment = weapon.getEnchantment()
+        if enchantment is not self.__enchantmentOf.get(weapon):
+            self.__untrack(weapon)
+            if enchantment is not None:
+                self.__enchantmentOf[weapon] = enchantment
+                if enchantment not in self.__weaponsOf:
+                    self.__weaponsOf[enchantment] = {}
+                    enchantment.addObserver(self)
+                self.__weaponsOf[enchantment][weapon] = None
+        baseDamages, enchantedDamages = calculateDamages([weapon])
+        return self.__workshop.weaponLine(weapon, position, baseDamages[0], enchantedDamages[0])
+
+    def render(self):
+        """Returns the weapons report, rebuilding only the lines of weapons that changed."""
+        headCount = len(self.__workshop.enchantedWeaponNames)
+        for weapon in self.__dirty:
+            # The position only matters to the leading lines, which are rebuilt below.
+            block = self.__blockOf[weapon]
+            block[0][weapon] = self.__line(weapon, headCount)
+            block[1] = None
+        self.__dirty.clear()
+
+        head = []
+        pieces = []
+        for block in self.__blocks:
+            lines, text = block
+            if len(head) < headCount:
+                skip = min(headCount - len(head), len(lines))
+                for weapon in islice(lines, skip):
+                    head.append(self.__line(weapon, len(head)))
+                if skip < len(lines):
+                    pieces.append("".join(islice(lines.values(), skip, None)))
+                continue
+            if text is None:
+                text = block[1] = "".join(lines.values())
+            pieces.append(text)
+        return "".join(head) + "".join(pieces)
+
+
+class MaterialLedger(MutableMapping):
+    """
+    The material store of a workshop, a dict of {materialName: quantity} kept in an array.
+
+    The quantity of every material is the entry of its materialId in an integer array,
+    so crafters check and consume materials by index without building material names,
+    and the demand of many crafts is consumed as one vector. Materials are listed in
+    the order they were first stocked, like a dict, and a material stays listed when
+    its quantity falls to zero.
+
+    Attributes
+    ----------
+        __quantities (array): The quantity of every material, indexed by material id.
+        __stocked (dict): The ids of the listed materials, in the order they were stocked.
+
+    Methods
+    -------
+        quantityOf(self, materialId, default=0):
+            Return the quantity of a material by id.
+        isStocked(self, materialId):
+            Return whether a material is listed.
+        addQuantity(self, materialId, quantity):
+            Add a quantity of one material by id.
+        supply(self, demand):
+            Add a demand of (materialId, quantity) pairs.
+        consume(self, demand):
+            Consume a demand of (materialId, quantity) pairs, all or nothing.
+        vectorOf(self, demand):
+            Return a demand as a vector of quantities indexed by material id.
+        addVector(self, vector), subtractVector(self, vector):
+            Add or consume, all or nothing, a vector of quantities.
+    """
+    def __init__(self, *args, **kwargs):
+        self.__quantities = array("q", bytes(8 * len(MaterialType.materialNames)))
+        self.__stocked = {}
+        self.update(*args, **kwargs)
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({dict(self)!r})"
+
+    def __grow(self):
+        """Makes room in the array for the material ids given since it was last sized."""
+        missing = len(MaterialType.materialNames) - len(self.__quantities)
+        if missing > 0:
+            self.__quantities.frombytes(bytes(8 * missing))
+
+    def __len__(self):
+        return len(self.__stocked)
+
+    def __iter__(self):
+        names = MaterialType.materialNames
+        return (names[materialId] for materialId in list(self.__stocked))
+
+    def __contains__(self, materialName):
+        return MaterialType.materialIds.get(materialName) in self.__stocked
+
+    def __getitem__(self, materialName):
+        materialId = MaterialType.materialIds.get(materialName)
+        if materialId not in self.__stocked:
+            raise KeyError(materialName)
+        return self.__quantities[materialId]
+
+    def get(self, materialName, default=None):
+        materialId = MaterialType.materialIds.get(materialName)
+        if materialId not in self.__stocked:
+            return default
+        return self.__quantities[materialId]
+
+    def __setitem__(self, materialName, quantity):
+        materialId = MaterialType.idOf(materialName)
+        if materialId >= len(self.__quantities):
+            self.__grow()
+        self.__quantities[materialId] = quantity
+        self.__stocked[materialId] = None
+
+    def __delitem__(self, materialName):
+        materialId = MaterialType.materialIds.get(materialName)
+        if materialId not in self.__stocked:
+            raise KeyError(materialName)
+        del self.__stocked[materialId]
+        self.__quantities[materialId] = 0
+
+    def keys(self):
+        names = MaterialType.materialNames
+        return [names[materialId] for materialId in self.__stocked]
+
+    def values(self):
+        quantities = self.__quantities
+        return [quantities[materialId] for materialId in self.__stocked]
+
+    def items(self):
+        names, quantities = MaterialType.materialNames, self.__quantities
+        return [(names[materialId], quantities[materialId]) for materialId in self.__stocked]
+
+    def quantityOf(self, materialId, default=0):
+        """Returns the quantity of a material by id, or default when it is not listed."""
+        return self.__quantities[materialId] if materialId in self.__stocked else default
+
+    def isStocked(self, materialId):
+        """Returns whether a material is listed in the ledger."""
+        return materialId in self.__stocked
+
+    def addQuantity(self, materialId, quantity):
+        """Adds a quantity, which may be negative, of one material by id and lists it."""
+        if materialId >= len(self.__quantities):
+            self.__grow()
+        self.__quantities[materialId] += quantity
+        self.__stocked[materialId] = None
+
+    def supply(self, demand):
+        """Adds a demand of (materialId, quantity) pairs, listing the materials not stocked yet."""
+        quantities = self.__quantities
+        for materialId, quantity in demand:
+            if materialId >= len(quantities):
+                self.__grow()
+            quantities[materialId] += quantity
+            self.__stocked[materialId] = None
+
+    def consume(self, demand):
+        """
+        Consumes a demand of (materialId, quantity) pairs with distinct ids, all or
+        nothing, and returns the names of the materials in short supply.
+        """
+        quantities = self.__quantities
+        size = len(quantities)
+        for materialId, quantity in demand:
+            if quantity and (materialId >= size or quantities[materialId] < quantity):
+                break
+        else:
+            for materialId, quantity in demand:
+                if quantity:
+                    quantities[materialId] -= quantity
+            return set()
+        return {MaterialType.materialNames[materialId] for materialId, quantity in demand
+                if quantity and self.quantityOf(materialId) < quantity}
+
+    def vectorOf(self, demand):
+        """
+        Returns a demand of {materialName: quantity}, {materialId: quantity} or (key,
+        quantity) pairs as an array of quantities indexed by material id.
+        """
+        if isinstance(demand, Mapping):
+            demand = demand.items()
+        vector = array("q", bytes(8 * len(MaterialType.materialNames)))
+        for material, quantity in demand:
+            materialId = MaterialType.idOf(material) if isinstance(material, str) else material
+            if materialId >= len(vector):
+                vector.frombytes(bytes(8 * (len(MaterialType.materialNames) - len(vector))))
+            vector[materialId] += quantity
+        return vector
+
+    # The vector operations only read and write the entries of the materials in the
+    # vector, the ones a MaterialStore locks, so they never overwrite another update.
+    def addVector(self, vector):
+        """Adds a vector of quantities indexed by material id, listing the materials it adds to."""
+        self.__grow()
+        quantities = self.__quantities
+        for materialId in compress(range(len(vector)), vector):
+            quantities[materialId] += vector[materialId]
+            self.__stocked[materialId] = None
+
+    def subtractVector(self, vector):
+        """
+        Consumes a vector of quantities indexed by material id, all or nothing, and
+        returns the names of the materials in short supply.
+        """
+        self.__grow()
+        quantities = self.__quantities
+        materialIds = list(compress(range(len(vector)), vector))
+        if len(vector) > len(quantities) or any(quantities[materialId] < vector[materialId]
+                                                for materialId in materialIds):
+            return {MaterialType.materialNames[materialId] for materialId in materialIds
+                    if vector[materialId] > self.quantityOf(materialId)}
+        for materialId in materialIds:
+            quantities[materialId] -= vector[materialId]
+        return set()
+
+
+class MaterialStore(MaterialLedger):
+    """
+    A material store that can be shared between threads crafting concurrently.
+
+    It is a MaterialLedger where every material has its own reentrant lock. Crafters
+    lock the materials they check and consume, always in id order, so a reservation
+    of several materials is atomic and two reservations cannot deadlock. Code writing
+    to the store directly must hold the locks of the materials it writes.
+
+    Methods
+    -------
+        lockOf(self, material):
+            Return the lock of a material by name or id.
+        locked(self, materials):
+            Context manager holding the locks of several materials by name or id.
+    """
+    def __init__(self, *args, **kwargs):
+        self.__locks = {}
+        self.__locksLock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def lockOf(self, material):
+        """Returns the lock of a material by name or id, creating it on first use."""
+        materialId = MaterialType.idOf(material) if isinstance(material, str) else material
+        lock = self.__locks.get(materialId)
+        if lock is None:
+            with self.__locksLock:
+                lock = self.__locks.setdefault(materialId, threading.RLock())
+        return lock
+
+    @contextmanager
+    def locked(self, materials):
+        """Holds the locks of several materials by name or id, acquired in id order."""
+        materialIds = {MaterialType.idOf(material) if isinstance(material, str) else material
+                       for material in materials}
+        locks = [self.lockOf(materialId) for materialId in sorted(materialIds)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield self
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def addQuantity(self, materialId, quantity):
+        with self.lockOf(materialId):
+            super().addQuantity(materialId, quantity)
+
+    def supply(self, demand):
+        demand = list(demand)
+        with self.locked(materialId for materialId, _ in demand):
+            super().supply(demand)
+
+    def consume(self, demand):
+        demand = list(demand)
+        with self.locked(materialId for materialId, quantity in demand if quantity):
+            return super().consume(demand)
+
+    def addVector(self, vector):
+        with self.locked(compress(range(len(vector)), vector)):
+            super().addVector(vector)
+
+    def subtractVector(self, vector):
+        with self.locked(compress(range(len(vector)), vector)):
+            return super().subtractVector(vector)
+
+
+class ConcurrentWorkshop(Workshop):
+    """
+    A workshop that can be shared between many Forge and Enchanter threads.
+
+    Its materials are a MaterialStore with a lock per material, and changes to its
+    weapons and enchantments are serialised by an inventory lock.
+    """
+    def __init__(self, forge, enchanter, armoury=None):
+        super().__init__(forge, enchanter, armoury)
+        self.materials = MaterialStore()
+        self.__lock = threading.RLock()
+
+    def addWeapon(self, weapon):
+        with self.__lock:
+            return super().addWeapon(weapon)
+
+    def removeWeapon(self, weapon):
+        with self.__lock:
+            super().removeWeapon(weapon)
+
+    def removeWeapons(self, weapons):
+        with self.__lock:
+            super().removeWeapons(weapons)
+
+    def addEnchantment(self, enchantment):
+        with self.__lock:
+            super().addEnchantment(enchantment)
+
+    def removeEnchantment(self, enchantment):
+        with self.__lock:
+            super().removeEnchantment(enchantment)
+
+    def weaponChanged(self, weapon):
+        with self.__lock:
+            super().weaponChanged(weapon)
+
+    def weaponEnchanted(self, weapon):
+        with self.__lock:
+            super().weaponEnchanted(weapon)
+
+    def removeMaterial(self, material, quantity):
+        with self.materials.locked([material.materialId]):
+            super().removeMaterial(material, quantity)
+
+
+class DamageIndex(WorkshopObserver):
+    """
+    The weapons of a workshop sorted by the damage they deal once enchanted.
+
+    Entries are (damage, sequence, weapon) tuples in a sorted list, the sequence number
+    keeping equal damages in the order they were indexed. Changes reach the index as
+    workshop events, so it is kept up to date by Workshop.addWeapon, removeWeapon and
+    Enchanter.enchant. Queries bisect the list in O(log n + k), updates move O(n)
+    pointers in one memmove.
+
+    Attributes
+    ----------
+        __entries (list): The sorted (damage, sequence, weapon) entries.
+        __keys (dict): The (damage, sequence) key of each indexed weapon.
+        __sequence (int): The sequence number of the next entry.
+
+    Methods
+    -------
+        topK(self, k):
+            Return the k strongest weapons, strongest first.
+        damageRange(self, low, high):
+            Return the weapons dealing between low and high damage, weakest first.
+        percentile(self, percent):
+            Return the damage at a percentile of the weapons.
+    """
+    def __init__(self, workshop):
+        self.__entries = []
+        self.__keys = {}
+        self.__sequence = 0
+        weapons = list(workshop.weapons)
+        for weapon, damage in zip(weapons, calculateDamages(weapons)[1]):
+            self.__keys[weapon] = (damage, self.__sequence)
+            self.__entries.append((damage, self.__sequence, weapon))
+            self.__sequence += 1
+        self.__entries.sort(key=lambda entry: entry[:2])
+        workshop.addObserver(self)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def weaponAdded(self, weapon):
+        damage = calculateDamages([weapon])[1][0]
+        self.__keys[weapon] = (damage, self.__sequence)
+        insort(self.__entries, (damage, self.__sequence, weapon))
+        self.__sequence += 1
+
+    def weaponRemoved(self, weapon):
+        key = self.__keys.pop(weapon, None)
+        if key is not None:
+            del self.__entries[bisect_left(self.__entries, key)]
+
+    def weaponChanged(self, weapon):
+        key = self.__keys.get(weapon)
+        if key is not None and calculateDamages([weapon])[1][0] != key[0]:
+            self.weaponRemoved(weapon)
+            self.weaponAdded(weapon)
+
+    def topK(self, k):
+        """Returns the k weapons dealing the most damage, strongest first."""
+        if k <= 0:
+            return []
+        return [entry[2] for entry in reversed(self.__entries[-k:])]
+
+    def damageRange(self, low, high):
+        """Returns the weapons dealing between low and high damage inclusive, weakest first."""
+        start = bisect_left(self.__entries, (low,))
+        end = bisect_right(self.__entries, (high, math.inf))
+        return [entry[2] for entry in self.__entries[start:end]]
+
+    def percentile(self, percent):
+        """Returns the damage at a percentile of the weapons, using the nearest rank."""
+        if not self.__entries:
+            raise ValueError("No weapons are indexed.")
+        if not 0 <= percent <= 100:
+            raise ValueError("Percentile must be between 0 and 100.")
+        rank = max(1, math.ceil(percent / 100 * len(self.__entries)))
+        return self.__entries[rank - 1][0]
+
+
+class WeaponIndex(WorkshopObserver):
+    """
+    Secondary indexes over the weapons of a workshop.
+
+    Each index maps a (field, value) key to the weapons having that value, held as the
+    keys of a dict so lookups and removals are O(1) and weapons stay in the order they
+    were indexed. The fields are "primary" and "catalyst" (material class names),
+    "enchantment" (enchantment name, None when unenchanted) and "enchanted".
+    Changes reach the index as workshop events, so Forge.craft, Enchanter.enchant and
+    Weapon.setEnchantment all keep it up to date.
+
+    Attributes
+    ----------
+        __buckets (dict): The weapons having each (field, value) key.
+        __keys (dict): The keys each indexed weapon is filed under.
+
+    Methods
+    -------
+        find(self, primary, catalyst, enchantment, enchanted):
+            Return the weapons matching every given criterion.
+        count(self, field, value):
+            Return how many weapons have a value in a field.
+    """
+    def __init__(self, workshop):
+        self.__buckets = {}
+        self.__keys = {}
+        for weapon in workshop.weapons:
+            self.weaponAdded(weapon)
+        workshop.addObserver(self)
+
+    def __len__(self):
+        return len(self.__keys)
+
+    @staticmethod
+    def keysOf(weapon):
+        """Returns the (field, value) keys a weapon is filed under."""
+        enchantment = weapon.getEnchantment()
+        return (("primary", weapon.getPrimaryMaterial().__class__.__name__),
+                ("catalyst", weapon.getCatalystMaterial().__class__.__name__),
+                ("enchantment", enchantment.name if enchantment is not None else None),
+                ("enchanted", weapon.isEnchanted()))
+
+    def weaponAdded(self, weapon):
+        keys = self.keysOf(weapon)
+        self.__keys[weapon] = keys
+        for key in keys:
+            self.__buckets.setdefault(key, {})[weapon] = None
+
+    def weaponRemoved(self, weapon):
+        keys = self.__keys.pop(weapon, None)
+        if keys is not None:
+            for key in keys:
+                bucket = self.__buckets[key]
+                del bucket[weapon]
+                if not bucket:
+                    del self.__buckets[key]
+
+    def weaponChanged(self, weapon):
+        keys = self.__keys.get(weapon)
+        if keys is not None and keys != self.keysOf(weapon):
+            self.weaponRemoved(weapon)
+            self.weaponAdded(weapon)
+
+    @staticmethod
+    def materialName(material):
+        if isinstance(material, str):
+            return material
+        if isinstance(material, type):
+            return material.__name__
+        return material.__class__.__name__
+
+    def count(self, field, value):
+        """Returns how many weapons have a value in a field."""
+        return len(self.__buckets.get((field, value), ()))
+
+    def find(self, primary=None, catalyst=None, enchantment=None, enchanted=None):
+        """
+        Returns the weapons matching every criterion that is not None, or every indexed
+        weapon when none is given. The smallest matching bucket is scanned and its
+        weapons are kept if they are in all the other buckets.
+        """
+        keys = []
+        if primary is not None:
+            keys.append(("primary", self.materialName(primary)))
+        if catalyst is not None:
+            keys.append(("catalyst", self.materialName(catalyst)))
+        if enchantment is not None:
+            keys.append(("enchantment", enchantment))
+        if enchanted is not None:
+            keys.append(("enchanted", bool(enchanted)))
+        if not keys:
+            return list(self.__keys)
+
+        buckets = sorted((self.__buckets.get(key, {}) for key in keys), key=len)
+        smallest, others = buckets[0], buckets[1:]
+        return [weapon for weapon in smallest if all(weapon in bucket for bucket in others)]
 
 
 class Crafter(ABC):
@@ -216,7 +1288,17 @@ class Crafter(ABC):
     Methods
     -------
         craft(self):
-        disassemble(self)"""
+        disassemble(self)
+        reserveMaterials(self, blueprints, counts, materials):
+            Reserve the materials of many crafts at once, all or nothing.
+        consumeMaterials(self, demand, materials):
+            Consume a demand of materials, all or nothing.
+        returnMaterials(self, supply, materials):
+            Return a supply of materials to the store.
+        demandOf(primaryMaterial, catalystMaterial):
+            Return the materials used by one craft.
+        consumeMaterialsOf(self, primaryMaterial, catalystMaterial, materials):
+            Consume the materials of one craft, all or nothing."""
 
     @abstractmethod
     def craft(self):
@@ -228,6 +1310,87 @@ class Crafter(ABC):
         """Abstract method to disassemble an item."""
         pass
 
+    @staticmethod
+    def demandOf(primaryMaterial, catalystMaterial):
+        """Returns the {materialName: quantity} used to craft one item from two materials."""
+        demand = {primaryMaterial.__class__.__name__: 1}
+        catalystName = catalystMaterial.__class__.__name__
+        demand[catalystName] = demand.get(catalystName, 0) + 1
+        return demand
+
+    def consumeMaterialsOf(self, primaryMaterial, catalystMaterial, materials):
+        """
+        Consumes the materials of one craft from the material store, all or nothing, and
+        returns the names of the materials in short supply. A MaterialLedger is updated
+        by material id, without building the names of the materials.
+        """
+        if isinstance(materials, MaterialLedger):
+            primaryId, catalystId = primaryMaterial.materialId, catalystMaterial.materialId
+            if primaryId == catalystId:
+                return materials.consume(((primaryId, 2),))
+            return materials.consume(((primaryId, 1), (catalystId, 1)))
+        return self.consumeMaterials(self.demandOf(primaryMaterial, catalystMaterial), materials)
+
+    def reserveMaterials(self, blueprints, counts, materials):
+        """
+        Totals the material demand of crafting many blueprints and consumes it from the
+        material store in a single pass over the distinct materials.
+
+        Nothing is consumed unless every blueprint can be crafted. Otherwise a ValueError
+        names each blueprint that is unknown or needs a material in short supply.
+        """
+        demand = {}
+        unknown = []
+        for name, count in counts.items():
+            if count < 0:
+                raise ValueError("Craft counts cannot be negative.")
+            if name not in blueprints:
+                unknown.append(name)
+                continue
+            for material in blueprints[name]:
+                materialName = material.__class__.__name__
+                demand[materialName] = demand.get(materialName, 0) + count
+
+        if unknown:
+            # Nothing is consumed, only the shortages are reported.
+            shortages = {materialName for materialName, quantity in demand.items()
+                         if quantity and materials.get(materialName, 0) < quantity}
+        else:
+            shortages = self.consumeMaterials(demand, materials)
+        if unknown or shortages:
+            failed = unknown + [name for name, count in counts.items()
+                                if count and name in blueprints
+                                and any(material.__class__.__name__ in shortages for material in blueprints[name])]
+            raise ValueError(f"Insufficient materials for crafting: {', '.join(failed)}.")
+
+    def consumeMaterials(self, demand, materials):
+        """
+        Consumes a demand of {materialName: quantity} from the material store, all or
+        nothing, and returns the names of the materials in short supply.
+
+        A MaterialStore is locked for the materials of the demand while they are checked
+        and consumed, so concurrent crafters cannot both take the last unit.
+        """
+        if isinstance(materials, MaterialLedger):
+            return materials.consume([(MaterialType.idOf(materialName), quantity)
+                                      for materialName, quantity in demand.items()])
+        shortages = {materialName for materialName, quantity in demand.items()
+                     if quantity and materials.get(materialName, 0) < quantity}
+        if not shortages:
+            # Update the material store by consuming the whole demand
+            for materialName, quantity in demand.items():
+                if quantity:
+                    materials[materialName] -= quantity
+        return shortages
+
+    def returnMaterials(self, supply, materials):
+        """Returns a supply of {materialName: quantity} to the material store."""
+        if isinstance(materials, MaterialLedger):
+            materials.supply([(MaterialType.idOf(materialName), quantity) for materialName, quantity in supply.items()])
+            return
+        for materialName, quantity in supply.items():
+            materials[materialName] += quantity
+
 
 class Forge(Crafter):
     """
@@ -239,6 +1402,10 @@ class Forge(Crafter):
     -------
         craft(self, name, primaryMaterial, catalystMaterial,materials):
             Crafts a weapon, instantiated weapon and return the instantiated weapon to workshop.
+        craftMany(self, blueprints, counts, materials):
+            Crafts many weapons from a blueprint table at once, all or nothing.
+        checkBlueprint(self, name, primaryMaterial, catalystMaterial):
+            Raises ValueError if a weapon cannot be crafted from the materials.
         disassemble(self, weapon, materials):
             Disassembles a previously crafted weapon and returns it.
     """
@@ -249,35 +1416,54 @@ class Forge(Crafter):
     def craft(self, name, primaryMaterial, catalystMaterial, materials):
         """  Crafts a weapon, instantiated weapon perform calculations of damage on the weapon and return the instantiated weapon to workshop """
 
-        # Check if the required materials are available in the material store
-        if (
-            primaryMaterial.__class__.__name__ not in materials
-            or catalystMaterial.__class__.__name__ not in materials
-        ):
-            raise ValueError("Insufficient materials for crafting.")
-
-        if (
-            materials[primaryMaterial.__class__.__name__] < 1
-            or materials[catalystMaterial.__class__.__name__] < 1
-        ):
-            raise ValueError("Insufficient materials for crafting.")
-
         # Create a new instance of the Weapon class
         weapon = Weapon(name, primaryMaterial, catalystMaterial)
 
         # Calculate the damage for the weapon
         weapon.calculateDamage()
 
+        # Check the required materials are available and consume them from the material store
+        if self.consumeMaterialsOf(primaryMaterial, catalystMaterial, materials):
+            raise ValueError("Insufficient materials for crafting.")
+
         if self.__workshop is not None:
             # Add the weapon to the workshop
             self.__workshop.addWeapon(weapon)
-        # Update the material store by consuming the required materials
-        materials[primaryMaterial.__class__.__name__] -= 1
-        materials[catalystMaterial.__class__.__name__] -= 1
 
         # Return the crafted weapon
         return weapon
 
+    def craftMany(self, blueprints, counts, materials):
+        """
+        Crafts many weapons at once and returns them.
+
+        blueprints maps a weapon name to its [primaryMaterial, catalystMaterial] and counts
+        maps a weapon name to how many to craft. The materials of every weapon are
+        reserved before any weapon is built, so either all of them are crafted or none.
+        """
+        # Every blueprint is checked first, so an invalid one raises before any material is reserved.
+        for name, count in counts.items():
+            if count and name in blueprints:
+                self.checkBlueprint(name, *blueprints[name])
+        self.reserveMaterials(blueprints, counts, materials)
+
+        weapons = []
+        for name, count in counts.items():
+            primaryMaterial, catalystMaterial = blueprints[name]
+            for _ in range(count):
+                weapon = Weapon(name, primaryMaterial, catalystMaterial)
+                weapon.calculateDamage()
+                weapons.append(weapon)
+
+        if self.__workshop is not None:
+            for weapon in weapons:
+                self.__workshop.addWeapon(weapon)
+        return weapons
+
+    def checkBlueprint(self, name, primaryMaterial, catalystMaterial):
+        """Raises ValueError if a weapon cannot be crafted from the materials, without consuming any."""
+        Weapon(name, primaryMaterial, catalystMaterial).calculateDamage()
+
     def disassemble(self, weapon, materials):
         """ Disassembles a previously crafted weapon and returns it."""
 
@@ -286,8 +1472,7 @@ class Forge(Crafter):
             self.__workshop.removeWeapon(weapon)
 
         # Update the material store with the disassembled weapon's materials
-        materials[weapon.getPrimaryMaterial().__class__.__name__] += 1
-        materials[weapon.getCatalystMaterial().__class__.__name__] += 1
+        self.returnMaterials(self.demandOf(weapon.getPrimaryMaterial(), weapon.getCatalystMaterial()), materials)
 
         # Return the weapon being disassembled.
         return weapon
@@ -301,13 +1486,16 @@ class Enchanter(Crafter):
     ----------
         __workshop (Workshop): The workshop instance associated with the enchanter.
         __enchantment(list): A list to store enchantments.
-        __materials(dict): A dictionary to track the quantity of different materials.
         __recipes (enchantmentName, effect): dict
 
     Methods
     -------
         craft(self, name, primaryMaterial, catalystMaterial, materials):
             Instantiated and return an enchantment.
+        craftMany(self, blueprints, counts, materials):
+            Instantiated and return many enchantments at once, all or nothing.
+        checkBlueprint(self, name, primaryMaterial, catalystMaterial):
+            Raises ValueError if an enchantment cannot be crafted from the materials.
         disassemble(self, enchantment, materials):
             Return the enchantment being disassembled.
         enchant(self, weapon, enchantmentName, enchantment):
@@ -317,20 +1505,6 @@ class Enchanter(Crafter):
         super().__init__()
         self.__workshop = workshop
         self.__enchantment = []
-        self.__materials = {
-            "Maple": 0,
-            "Oak": 0,
-            "Ash": 0,
-            "Bronze": 0,
-            "Iron": 0,
-            "Steel": 0,
-            "Ruby": 0,
-            "Sapphire": 0,
-            "Emerald": 0,
-            "Diamond": 0,
-            "Amethyst": 0,
-            "Onyx": 0
-        }
         self.__recipes = {
             "Holy": "pulses a blinding beam of light",
             "Lava": "melts the armour off an enemy",
@@ -343,19 +1517,6 @@ class Enchanter(Crafter):
 
     def craft(self, name, primaryMaterial, catalystMaterial, materials):
         """Creating an enchantment, instantiated and returned to Workshop"""
-        # Check if the required materials are available in the material store
-        if (
-            primaryMaterial.__class__.__name__ not in materials
-            or catalystMaterial.__class__.__name__ not in materials
-        ):
-            raise ValueError("Insufficient materials for crafting.")
-
-        if (
-            materials[primaryMaterial.__class__.__name__] < 1
-            or materials[catalystMaterial.__class__.__name__] < 1
-        ):
-            raise ValueError("Insufficient materials for crafting.")
-
         # Create a new instance of the Enchantment class
         effect = self.__recipes.get(name)
         if effect is None:
@@ -364,16 +1525,47 @@ class Enchanter(Crafter):
 
         enchantment = Enchantment(name, primaryMaterial, catalystMaterial, effect)
 
+        # Check the required materials are available and consume them from the material store
+        if self.consumeMaterialsOf(primaryMaterial, catalystMaterial, materials):
+            raise ValueError("Insufficient materials for crafting.")
+
         if self.__workshop is not None:
             # Add the enchantment to the workshop
             self.__workshop.addEnchantment(enchantment)
-        # Update the material store by consuming the required materials
-        materials[primaryMaterial.__class__.__name__] -= 1
-        materials[catalystMaterial.__class__.__name__] -= 1
 
         # Return the crafted enchantment
         return enchantment
 
+    def craftMany(self, blueprints, counts, materials):
+        """
+        Crafts many enchantments at once and returns them.
+
+        blueprints maps an enchantment name to its [primaryMaterial, catalystMaterial] and
+        counts maps an enchantment name to how many to craft. The materials of every
+        enchantment are reserved before any is built, so either all are crafted or none.
+        """
+        # Every blueprint is checked first, so an invalid one raises before any material is reserved.
+        for name, count in counts.items():
+            if count and name in blueprints:
+                self.checkBlueprint(name, *blueprints[name])
+        self.reserveMaterials(blueprints, counts, materials)
+
+        enchantments = []
+        for name, count in counts.items():
+            primaryMaterial, catalystMaterial = blueprints[name]
+            effect = self.__recipes.get(name, "Default Effect")
+            for _ in range(count):
+                enchantments.append(Enchantment(name, primaryMaterial, catalystMaterial, effect))
+
+        if self.__workshop is not None:
+            for enchantment in enchantments:
+                self.__workshop.addEnchantment(enchantment)
+        return enchantments
+
+    def checkBlueprint(self, name, primaryMaterial, catalystMaterial):
+        """Raises ValueError if an enchantment cannot be crafted from the materials, without consuming any."""
+        Enchantment(name, primaryMaterial, catalystMaterial, self.__recipes.get(name, "Default Effect"))
+
     def disassemble(self, enchantment, materials):
         """ Remove and disassembles a previously crafted enchantment from Workshop
         and returns it to material store."""
@@ -381,17 +1573,17 @@ class Enchanter(Crafter):
         if self.__workshop is not None:
             self.__workshop.removeEnchantment(enchantment)
 
-        materials[enchantment.getPrimaryMaterial().__class__.__name__] += 1
-        materials[enchantment.getCatalystMaterial().__class__.__name__] += 1
+        self.returnMaterials(self.demandOf(enchantment.getPrimaryMaterial(), enchantment.getCatalystMaterial()), materials)
         # Return the enchantment being disassembled.
         return enchantment
 
     def enchant(self, weapon, enchantmentName, enchantment):
         """Enchants a weapon with the specified enchantment."""
-        # The weapons attributes are updated to reflect the attached enchantment.
+        # The weapons attributes are updated to reflect the attached enchantment. The name
+        # is set first, as it does not notify the observers of a Weapon by itself.
+        weapon.enchantmentName = enchantmentName
         weapon.setEnchantment(enchantment)
         weapon.setDamage(weapon.getDamage() * enchantment.magicDamage)
-        weapon.enchantmentName = enchantmentName
 
 
 class Weapon:
@@ -423,7 +1615,13 @@ class Weapon:
             Calculates the damage of the weapon based on the materials used and return it.
         attack(self):
             Returns a string describing the attack of the weapon.
+        addObserver(self, observer), removeObserver(self, observer):
+            Register or unregister an object told when the weapon changes or is enchanted.
     """
+    # Slots keep weapons, and the ArmouryWeapon views of an armoury, free of a __dict__.
+    # enchantmentName is only set once the weapon is enchanted.
+    __slots__ = ("__name", "__damage", "__enchanted", "__primaryMaterial", "__catalystMaterial",
+                 "__enchantment", "__observers", "enchantmentName", "__weakref__")
 
     def __init__(self, name, primaryMaterial, catalystMaterial):
 
@@ -433,6 +1631,24 @@ class Weapon:
         self.__primaryMaterial = primaryMaterial
         self.__catalystMaterial = catalystMaterial
         self.__enchantment = None
+        self.__observers = ()
+
+    def __getstate__(self):
+        # Observers belong to this process, so they are not pickled with the weapon. The
+        # slots of subclasses, such as the row of an ArmouryWeapon, are pickled as well.
+        state = {}
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get("__slots__", ()):
+                if name.startswith("__") and not name.endswith("__"):
+                    name = f"_{cls.__name__.lstrip('_')}{name}"
+                if name not in ("_Weapon__observers", "__weakref__") and hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        self.__observers = ()
+        for name, value in state.items():
+            setattr(self, name, value)
 
     # Getter and setter for name attribute
     def getName(self):
@@ -442,6 +1658,7 @@ class Weapon:
         if not isinstance(value, str):
             raise ValueError("Name must be a string.")
         self.__name = value
+        self.notifyObservers()
 
     # Getter and setter for damage attribute
     def getDamage(self):
@@ -451,6 +1668,7 @@ class Weapon:
         if not isinstance(value, float):
             raise ValueError("Damage must be a float.")
         self.__damage = value
+        self.notifyObservers()
 
     # Getter and setter for enchanted attribute
     def isEnchanted(self):  # Check if the weapon is enchanted.
@@ -460,6 +1678,7 @@ class Weapon:
         if not isinstance(value, bool):
             raise ValueError("Enchanted status must be a boolean.")
         self.__enchanted = value
+        self.notifyObservers()
 
     # Getter and setter for primaryMaterial attribute
     def getPrimaryMaterial(self):
@@ -477,7 +1696,8 @@ class Weapon:
         if not isinstance(enchantment, Enchantment):
             raise TypeError("Enchantment must be an instance of the Enchantment class.")
         self.__enchantment = enchantment
-        self.setEnchanted(True)
+        self.__enchanted = True
+        self.notifyEnchanted()
 
     # Properties for all attributes
     name = property(getName, setName)
@@ -487,41 +1707,56 @@ class Weapon:
     secondaryMaterial = property(getCatalystMaterial)
     enchantment = property(getEnchantment, setEnchantment)
 
+    # Observers of the weapon, usually the workshops storing it
+    def addObserver(self, observer):
+        """
+        Registers an object whose weaponChanged method is called when the weapon changes,
+        and whose weaponEnchanted method is called when it is given an enchantment.
+        """
+        if observer not in self.__observers:
+            self.__observers += (observer,)
+
+    def removeObserver(self, observer):
+        self.__observers = tuple(other for other in self.__observers if other is not observer)
+
+    def notifyObservers(self):
+        for observer in self.__observers:
+            observer.weaponChanged(self)
+
+    def notifyEnchanted(self):
+        for observer in self.__observers:
+            observer.weaponEnchanted(self)
+
     def calculateDamage(self):
         """
         Calculates the damage of the weapon based on the materials used and return it.
         """
+        # Materials are interned, so the damage of a pair of materials is only calculated once.
+        materialPair = (self.__primaryMaterial, self.__catalystMaterial)
+        damage = damageTable.get(materialPair)
+        if damage is not None:
+            self.__damage = damage
+            return damage
+
         primaryStrength = self.__primaryMaterial.strength
         catalystStrength = self.__catalystMaterial.strength
+        pairing = getMaterialPairing(self.__primaryMaterial, self.__catalystMaterial)
         # If a weapon is made of two pieces of wood:
-        if (
-                isinstance(self.__primaryMaterial, Wood)
-                and isinstance(self.__catalystMaterial, Wood)
-        ):
+        if pairing == WOOD_WOOD:
             self.__damage = primaryStrength * catalystStrength
         # If a weapon is made of two pieces of metal:
-        elif (
-                isinstance(self.__primaryMaterial, Metal)
-                and isinstance(self.__catalystMaterial, Metal)
-        ):
+        elif pairing == METAL_METAL:
             primaryPurity = self.__primaryMaterial.purity
             catalystPurity = self.__catalystMaterial.purity
             self.__damage = (primaryStrength * primaryPurity) + (catalystStrength * catalystPurity)
         # If a weapon is made of a piece of wood and a piece of metal:
-        elif (
-                isinstance(self.__primaryMaterial, Metal)
-                and isinstance(self.__catalystMaterial, Wood)
-        ):
+        elif pairing == METAL_WOOD:
             primaryPurity = self.__primaryMaterial.purity
             self.__damage = (primaryStrength * catalystStrength) * primaryPurity
-        elif (
-                isinstance(self.__primaryMaterial, Wood)
-                and isinstance(self.__catalystMaterial, Metal)
-        ):
+        else:
             catalystPurity = self.__catalystMaterial.purity
             self.__damage = primaryStrength * (catalystStrength * catalystPurity)
-        else:
-            raise ValueError("Invalid combination of material.")
+        damageTable[materialPair] = self.__damage
         return self.__damage
 
     def attack(self):  # used in the workshops displayArmory method.
@@ -542,6 +1777,7 @@ class Enchantment:
         __catalystMaterial (Material): The catalyst material used for the enchantment.
         __effect (str): The effect of the enchantment.
         __magicDamage (float): The additional magic damage provided by the enchantment.
+        __observers (tuple): The objects told when the effect or magic damage changes.
 
     Methods
     -------
@@ -557,6 +1793,8 @@ class Enchantment:
             based on the primary and catalyst materials.
         useEffect(self):
             Use the enchantment and return a string representation of the enchantment and its effect.
+        addObserver(self, observer), removeObserver(self, observer):
+            Register or unregister an object told when the enchantment changes.
     """
     def __init__(self, name, primaryMaterial, catalystMaterial, effect):
 
@@ -565,8 +1803,15 @@ class Enchantment:
         self.__catalystMaterial = catalystMaterial
         self.__effect = effect
         self.__magicDamage = 0
+        self.__observers = ()
         self.calculateMagicDamage()
 
+    def __getstate__(self):
+        # Observers belong to this process, so they are not pickled with the enchantment.
+        state = self.__dict__.copy()
+        state["_Enchantment__observers"] = ()
+        return state
+
     # Getter for name attribute
     def getName(self):
         return self.__name
@@ -579,6 +1824,7 @@ class Enchantment:
         if not isinstance(value, (int, float)):
             raise TypeError("The magicDamage must be a number.")
         self.__magicDamage = value
+        self.notifyObservers()
 
     # Getter and setter for effect attribute
     def getEffect(self):
@@ -588,6 +1834,7 @@ class Enchantment:
         if not isinstance(value, str):
             raise TypeError("The effect must be a string.")
         self.__effect = value
+        self.notifyObservers()
 
     # Getter for primaryMaterial attribute
     def getPrimaryMaterial(self):
@@ -597,6 +1844,19 @@ class Enchantment:
     def getCatalystMaterial(self):
         return self.__catalystMaterial
 
+    # Observers of the enchantment, such as the report caches of the weapons imbued with it
+    def addObserver(self, observer):
+        """Registers an object whose enchantmentChanged method is called when the enchantment changes."""
+        if observer not in self.__observers:
+            self.__observers += (observer,)
+
+    def removeObserver(self, observer):
+        self.__observers = tuple(other for other in self.__observers if other is not observer)
+
+    def notifyObservers(self):
+        for observer in self.__observers:
+            observer.enchantmentChanged(self)
+
     # Property for name attribute
     name = property(getName)
 
@@ -610,12 +1870,19 @@ class Enchantment:
         """
         Calculate the additional magic damage provided by the enchantment based on the primary and catalyst materials.
         """
+        materialPair = (self.__primaryMaterial, self.__catalystMaterial)
+        magicDamage = magicDamageTable.get(materialPair)
+        if magicDamage is not None:
+            self.__magicDamage = magicDamage
+            return magicDamage
+
         primary_strength = self.__primaryMaterial.strength
         primary_magic_power = self.__primaryMaterial.magicPower
         catalyst_strength = self.__catalystMaterial.strength
         catalyst_magic_power = self.__catalystMaterial.magicPower
 
         self.__magicDamage = (primary_strength * primary_magic_power) + (catalyst_strength * catalyst_magic_power)
+        magicDamageTable[materialPair] = self.__magicDamage
         return self.__magicDamage
 
     def useEffect(self):  # used in the workshops methods when displaying your armoury of enchanted weapons.
@@ -625,67 +1892,598 @@ class Enchantment:
         return f"{self.__name} enchantment and {self.__effect}"
 
 
-# Create a workshop, forge, enchanter.
-workshop = Workshop(Forge(), Enchanter())
-# Create a set of materials and lists for testing.
-materials = [Maple(), Oak(), Ash(), Bronze(), Iron(), Steel(),
-             Ruby(), Sapphire(), Emerald(), Diamond(), Amethyst(), Onyx()]
-weaponBlueprints = {
-    "Sword": [Steel(), Maple()],
-    "Shield": [Bronze(), Oak()],
-    "Axe": [Iron(), Ash()],
-    "Scythe": [Steel(), Ash()],
-    "Bow": [Oak(), Maple()],
-    "Wand": [Ash(), Oak()],
-    "Staff": [Bronze(), Maple()],
-    "Dagger": [Bronze(), Bronze()]}
-enchantmentBlueprints = {
-    "Holy": [Diamond(), Diamond()],
-    "Lava": [Ruby(), Onyx()],
-    "Pyro": [Ruby(), Diamond()],
-    "Darkness": [Onyx(), Amethyst()],
-    "Cursed": [Onyx(), Onyx()],
-    "Hydro": [Sapphire(), Emerald()],
-    "Venomous": [Emerald(), Amethyst()],
-    "Earthly": [Emerald(), Emerald()]}
-enchantedWeapons = ["Holy Greatsword", "Molten Defender", "Berserker Axe", "Soul Eater",
-    "Twisted Bow", "Wand of the Deep", "Venemous Battlestaff"]
-# Adds a number of materials to use for crafting.
-for material in materials:
-    if isinstance(material, Wood):
-        workshop.addMaterial(material.__class__.__name__, 20)
-    elif isinstance(material, Metal):
-        workshop.addMaterial(material.__class__.__name__, 10)
-    else:
-        workshop.addMaterial(material.__class__.__name__, 5)
-print("--------------------------------Material Store--------------------------------")
-print(workshop.displayMaterials())
-# Crafts the following: Sword, Shield, Axe, Scythe, Bow, Wand and Staff weapons.
-for weapon, materials in weaponBlueprints.items():
-    craftedWeapon = workshop.forge.craft(
-        weapon, materials[0], materials[1], workshop.materials)
-    workshop.addWeapon(craftedWeapon)
-# Disassemble the extra weapon.
-workshop.removeWeapon(workshop.forge.disassemble(
-    workshop.weapons[7], workshop.materials))
-print("------------------------------------Armoury-----------------------------------")
-print(workshop.displayWeapons())
-# Crafts the following: Holy, Lava, Pyro, Darkness, Cursed, Hydro and Venomous enchantments.
-
-for enchantment, materials in enchantmentBlueprints.items():
-    craftedEnchantment = workshop.enchanter.craft(
-        enchantment, materials[0], materials[1], workshop.materials)
-    workshop.addEnchantment(craftedEnchantment)
-# Disassemble the extra enchantment.
-workshop.removeEnchantment(workshop.enchanter.disassemble(
-    workshop.enchantments[7], workshop.materials))
-print("------------------------------------Enchantments------------------------------------")
-print(workshop.displayEnchantments())
-print("-----------------------------------Material Store-----------------------------------")
-print(workshop.displayMaterials())
-# Enchant the following weapons: Sword, Shield, Axe, Scythe, Bow, Wand and Staff.
-for i in range(len(enchantedWeapons)):
-    workshop.enchanter.enchant(
-        workshop.weapons[i], enchantedWeapons[i], workshop.enchantments[i])
-print("-----------------------------------Enchanted Armoury----------------------------------")
-print(workshop.displayWeapons())
+class Armoury:
+    """
+    A columnar store of weapons that a Workshop can use instead of a list.
+
+    Each weapon is kept as one row across compact typed arrays rather than as a full
+    Weapon object. Materials, names and enchantments are interned into small tables and
+    the rows only hold their indexes. Weapon objects are lightweight views over a row,
+    created only when a row is indexed or iterated. A view stays the same object for as
+    long as it is referenced, so it can be compared, enchanted or removed like a Weapon.
+    Weapons appended to the armoury are copied into the columns, further changes should
+    be made through the views.
+
+    Attributes
+    ----------
+        __primaryCodes (array): The material table index of each weapon's primary material.
+        __catalystCodes (array): The material table index of each weapon's catalyst material.
+        __damages (array): The damage value of each weapon.
+        __enchanted (array): Whether each weapon is enchanted.
+        __enchantmentIndexes (array): The enchantment table index of each weapon, -1 for none.
+        __nameIds (array): The interned name id of each weapon.
+        __enchantmentNameIds (array): The interned enchantment name id of each weapon, -1 for none.
+        __materials (list): The material table.
+        __enchantments (list): The enchantment table.
+        __names (list): The interned string table.
+        __views (WeakValueDictionary): The live views, keyed by row.
+        __observers (list): The objects told when a row changes through a view.
+
+    Methods
+    -------
+        append(self, weapon):
+            Copy a weapon into a new row.
+        remove(self, weapon):
+            Remove the row of a weapon view.
+        calculateDamages(self):
+            Calculate the base and enchanted damage of every row.
+        countByMaterial(self):
+            Count the weapons made from each material class.
+    """
+    def __init__(self, weapons=()):
+        self.__primaryCodes = array("H")
+        self.__catalystCodes = array("H")
+        self.__damages = array("d")
+        self.__enchanted = array("b")
+        self.__enchantmentIndexes = array("i")
+        self.__nameIds = array("i")
+        self.__enchantmentNameIds = array("i")
+        self.__materials = []
+        self.__materialCodes = {}
+        self.__enchantments = []
+        self.__enchantmentCodes = {}
+        self.__names = []
+        self.__nameCodes = {}
+        self.__views = weakref.WeakValueDictionary()
+        self.__observers = []
+        for weapon in weapons:
+            self.append(weapon)
+
+    def __columns(self):
+        return (self.__primaryCodes, self.__catalystCodes, self.__damages, self.__enchanted,
+                self.__enchantmentIndexes, self.__nameIds, self.__enchantmentNameIds)
+
+    def __internMaterial(self, material):
+        # Materials are interned, so the instance itself identifies its class and stats.
+        code = self.__materialCodes.get(material)
+        if code is None:
+            code = self.__materialCodes[material] = len(self.__materials)
+            self.__materials.append(material)
+        return code
+
+    def __internEnchantment(self, enchantment):
+        if enchantment is None:
+            return -1
+        code = self.__enchantmentCodes.get(id(enchantment))
+        if code is None:
+            code = self.__enchantmentCodes[id(enchantment)] = len(self.__enchantments)
+            self.__enchantments.append(enchantment)
+        return code
+
+    def __internName(self, name):
+        if name is None:
+            return -1
+        code = self.__nameCodes.get(name)
+        if code is None:
+            code = self.__nameCodes[name] = len(self.__names)
+            self.__names.append(name)
+        return code
+
+    def __row(self, weapon):
+        if isinstance(weapon, ArmouryWeapon) and weapon.getArmoury() is self:
+            return weapon.getRow()
+        return -1
+
+    def __len__(self):
+        return len(self.__damages)
+
+    def __contains__(self, weapon):
+        return self.__row(weapon) >= 0
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("Armoury index out of range.")
+        view = self.__views.get(row)
+        if view is None:
+            view = self.__views[row] = ArmouryWeapon(self, row)
+        return view
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def append(self, weapon):
+        """Copies a weapon into a new row of the armoury and returns the view of the row."""
+        if weapon in self:
+            return weapon
+        self.__primaryCodes.append(self.__internMaterial(weapon.getPrimaryMaterial()))
+        self.__catalystCodes.append(self.__internMaterial(weapon.getCatalystMaterial()))
+        self.__damages.append(weapon.getDamage())
+        self.__enchanted.append(weapon.isEnchanted())
+        self.__enchantmentIndexes.append(self.__internEnchantment(weapon.getEnchantment()))
+        self.__nameIds.append(self.__internName(weapon.getName()))
+        self.__enchantmentNameIds.append(self.__internName(getattr(weapon, "enchantmentName", None)))
+        return self[len(self) - 1]
+
+    def remove(self, weapon):
+        """Removes the row of a weapon view from the armoury."""
+        row = self.__row(weapon)
+        if row < 0:
+            raise ValueError("Weapon not found in the armoury.")
+        for column in self.__columns():
+            del column[row]
+        self.__moveViews({row})
+
+    def removeMany(self, weapons):
+        """Removes the rows of many weapon views in one pass and returns how many were removed."""
+        rows = {self.__row(weapon) for weapon in weapons}
+        rows.discard(-1)
+        if rows:
+            for column in self.__columns():
+                column[:] = array(column.typecode, [value for row, value in enumerate(column) if row not in rows])
+            self.__moveViews(rows)
+        return len(rows)
+
+    def __moveViews(self, removedRows):
+        # Detach the views of the removed rows and shift the views of the following rows up.
+        sortedRows = sorted(removedRows)
+        views = list(self.__views.items())
+        self.__views = weakref.WeakValueDictionary()
+        for viewRow, view in views:
+            if viewRow in removedRows:
+                view.setRow(-1)
+            else:
+                newRow = viewRow - bisect_left(sortedRows, viewRow)
+                view.setRow(newRow)
+                self.__views[newRow] = view
+
+    # Row accessors used by the weapon views.
+    def getNameAt(self, row):
+        return self.__names[self.__nameIds[row]]
+
+    def setNameAt(self, row, value):
+        self.__nameIds[row] = self.__internName(value)
+
+    def getDamageAt(self, row):
+        return self.__damages[row]
+
+    def setDamageAt(self, row, value):
+        self.__damages[row] = value
+
+    def isEnchantedAt(self, row):
+        return bool(self.__enchanted[row])
+
+    def setEnchantedAt(self, row, value):
+        self.__enchanted[row] = value
+
+    def getPrimaryMaterialAt(self, row):
+        return self.__materials[self.__primaryCodes[row]]
+
+    def getCatalystMaterialAt(self, row):
+        return self.__materials[self.__catalystCodes[row]]
+
+    def getEnchantmentAt(self, row):
+        index = self.__enchantmentIndexes[row]
+        return self.__enchantments[index] if index >= 0 else None
+
+    def setEnchantmentAt(self, row, enchantment):
+        self.__enchantmentIndexes[row] = self.__internEnchantment(enchantment)
+
+    def addObserver(self, observer):
+        """
+        Registers an object whose weaponChanged method is called when any row changes,
+        and whose weaponEnchanted method is called when a row is given an enchantment.
+        """
+        if observer not in self.__observers:
+            self.__observers.append(observer)
+
+    def removeObserver(self, observer):
+        if observer in self.__observers:
+            self.__observers.remove(observer)
+
+    def notifyObservers(self, view):
+        for observer in self.__observers:
+            observer.weaponChanged(view)
+
+    def notifyEnchanted(self, view):
+        for observer in self.__observers:
+            observer.weaponEnchanted(view)
+
+    def getEnchantmentNameAt(self, row):
+        nameId = self.__enchantmentNameIds[row]
+        return self.__names[nameId] if nameId >= 0 else None
+
+    def setEnchantmentNameAt(self, row, value):
+        self.__enchantmentNameIds[row] = self.__internName(value)
+
+    def calculateDamages(self):
+        """
+        Calculates the base and enchanted damage of every row.
+
+        Damage only depends on the material and enchantment codes of a row, so each
+        distinct combination is calculated once and the rows are filled from it.
+        """
+        baseByMaterials = {}
+        magicByEnchantment = {-1: None}
+        baseDamages = []
+        enchantedDamages = []
+        for primaryCode, catalystCode, enchantmentIndex in zip(
+                self.__primaryCodes, self.__catalystCodes, self.__enchantmentIndexes):
+            baseDamage = baseByMaterials.get((primaryCode, catalystCode))
+            if baseDamage is None:
+                baseDamage = Weapon("", self.__materials[primaryCode], self.__materials[catalystCode]).calculateDamage()
+                baseByMaterials[(primaryCode, catalystCode)] = baseDamage
+            if enchantmentIndex not in magicByEnchantment:
+                magicByEnchantment[enchantmentIndex] = self.__enchantments[enchantmentIndex].calculateMagicDamage()
+            magicDamage = magicByEnchantment[enchantmentIndex]
+            baseDamages.append(baseDamage)
+            enchantedDamages.append(baseDamage if magicDamage is None else baseDamage * magicDamage)
+        return baseDamages, enchantedDamages
+
+    def countByMaterial(self):
+        """Counts the weapons made from each material class, as primary or catalyst."""
+        codeCounts = [0] * len(self.__materials)
+        for code in self.__primaryCodes:
+            codeCounts[code] += 1
+        for code in self.__catalystCodes:
+            codeCounts[code] += 1
+        counts = {}
+        for material, count in zip(self.__materials, codeCounts):
+            name = material.__class__.__name__
+            counts[name] = counts.get(name, 0) + count
+        return counts
+
+
+class ArmouryWeapon(Weapon):
+    """
+    A lightweight view of one weapon row in an Armoury.
+
+    It offers the same getters, setters and methods as Weapon, reading and writing the
+    armoury's columns instead of its own attributes.
+    """
+    __slots__ = ("__armoury", "__row")
+
+    def __init__(self, armoury, row):
+        self.__armoury = armoury
+        self.__row = row
+
+    def getArmoury(self):
+        return self.__armoury
+
+    def getRow(self):
+        return self.__row
+
+    def setRow(self, row):
+        self.__row = row
+
+    def __checkRow(self):
+        if self.__row < 0:
+            raise ValueError("Weapon has been removed from the armoury.")
+        return self.__row
+
+    def getName(self):
+        return self.__armoury.getNameAt(self.__checkRow())
+
+    def setName(self, value):
+        if not isinstance(value, str):
+            raise ValueError("Name must be a string.")
+        self.__armoury.setNameAt(self.__checkRow(), value)
+        self.__armoury.notifyObservers(self)
+
+    def getDamage(self):
+        return self.__armoury.getDamageAt(self.__checkRow())
+
+    def setDamage(self, value):
+        if not isinstance(value, float):
+            raise ValueError("Damage must be a float.")
+        self.__armoury.setDamageAt(self.__checkRow(), value)
+        self.__armoury.notifyObservers(self)
+
+    def isEnchanted(self):
+        return self.__armoury.isEnchantedAt(self.__checkRow())
+
+    def setEnchanted(self, value):
+        if not isinstance(value, bool):
+            raise ValueError("Enchanted status must be a boolean.")
+        self.__armoury.setEnchantedAt(self.__checkRow(), value)
+        self.__armoury.notifyObservers(self)
+
+    def getPrimaryMaterial(self):
+        return self.__armoury.getPrimaryMaterialAt(self.__checkRow())
+
+    def getCatalystMaterial(self):
+        return self.__armoury.getCatalystMaterialAt(self.__checkRow())
+
+    def getEnchantment(self):
+        return self.__armoury.getEnchantmentAt(self.__checkRow())
+
+    def setEnchantment(self, enchantment):
+        if not isinstance(enchantment, Enchantment):
+            raise TypeError("Enchantment must be an instance of the Enchantment class.")
+        row = self.__checkRow()
+        self.__armoury.setEnchantmentAt(row, enchantment)
+        self.__armoury.setEnchantedAt(row, True)
+        self.__armoury.notifyEnchanted(self)
+
+    def getEnchantmentName(self):
+        return self.__armoury.getEnchantmentNameAt(self.__checkRow())
+
+    # The observers of a view are those of its armoury
+    def addObserver(self, observer):
+        self.__armoury.addObserver(observer)
+
+    def removeObserver(self, observer):
+        pass
+
+    def notifyObservers(self):
+        self.__armoury.notifyObservers(self)
+
+    def notifyEnchanted(self):
+        self.__armoury.notifyEnchanted(self)
+
+    def setEnchantmentName(self, value):
+        self.__armoury.setEnchantmentNameAt(self.__checkRow(), value)
+        self.__armoury.notifyObservers(self)
+
+    # Properties for all attributes
+    name = property(getName, setName)
+    damage = property(getDamage, setDamage)
+    enchanted = property(isEnchanted, setEnchanted)
+    primaryMaterial = property(getPrimaryMaterial)
+    secondaryMaterial = property(getCatalystMaterial)
+    enchantment = property(getEnchantment, setEnchantment)
+    enchantmentName = property(getEnchantmentName, setEnchantmentName)
+
+    def calculateDamage(self):
+        """
+        Calculates the damage of the weapon based on the materials used and return it.
+        """
+        damage = calculateDamages([self])[0][0]
+        self.__armoury.setDamageAt(self.__checkRow(), damage)
+        return damage
+
+
+# The damage and magic damage of every (primary, catalyst) pair of materials calculated
+# so far. Materials are interned, so a pair of instances stands for the classes and
+# stats of both materials. The tables are built lazily and cleared whenever a material
+# with new stats is registered.
+damageTable = {}
+magicDamageTable = {}
+
+
+def clearDamageTables():
+    """Forgets every calculated damage, so they are calculated again on next use."""
+    damageTable.clear()
+    magicDamageTable.clear()
+
+
+# Material pairings understood by the weapon damage formulas.
+WOOD_WOOD, METAL_METAL, METAL_WOOD, WOOD_METAL = range(4)
+
+# The pairing of every (primary class, catalyst class) seen so far.
+materialPairings = {}
+
+
+def getMaterialPairing(primaryMaterial, catalystMaterial):
+    """
+    Returns the pairing of two weapon materials, classifying each pair of classes only once.
+    """
+    key = (primaryMaterial.__class__, catalystMaterial.__class__)
+    pairing = materialPairings.get(key)
+    if pairing is None:
+        if isinstance(primaryMaterial, Wood) and isinstance(catalystMaterial, Wood):
+            pairing = WOOD_WOOD
+        elif isinstance(primaryMaterial, Metal) and isinstance(catalystMaterial, Metal):
+            pairing = METAL_METAL
+        elif isinstance(primaryMaterial, Metal) and isinstance(catalystMaterial, Wood):
+            pairing = METAL_WOOD
+        elif isinstance(primaryMaterial, Wood) and isinstance(catalystMaterial, Metal):
+            pairing = WOOD_METAL
+        else:
+            raise ValueError("Invalid combination of material.")
+        materialPairings[key] = pairing
+    return pairing
+
+
+def calculateDamages(weapons):
+    """
+    Calculates the base and enchanted damage of many weapons at once.
+
+    Damage only depends on the pair of materials, so the distinct pairs missing from
+    the damage table are gathered into columns of strength and purity, grouped by
+    material pairing and each group is computed with its own expression. Every weapon
+    is then a table lookup. The results match Weapon.calculateDamage and
+    Enchantment.calculateMagicDamage exactly. Unenchanted weapons report their base
+    damage as their enchanted damage.
+
+    Returns
+    -------
+        (baseDamages, enchantedDamages): two lists in the same order as weapons.
+    """
+    if isinstance(weapons, Armoury):
+        return weapons.calculateDamages()
+    weapons = list(weapons)
+    primaries = [weapon.getPrimaryMaterial() for weapon in weapons]
+    catalysts = [weapon.getCatalystMaterial() for weapon in weapons]
+    table = dict(damageTable)
+    missing = list({pair for pair in zip(primaries, catalysts) if pair not in table})
+
+    if missing:
+        primaryStrength = [primary.strength for primary, catalyst in missing]
+        catalystStrength = [catalyst.strength for primary, catalyst in missing]
+        primaryPurity = [getattr(primary, "purity", 0) for primary, catalyst in missing]
+        catalystPurity = [getattr(catalyst, "purity", 0) for primary, catalyst in missing]
+
+        # Split the rows by material pairing.
+        groups = ([], [], [], [])
+        for i, (primary, catalyst) in enumerate(missing):
+            groups[getMaterialPairing(primary, catalyst)].append(i)
+
+        damages = [0] * len(missing)
+        for i in groups[WOOD_WOOD]:
+            damages[i] = primaryStrength[i] * catalystStrength[i]
+        for i in groups[METAL_METAL]:
+            damages[i] = (primaryStrength[i] * primaryPurity[i]) + (catalystStrength[i] * catalystPurity[i])
+        for i in groups[METAL_WOOD]:
+            damages[i] = (primaryStrength[i] * catalystStrength[i]) * primaryPurity[i]
+        for i in groups[WOOD_METAL]:
+            damages[i] = primaryStrength[i] * (catalystStrength[i] * catalystPurity[i])
+        computed = dict(zip(missing, damages))
+        damageTable.update(computed)
+        table.update(computed)
+
+    baseDamages = [table[pair] for pair in zip(primaries, catalysts)]
+    # Each distinct enchantment has its magic damage looked up once.
+    magicDamages = {None: None}
+    enchantedDamages = []
+    for weapon, baseDamage in zip(weapons, baseDamages):
+        enchantment = weapon.getEnchantment()
+        if enchantment not in magicDamages:
+            magicDamages[enchantment] = enchantment.calculateMagicDamage()
+        magicDamage = magicDamages[enchantment]
+        enchantedDamages.append(baseDamage if magicDamage is None else baseDamage * magicDamage)
+    return baseDamages, enchantedDamages
+
+
+def buildWeaponBlueprints():
+    """Returns the (primary, catalyst) materials of every weapon of the demo by name."""
+    return {
+        "Sword": [Steel(), Maple()],
+        "Shield": [Bronze(), Oak()],
+        "Axe": [Iron(), Ash()],
+        "Scythe": [Steel(), Ash()],
+        "Bow": [Oak(), Maple()],
+        "Wand": [Ash(), Oak()],
+        "Staff": [Bronze(), Maple()],
+        "Dagger": [Bronze(), Bronze()]}
+
+
+def buildEnchantmentBlueprints():
+    """Returns the (primary, catalyst) materials of every enchantment of the demo by name."""
+    return {
+        "Holy": [Diamond(), Diamond()],
+        "Lava": [Ruby(), Onyx()],
+        "Pyro": [Ruby(), Diamond()],
+        "Darkness": [Onyx(), Amethyst()],
+        "Cursed": [Onyx(), Onyx()],
+        "Hydro": [Sapphire(), Emerald()],
+        "Venomous": [Emerald(), Amethyst()],
+        "Earthly": [Emerald(), Emerald()]}
+
+
+def buildMaterials():
+    """Returns one of every material used by the demo."""
+    return [Maple(), Oak(), Ash(), Bronze(), Iron(), Steel(),
+            Ruby(), Sapphire(), Emerald(), Diamond(), Amethyst(), Onyx()]
+
+
+# The module level tables, built on first access by __getattr__ so that importing the
+# module does no work beyond defining its classes and functions.
+lazyTables = {
+    "weaponBlueprints": buildWeaponBlueprints,
+    "enchantmentBlueprints": buildEnchantmentBlueprints,
+    "materials": buildMaterials}
+
+
+def __getattr__(name):
+    """Builds a lazy module table on first access and keeps it as a module global."""
+    build = lazyTables.get(name)
+    if build is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return globals().setdefault(name, build())
+
+
+def __dir__():
+    """Lists the lazy tables alongside the module globals."""
+    return sorted(set(globals()) | set(lazyTables))
+
+
+def blueprintTables(weaponBlueprints=None, enchantmentBlueprints=None):
+    """
+    Returns the weapon and enchantment blueprint tables given, with the module tables in
+    place of any that is None. Functions default their tables to None and call this, so
+    importing their module does not build the tables.
+    """
+    module = sys.modules[__name__]
+    if weaponBlueprints is None:
+        weaponBlueprints = module.weaponBlueprints
+    if enchantmentBlueprints is None:
+        enchantmentBlueprints = module.enchantmentBlueprints
+    return weaponBlueprints, enchantmentBlueprints
+
+
+def main():
+    """Runs the demo: crafts, disassembles and enchants a set of items and prints the workshop."""
+    # Create a workshop, forge, enchanter.
+    workshop = Workshop(Forge(), Enchanter())
+    enchantedWeapons = ["Holy Greatsword", "Molten Defender", "Berserker Axe", "Soul Eater",
+        "Twisted Bow", "Wand of the Deep", "Venemous Battlestaff"]
+    # Adds a number of materials to use for crafting.
+    for material in buildMaterials():
+        if isinstance(material, Wood):
+            workshop.addMaterial(material.__class__.__name__, 20)
+        elif isinstance(material, Metal):
+            workshop.addMaterial(material.__class__.__name__, 10)
+        else:
+            workshop.addMaterial(material.__class__.__name__, 5)
+    print("--------------------------------Material Store--------------------------------")
+    print(workshop.displayMaterials())
+    # Crafts the following: Sword, Shield, Axe, Scythe, Bow, Wand and Staff weapons.
+    for weapon, materials in buildWeaponBlueprints().items():
+        craftedWeapon = workshop.forge.craft(
+            weapon, materials[0], materials[1], workshop.materials)
+        workshop.addWeapon(craftedWeapon)
+    # Disassemble the extra weapon.
+    workshop.removeWeapon(workshop.forge.disassemble(
+        workshop.weapons[7], workshop.materials))
+    print("------------------------------------Armoury-----------------------------------")
+    print(workshop.displayWeapons())
+    # Crafts the following: Holy, Lava, Pyro, Darkness, Cursed, Hydro and Venomous enchantments.
+
+    for enchantment, materials in buildEnchantmentBlueprints().items():
+        craftedEnchantment = workshop.enchanter.craft(
+            enchantment, materials[0], materials[1], workshop.materials)
+        workshop.addEnchantment(craftedEnchantment)
+    # Disassemble the extra enchantment.
+    workshop.removeEnchantment(workshop.enchanter.disassemble(
+        workshop.enchantments[7], workshop.materials))
+    print("------------------------------------Enchantments------------------------------------")
+    print(workshop.displayEnchantments())
+    print("-----------------------------------Material Store-----------------------------------")
+    print(workshop.displayMaterials())
+    # Enchant the following weapons: Sword, Shield, Axe, Scythe, Bow, Wand and Staff.
+    for i in range(len(enchantedWeapons)):
+        workshop.enchanter.enchant(
+            workshop.weapons[i], enchantedWeapons[i], workshop.enchantments[i])
+    print("-----------------------------------Enchanted Armoury----------------------------------")
+    print(workshop.displayWeapons())
+    return workshop
+
+
+# The public names of the module. The lazy tables are left out, so a star import does
+# not build them; import them by name to build them.
+__all__ = [
+    "MaterialType", "Material", "Wood", "Metal", "Gemstone", "Maple", "Ash", "Oak", "Bronze", "Iron", "Steel",
+    "Ruby", "Sapphire", "Emerald", "Diamond", "Amethyst", "Onyx",
+    "Registry", "WorkshopObserver", "Workshop", "ReportCache", "MaterialLedger", "MaterialStore",
+    "ConcurrentWorkshop", "DamageIndex", "WeaponIndex", "Crafter", "Forge", "Enchanter", "Weapon", "Enchantment",
+    "Armoury", "ArmouryWeapon",
+    "damageTable", "magicDamageTable", "clearDamageTables", "WOOD_WOOD", "METAL_METAL", "METAL_WOOD", "WOOD_METAL",
+    "materialPairings", "getMaterialPairing", "calculateDamages",
+    "buildWeaponBlueprints", "buildEnchantmentBlueprints", "buildMaterials", "blueprintTables", "main"]
+
+
+if __name__ == '__main__':
+    main()
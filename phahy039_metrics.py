@@ -0,0 +1,324 @@
+# File: phahy039_metrics.py
+# Description: opt-in instrumentation of the crafting hot paths, with per-operation
+# counters, latency histograms and material consumption, exported as a dict or in the
+# Prometheus text format.
+# Run with: python phahy039_metrics.py [crafts]
+# Author: Huyen Thi Thu Pham
+
+
+import functools
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+from phahy039_main import ArmouryWeapon, Crafter, Enchanter, Forge, Weapon, Workshop, blueprintTables
+
+
+# Upper bounds in seconds of the latency histogram buckets, from a microsecond to a second.
+defaultBuckets = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+                  1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0)
+
+# The methods timed while instrumentation is enabled, as (class, method, operation).
+# Subclasses overriding a method are listed too, under the same operation.
+instrumentedMethods = (
+    (Forge, "craft", "forge_craft"),
+    (Forge, "craftMany", "forge_craftMany"),
+    (Enchanter, "craft", "enchanter_craft"),
+    (Enchanter, "craftMany", "enchanter_craftMany"),
+    (Enchanter, "enchant", "enchanter_enchant"),
+    (Weapon, "calculateDamage", "weapon_calculateDamage"),
+    (ArmouryWeapon, "calculateDamage", "weapon_calculateDamage"),
+    (Workshop, "displayWeapons", "workshop_displayWeapons"),
+    (Workshop, "displayEnchantments", "workshop_displayEnchantments"),
+    (Workshop, "displayMaterials", "workshop_displayMaterials"))
+
+
+class Histogram:
+    """
+    Counts the latencies of one operation in fixed buckets, the way Prometheus does.
+
+    Attributes
+    ----------
+        bounds (tuple): The upper bound in seconds of every bucket, in increasing order.
+        counts (list): The number of latencies in every bucket, the last one above every bound.
+        calls (int): The number of latencies observed.
+        errors (int): The number of calls that raised an exception.
+        seconds (float): The total of the latencies observed.
+    Methods
+    -------
+        observe(self, seconds, failed=False):
+            Counts one latency.
+        cumulativeCounts(self):
+            Return the number of latencies at or below every bound.
+        quantile(self, q):
+            Return an estimate of a latency quantile.
+    """
+    def __init__(self, bounds=defaultBuckets):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def observe(self, seconds, failed=False):
+        """Counts one latency, and one error if the call failed."""
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.calls += 1
+        self.seconds += seconds
+        if failed:
+            self.errors += 1
+
+    def cumulativeCounts(self):
+        """Returns the number of latencies at or below every bound, then the total."""
+        total = 0
+        cumulative = []
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def quantile(self, q):
+        """
+        Returns an estimate of the q quantile of the latencies, interpolated linearly
+        within its bucket, or None before any latency is observed.
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("Quantile must be between 0 and 1.")
+        if not self.calls:
+            return None
+        rank = q * self.calls
+        lower = 0.0
+        for bound, below, cumulative in zip(self.bounds, [0] + self.cumulativeCounts(), self.cumulativeCounts()):
+            if cumulative >= rank and cumulative > below:
+                return lower + (bound - lower) * (rank - below) / (cumulative - below)
+            lower = bound
+        # The quantile lies above the last bound, which is the best estimate available.
+        return self.bounds[-1]
+
+
+class Instrumentation:
+    """
+    Times the crafting hot paths and counts the materials consumed by crafting.
+
+    Nothing is measured until enable() is called. Enabling replaces the methods listed
+    in instrumentedMethods with timed wrappers and disabling puts the originals back,
+    so the methods cost nothing extra while instrumentation is off. Only one
+    Instrumentation can be enabled at a time.
+
+    Attributes
+    ----------
+        __histograms (dict): The Histogram of every operation.
+        __consumed (dict): The units of every material consumed by crafting.
+        __originals (dict): The methods replaced while enabled, by (class, name).
+        __lock (threading.Lock): Guards the counters against concurrent crafters.
+        __enabledSeconds (float): The time spent enabled before the current period.
+        __enabledSince (float): When the current enabled period started, or None.
+    Methods
+    -------
+        enable(self):
+            Start measuring.
+        disable(self):
+            Stop measuring, keeping the measurements.
+        isEnabled(self):
+            Return whether the instrumentation is measuring.
+        reset(self):
+            Forget every measurement.
+        elapsed(self):
+            Return the seconds spent enabled.
+        histogram(self, operation):
+            Return the Histogram of an operation.
+        toDict(self):
+            Return the measurements as a dict.
+        toPrometheus(self, prefix="phahy039"):
+            Return the measurements in the Prometheus text format.
+    """
+    # The instance currently enabled, as the methods can only be wrapped once.
+    active = None
+
+    def __init__(self, buckets=defaultBuckets):
+        self.__buckets = tuple(buckets)
+        self.__histograms = {}
+        self.__consumed = {}
+        self.__originals = {}
+        self.__lock = threading.Lock()
+        self.__enabledSeconds = 0.0
+        self.__enabledSince = None
+        self.reset()
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    def reset(self):
+        """Forgets every measurement."""
+        with self.__lock:
+            self.__histograms = {operation: Histogram(self.__buckets) for _, _, operation in instrumentedMethods}
+            self.__consumed = {}
+            self.__enabledSeconds = 0.0
+            if self.__enabledSince is not None:
+                self.__enabledSince = time.perf_counter()
+
+    def isEnabled(self):
+        """Returns whether the instrumentation is measuring."""
+        return self.__enabledSince is not None
+
+    def enable(self):
+        """Wraps the instrumented methods with timers."""
+        if Instrumentation.active is self:
+            return
+        if Instrumentation.active is not None:
+            raise ValueError("Another instrumentation is already enabled.")
+        for cls, name, operation in instrumentedMethods:
+            method = cls.__dict__[name]
+            self.__originals[(cls, name)] = method
+            setattr(cls, name, self.__timed(operation, method))
+        Instrumentation.active = self
+        self.__enabledSince = time.perf_counter()
+
+    def disable(self):
+        """Puts the original methods back. The measurements are kept."""
+        if Instrumentation.active is not self:
+            return
+        for (cls, name), method in self.__originals.items():
+            setattr(cls, name, method)
+        self.__originals.clear()
+        Instrumentation.active = None
+        self.__enabledSeconds += time.perf_counter() - self.__enabledSince
+        self.__enabledSince = None
+
+    def elapsed(self):
+        """Returns the seconds spent enabled since the last reset."""
+        if self.__enabledSince is None:
+            return self.__enabledSeconds
+        return self.__enabledSeconds + time.perf_counter() - self.__enabledSince
+
+    def histogram(self, operation):
+        """Returns the Histogram of an operation."""
+        return self.__histograms[operation]
+
+    def __timed(self, operation, method):
+        """Returns method wrapped to time its calls and count the materials it consumes."""
+        lock = self.__lock
+        perfCounter = time.perf_counter
+        consumption = {"craft": self.__consumedByCraft, "craftMany": self.__consumedByCraftMany}.get(method.__name__)
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            start = perfCounter()
+            try:
+                result = method(*args, **kwargs)
+            except BaseException:
+                seconds = perfCounter() - start
+                with lock:
+                    self.__histograms[operation].observe(seconds, True)
+                raise
+            seconds = perfCounter() - start
+            with lock:
+                self.__histograms[operation].observe(seconds)
+                if consumption is not None:
+                    consumption(*args, **kwargs)
+            return result
+        return timed
+
+    def __consume(self, demand, times=1):
+        """Adds a demand of {materialName: quantity} consumed times over."""
+        for materialName, quantity in demand.items():
+            self.__consumed[materialName] = self.__consumed.get(materialName, 0) + quantity * times
+
+    def __consumedByCraft(self, crafter, name, primaryMaterial, catalystMaterial, materials):
+        self.__consume(Crafter.demandOf(primaryMaterial, catalystMaterial))
+
+    def __consumedByCraftMany(self, crafter, blueprints, counts, materials):
+        for name, count in counts.items():
+            self.__consume(Crafter.demandOf(*blueprints[name]), count)
+
+    def toDict(self):
+        """
+        Returns the measurements as a dict of the "elapsed" seconds spent enabled, the
+        "operations" and the "materials".
+
+        Every operation has its "calls", "errors", total "seconds", "mean", estimated
+        "p50" and "p99" latencies and its cumulative "buckets" as (bound, count) pairs,
+        the last bound being infinity. Every material has the units "consumed" and its
+        consumption "rate" in units per second.
+        """
+        elapsed = self.elapsed()
+        with self.__lock:
+            operations = {}
+            for operation, histogram in self.__histograms.items():
+                operations[operation] = {
+                    "calls": histogram.calls,
+                    "errors": histogram.errors,
+                    "seconds": histogram.seconds,
+                    "mean": histogram.seconds / histogram.calls if histogram.calls else None,
+                    "p50": histogram.quantile(0.5),
+                    "p99": histogram.quantile(0.99),
+                    "buckets": list(zip(histogram.bounds + (float("inf"),), histogram.cumulativeCounts()))}
+            materials = {materialName: {"consumed": consumed, "rate": consumed / elapsed if elapsed else 0.0}
+                         for materialName, consumed in sorted(self.__consumed.items())}
+        return {"elapsed": elapsed, "operations": operations, "materials": materials}
+
+    def toPrometheus(self, prefix="phahy039"):
+        """Returns the measurements in the Prometheus text exposition format."""
+        lines = [f"# HELP {prefix}_operation_seconds Latency of the crafting operations.",
+                 f"# TYPE {prefix}_operation_seconds histogram"]
+        with self.__lock:
+            histograms = list(self.__histograms.items())
+            consumed = sorted(self.__consumed.items())
+            for operation, histogram in histograms:
+                label = f'operation="{operation}"'
+                for bound, count in zip(histogram.bounds + (float("inf"),), histogram.cumulativeCounts()):
+                    bound = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{prefix}_operation_seconds_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f"{prefix}_operation_seconds_sum{{{label}}} {histogram.seconds!r}")
+                lines.append(f"{prefix}_operation_seconds_count{{{label}}} {histogram.calls}")
+            lines.append(f"# HELP {prefix}_operation_errors_total Crafting operations that raised an exception.")
+            lines.append(f"# TYPE {prefix}_operation_errors_total counter")
+            for operation, histogram in histograms:
+                lines.append(f'{prefix}_operation_errors_total{{operation="{operation}"}} {histogram.errors}')
+        lines.append(f"# HELP {prefix}_materials_consumed_total Material units consumed by crafting.")
+        lines.append(f"# TYPE {prefix}_materials_consumed_total counter")
+        for materialName, units in consumed:
+            lines.append(f'{prefix}_materials_consumed_total{{material="{materialName}"}} {units}')
+        lines.append(f"# HELP {prefix}_instrumentation_enabled_seconds Seconds spent measuring.")
+        lines.append(f"# TYPE {prefix}_instrumentation_enabled_seconds counter")
+        lines.append(f"{prefix}_instrumentation_enabled_seconds {self.elapsed()!r}")
+        return "\n".join(lines) + "\n"
+
+
+def craftSession(crafts):
+    """Crafts, enchants and displays weapons the way a game session would and returns the seconds it took."""
+    weaponBlueprints, enchantmentBlueprints = blueprintTables()
+    workshop = Workshop(Forge(), Enchanter())
+    weapons = list(weaponBlueprints.items())
+    enchantments = list(enchantmentBlueprints.items())
+    for _, blueprint in weapons + enchantments:
+        for material in blueprint:
+            workshop.addMaterial(material.__class__.__name__, crafts)
+    start = time.perf_counter()
+    for i in range(crafts):
+        name, (primaryMaterial, catalystMaterial) = weapons[i % len(weapons)]
+        weapon = workshop.forge.craft(name, primaryMaterial, catalystMaterial, workshop.materials)
+        workshop.addWeapon(weapon)
+        if i % 2:
+            name, (primaryMaterial, catalystMaterial) = enchantments[i % len(enchantments)]
+            enchantment = workshop.enchanter.craft(name, primaryMaterial, catalystMaterial, workshop.materials)
+            workshop.enchanter.enchant(weapon, f"{name} {weapon.name}", enchantment)
+    workshop.displayWeapons()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    crafts = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    plain = min(craftSession(crafts) for _ in range(3))
+    instrumentation = Instrumentation()
+    with instrumentation:
+        instrumented = min(craftSession(crafts) for _ in range(3))
+    disabled = min(craftSession(crafts) for _ in range(3))
+    print(instrumentation.toPrometheus(), end="")
+    print(f"# {crafts} crafts: {plain:.3f} s plain, {instrumented:.3f} s instrumented, "
+          f"{disabled:.3f} s after disabling")
@@ -0,0 +1,254 @@
+# File: phahy039_optimizer.py
+# Description: chooses which weapons and enchantments to craft from a material stock, and
+# which enchantment goes on which weapon, to maximise the total enchanted damage.
+# Run with: python phahy039_optimizer.py [stockPerMaterial]
+# Author: Huyen Thi Thu Pham
+
+
+import math
+import sys
+import time
+
+from phahy039_main import Enchantment, Weapon, blueprintTables
+
+
+# Tolerance of the floating point comparisons made by the simplex method.
+EPSILON = 1e-9
+
+
+def maximise(objective, constraints, limits):
+    """
+    Solves the linear programme: maximise objective . x subject to constraints x <= limits
+    and x >= 0, where every limit is non-negative, with the simplex method and Bland's
+    rule. Returns the optimal value and x.
+    """
+    rows, columns = len(constraints), len(objective)
+    tableau = [list(map(float, constraints[row])) + [1.0 if slack == row else 0.0 for slack in range(rows)]
+               + [float(limits[row])] for row in range(rows)]
+    costs = [-float(value) for value in objective] + [0.0] * (rows + 1)
+    basis = [columns + row for row in range(rows)]
+
+    while True:
+        # Bland's rule: the lowest variable that improves the objective enters.
+        entering = next((column for column in range(columns + rows) if costs[column] < -EPSILON), None)
+        if entering is None:
+            break
+        leaving = None
+        for row in range(rows):
+            coefficient = tableau[row][entering]
+            if coefficient > EPSILON:
+                ratio = tableau[row][-1] / coefficient
+                if (leaving is None or ratio < bestRatio - EPSILON
+                        or (ratio <= bestRatio + EPSILON and basis[row] < basis[leaving])):
+                    leaving, bestRatio = row, ratio
+        if leaving is None:
+            raise ValueError("The linear programme is unbounded.")
+
+        pivotRow = tableau[leaving]
+        pivot = pivotRow[entering]
+        pivotRow[:] = [value / pivot for value in pivotRow]
+        for row in tableau:
+            if row is not pivotRow and abs(row[entering]) > EPSILON:
+                factor = row[entering]
+                row[:] = [value - factor * pivotValue for value, pivotValue in zip(row, pivotRow)]
+        factor = costs[entering]
+        costs[:] = [value - factor * pivotValue for value, pivotValue in zip(costs, pivotRow)]
+        basis[leaving] = entering
+
+    solution = [0.0] * columns
+    for row, variable in enumerate(basis):
+        if variable < columns:
+            solution[variable] = tableau[row][-1]
+    return costs[-1], solution
+
+
+def maximiseIntegers(objective, constraints, limits, incumbent=None, maxNodes=500):
+    """
+    Solves the linear programme of maximise() over whole numbers by branch and bound.
+
+    constraints must be non-negative, as material usage is. incumbent is a known whole
+    number solution to start from. The search stops after maxNodes linear programmes.
+    Returns the best value found, its solution, the best upper bound and whether the
+    solution was proven optimal.
+    """
+    columns = len(objective)
+    if incumbent is None:
+        incumbent = [0] * columns
+    bestValue = sum(value * count for value, count in zip(objective, incumbent))
+    bestSolution = list(incumbent)
+    nodes = 0
+    exhausted = True
+    rootBound = None
+    stack = [([0] * columns, [None] * columns)]
+
+    while stack:
+        if nodes >= maxNodes:
+            exhausted = False
+            break
+        lower, upper = stack.pop()
+        nodes += 1
+        # Shift the variables by their lower bounds and add a row for each upper bound.
+        shifted = [limit - sum(usage * low for usage, low in zip(row, lower))
+                   for row, limit in zip(constraints, limits)]
+        if any(limit < -EPSILON for limit in shifted):
+            continue
+        rows = [list(row) for row in constraints]
+        rowLimits = [max(0.0, limit) for limit in shifted]
+        for column, high in enumerate(upper):
+            if high is not None:
+                rows.append([1 if other == column else 0 for other in range(columns)])
+                rowLimits.append(high - lower[column])
+        value, solution = maximise(objective, rows, rowLimits)
+        solution = [low + amount for low, amount in zip(lower, solution)]
+        value += sum(cost * low for cost, low in zip(objective, lower))
+        if rootBound is None:
+            rootBound = value
+        if value <= bestValue + EPSILON:
+            continue
+
+        fractions = [(abs(amount - round(amount)), column) for column, amount in enumerate(solution)
+                     if abs(amount - round(amount)) > 1e-6]
+        if not fractions:
+            bestValue, bestSolution = value, [round(amount) for amount in solution]
+            continue
+        # Branch on the most fractional variable, exploring the rounded up side first.
+        _, column = max(fractions)
+        down, up = list(upper), list(lower)
+        down[column] = math.floor(solution[column])
+        up[column] = math.ceil(solution[column])
+        stack.append((lower, down))
+        stack.append((up, upper))
+
+    upperBound = rootBound if rootBound is not None else bestValue
+    return bestValue, bestSolution, max(upperBound, bestValue), exhausted
+
+
+def blueprintDamages(weaponBlueprints, enchantmentBlueprints):
+    """Returns the base damage of every weapon blueprint and the magic damage of every enchantment blueprint."""
+    weaponDamages = {}
+    for name, (primaryMaterial, catalystMaterial) in weaponBlueprints.items():
+        try:
+            weaponDamages[name] = Weapon(name, primaryMaterial, catalystMaterial).calculateDamage()
+        except ValueError:
+            # A blueprint that cannot be forged never joins a loadout.
+            continue
+    magicDamages = {name: Enchantment(name, primaryMaterial, catalystMaterial, "").calculateMagicDamage()
+                    for name, (primaryMaterial, catalystMaterial) in enchantmentBlueprints.items()}
+    return weaponDamages, magicDamages
+
+
+def planLoadout(materials, weaponBlueprints=None, enchantmentBlueprints=None, maxNodes=500):
+    """
+    Chooses how many of each weapon and enchantment to craft from a material stock, and
+    how to pair them, to maximise the total damage of the enchanted weapons.
+
+    Every (weapon blueprint, enchantment blueprint) pair is a whole number variable using
+    the materials of both and dealing their base damage times their magic damage. The
+    integer programme is solved by branch and bound over its linear relaxation, starting
+    from the rounded down relaxation topped up greedily with the strongest pairs that
+    still fit. With thousands of units in stock the relaxation is almost whole, so the
+    search is short.
+
+    Returns a dict of the crafted "pairs", "weapons" and "enchantments" counts, the
+    "totalDamage", an "upperBound" on the best total damage and whether the plan is
+    "optimal".
+    """
+    weaponBlueprints, enchantmentBlueprints = blueprintTables(weaponBlueprints, enchantmentBlueprints)
+    weaponDamages, magicDamages = blueprintDamages(weaponBlueprints, enchantmentBlueprints)
+    pairs = [(weaponName, enchantmentName) for weaponName in weaponDamages for enchantmentName in magicDamages]
+    materialNames = sorted({material.__class__.__name__
+                            for blueprints in (weaponBlueprints, enchantmentBlueprints)
+                            for blueprint in blueprints.values() for material in blueprint})
+    objective = [weaponDamages[weaponName] * magicDamages[enchantmentName] for weaponName, enchantmentName in pairs]
+    constraints = []
+    for materialName in materialNames:
+        row = []
+        for weaponName, enchantmentName in pairs:
+            used = weaponBlueprints[weaponName] + enchantmentBlueprints[enchantmentName]
+            row.append(sum(1 for material in used if material.__class__.__name__ == materialName))
+        constraints.append(row)
+    limits = [max(0, materials.get(materialName, 0)) for materialName in materialNames]
+
+    # Start from the rounded down relaxation and greedily add the strongest pairs that fit.
+    _, relaxed = maximise(objective, constraints, limits)
+    incumbent = [math.floor(amount + 1e-6) for amount in relaxed]
+    remaining = [limit - sum(usage * count for usage, count in zip(row, incumbent))
+                 for row, limit in zip(constraints, limits)]
+    for column in sorted(range(len(pairs)), key=lambda column: -objective[column]):
+        fits = min((remaining[row] // constraints[row][column]
+                    for row in range(len(constraints)) if constraints[row][column]), default=0)
+        if fits > 0:
+            incumbent[column] += fits
+            for row in range(len(constraints)):
+                remaining[row] -= constraints[row][column] * fits
+
+    totalDamage, counts, upperBound, optimal = maximiseIntegers(objective, constraints, limits, incumbent, maxNodes)
+    plan = {"pairs": {}, "weapons": {}, "enchantments": {}}
+    for (weaponName, enchantmentName), count in zip(pairs, counts):
+        if count:
+            plan["pairs"][(weaponName, enchantmentName)] = count
+            plan["weapons"][weaponName] = plan["weapons"].get(weaponName, 0) + count
+            plan["enchantments"][enchantmentName] = plan["enchantments"].get(enchantmentName, 0) + count
+    plan["totalDamage"] = totalDamage
+    plan["upperBound"] = upperBound
+    plan["optimal"] = optimal
+    return plan
+
+
+def pairInventory(weapons, enchantments):
+    """
+    Pairs already crafted weapons with enchantments to maximise their total enchanted
+    damage and returns the list of (weapon, enchantment) pairs.
+
+    Damage is positive, so by the rearrangement inequality the best assignment gives the
+    strongest enchantment to the strongest weapon, the second to the second and so on.
+    """
+    weapons = sorted(weapons, key=lambda weapon: weapon.calculateDamage(), reverse=True)
+    enchantments = sorted(enchantments, key=lambda enchantment: enchantment.calculateMagicDamage(), reverse=True)
+    return list(zip(weapons, enchantments))
+
+
+def craftLoadout(workshop, plan, weaponBlueprints=None, enchantmentBlueprints=None):
+    """
+    Crafts a loadout plan in a workshop, all or nothing, enchants each weapon with the
+    enchantment it is paired with and returns the enchanted weapons.
+    """
+    weaponBlueprints, enchantmentBlueprints = blueprintTables(weaponBlueprints, enchantmentBlueprints)
+    weapons = workshop.forge.craftMany(weaponBlueprints, plan["weapons"], workshop.materials)
+    try:
+        enchantments = workshop.enchanter.craftMany(enchantmentBlueprints, plan["enchantments"], workshop.materials)
+    except ValueError:
+        for weapon in weapons:
+            workshop.forge.disassemble(weapon, workshop.materials)
+        raise
+    for weapon in weapons:
+        workshop.addWeapon(weapon)
+    for enchantment in enchantments:
+        workshop.addEnchantment(enchantment)
+
+    weaponsByName = {}
+    for weapon in weapons:
+        weaponsByName.setdefault(weapon.name, []).append(weapon)
+    enchantmentsByName = {}
+    for enchantment in enchantments:
+        enchantmentsByName.setdefault(enchantment.name, []).append(enchantment)
+    for (weaponName, enchantmentName), count in plan["pairs"].items():
+        for _ in range(count):
+            weapon = weaponsByName[weaponName].pop()
+            workshop.enchanter.enchant(weapon, weapon.name, enchantmentsByName[enchantmentName].pop())
+    return weapons
+
+
+if __name__ == '__main__':
+    quantity = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    stock = {material.__class__.__name__: quantity
+             for blueprints in blueprintTables()
+             for blueprint in blueprints.values() for material in blueprint}
+    start = time.perf_counter()
+    plan = planLoadout(stock)
+    elapsed = time.perf_counter() - start
+    print(f"Loadout for {quantity} units of every material, planned in {elapsed:.3f} s:")
+    for (weaponName, enchantmentName), count in sorted(plan["pairs"].items(), key=lambda item: -item[1]):
+        print(f"    {count:8d} x {enchantmentName} {weaponName}")
+    print(f"    total damage {plan['totalDamage']:.2f}, upper bound {plan['upperBound']:.2f}, "
+          f"optimal={plan['optimal']}")
@@ -0,0 +1,287 @@
+# File: phahy039_planner.py
+# Description: plans large crafting orders through the refining, forging, enchanting and
+# recycling stages and schedules the work on a limited number of stations.
+# Run with: python phahy039_planner.py [count] [forges] [enchanters] [refineries]
+# Author: Huyen Thi Thu Pham
+
+
+import sys
+import time
+from collections import deque
+from heapq import heappop, heappush
+
+from phahy039_main import blueprintTables
+
+
+# The station every kind of task runs on.
+taskStations = {
+    "refine": "refinery",
+    "disassemble": "forge",
+    "forge": "forge",
+    "craftEnchantment": "enchanter",
+    "enchant": "enchanter"}
+
+# The time every kind of task takes on its station, in arbitrary time units.
+defaultDurations = {"refine": 1, "disassemble": 2, "forge": 5, "craftEnchantment": 4, "enchant": 3}
+
+# The number of stations of every kind.
+defaultStations = {"refinery": 2, "forge": 4, "enchanter": 2}
+
+
+def parseOrder(order, weaponBlueprints=None, enchantmentBlueprints=None):
+    """
+    Returns an order as {(weaponName, enchantmentName): count}, with an enchantmentName
+    of None for bare weapons.
+
+    The items of an order are named like a weapon blueprint ("Sword"), an enchantment
+    followed by a weapon ("Holy Sword") or given as (weaponName, enchantmentName) pairs.
+    """
+    weaponBlueprints, enchantmentBlueprints = blueprintTables(weaponBlueprints, enchantmentBlueprints)
+    parsed = {}
+    for item, count in order.items():
+        if count < 0:
+            raise ValueError("Order counts cannot be negative.")
+        if isinstance(item, tuple):
+            weaponName, enchantmentName = item
+        elif item in weaponBlueprints:
+            weaponName, enchantmentName = item, None
+        else:
+            enchantmentName, _, weaponName = item.partition(" ")
+        if weaponName not in weaponBlueprints or (enchantmentName is not None
+                                                  and enchantmentName not in enchantmentBlueprints):
+            raise ValueError(f"Unknown item in order: {item}.")
+        if count:
+            parsed[(weaponName, enchantmentName)] = parsed.get((weaponName, enchantmentName), 0) + count
+    return parsed
+
+
+def recipeGraph(order, weaponBlueprints=None, enchantmentBlueprints=None):
+    """
+    Returns the dependency DAG of an order as {node: {inputNode: quantity}}, listed so
+    that every node comes after its inputs.
+
+    An enchanted weapon is made of its weapon and its enchantment, those of refined
+    materials and every refined material of one unit of the raw material.
+    """
+    weaponBlueprints, enchantmentBlueprints = blueprintTables(weaponBlueprints, enchantmentBlueprints)
+    graph = {}
+
+    def addNode(node, inputs):
+        for inputNode in inputs:
+            if inputNode not in graph:
+                raise ValueError(f"Input {inputNode} is not planned before {node}.")
+        graph.setdefault(node, inputs)
+
+    def materialInputs(blueprint):
+        inputs = {}
+        for material in blueprint:
+            materialName = material.__class__.__name__
+            addNode(materialName, {})
+            addNode(f"refined {materialName}", {materialName: 1})
+            inputs[f"refined {materialName}"] = inputs.get(f"refined {materialName}", 0) + 1
+        return inputs
+
+    for weaponName, enchantmentName in parseOrder(order, weaponBlueprints, enchantmentBlueprints):
+        addNode(weaponName, materialInputs(weaponBlueprints[weaponName]))
+        if enchantmentName is not None:
+            addNode(enchantmentName, materialInputs(enchantmentBlueprints[enchantmentName]))
+            addNode(f"{enchantmentName} {weaponName}", {weaponName: 1, enchantmentName: 1})
+    return graph
+
+
+def materialRequirements(order, weaponBlueprints=None, enchantmentBlueprints=None):
+    """Returns the raw {materialName: units} needed to craft an order."""
+    weaponBlueprints, enchantmentBlueprints = blueprintTables(weaponBlueprints, enchantmentBlueprints)
+    graph = recipeGraph(order, weaponBlueprints, enchantmentBlueprints)
+    demand = {}
+    for (weaponName, enchantmentName), count in parseOrder(order, weaponBlueprints, enchantmentBlueprints).items():
+        node = weaponName if enchantmentName is None else f"{enchantmentName} {weaponName}"
+        demand[node] = demand.get(node, 0) + count
+    # Demand flows from every node to its inputs, visiting the nodes after everything using them.
+    for node in reversed(list(graph)):
+        for inputNode, quantity in graph[node].items():
+            demand[inputNode] = demand.get(inputNode, 0) + demand.get(node, 0) * quantity
+    return {node: units for node, units in demand.items() if not graph[node] and units}
+
+
+class ProductionPlanner:
+    """
+    Plans crafting orders and schedules their tasks on refinery, forge and enchanter stations.
+
+    Every unit of an order is broken into tasks: each material unit is refined, or taken
+    from a recycled weapon, the weapon is forged, its enchantment crafted and the weapon
+    enchanted. Recycled weapons are disassembled on a forge. The tasks are scheduled by
+    list scheduling: whenever a station is free it takes the ready task of its kind with
+    the longest chain of work still behind it. Work on busier kinds of station counts for
+    more, so the tasks feeding the bottleneck go first and it is rarely left idle.
+
+    Attributes
+    ----------
+        stations (dict): The number of stations of every kind.
+        durations (dict): The time every kind of task takes.
+        weaponBlueprints (dict): The [primary, catalyst] materials of every weapon.
+        enchantmentBlueprints (dict): The [primary, catalyst] materials of every enchantment.
+    Methods
+    -------
+        plan(self, order, stock=None, recycle=None):
+            Return the requirements, schedule and bottlenecks of an order.
+    """
+    def __init__(self, stations=None, durations=None, weaponBlueprints=None, enchantmentBlueprints=None):
+        self.stations = dict(defaultStations, **(stations or {}))
+        self.durations = dict(defaultDurations, **(durations or {}))
+        if any(count < 1 for count in self.stations.values()):
+            raise ValueError("Every kind of station needs at least one station.")
+        if any(duration < 0 for duration in self.durations.values()):
+            raise ValueError("Task durations cannot be negative.")
+        self.weaponBlueprints, self.enchantmentBlueprints = blueprintTables(weaponBlueprints, enchantmentBlueprints)
+
+    def plan(self, order, stock=None, recycle=None):
+        """
+        Plans an order, given as for parseOrder, and returns a dict of:
+
+            "requirements": the raw {materialName: units} the order needs,
+            "recovered": the units recovered from the recycled weapons,
+            "shortfall": the units still missing from the stock, if one is given,
+            "tasks": the number of tasks,
+            "makespan": the time the last task ends,
+            "lowerBound": no schedule can be shorter than this,
+            "stations": the "count", "busy" time and "utilisation" of every kind of station,
+            "bottleneck": the kind of station with the highest utilisation,
+            "schedule": a list of (start, end, station, stationNumber, task, item) in start order.
+
+        recycle is a {weaponName: count} of weapons to disassemble, whose materials are
+        used before any is refined.
+        """
+        parsed = parseOrder(order, self.weaponBlueprints, self.enchantmentBlueprints)
+        requirements = materialRequirements(order, self.weaponBlueprints, self.enchantmentBlueprints)
+        kinds, items, predecessors = [], [], []
+
+        def addTask(kind, item, inputs=()):
+            kinds.append(kind)
+            items.append(item)
+            predecessors.append(inputs)
+            return len(kinds) - 1
+
+        # The disassembly tasks supply the first units of their materials.
+        recovered = {}
+        pools = {}
+        for weaponName, count in (recycle or {}).items():
+            if weaponName not in self.weaponBlueprints:
+                raise ValueError(f"Unknown weapon to recycle: {weaponName}.")
+            for _ in range(count):
+                task = addTask("disassemble", weaponName)
+                for material in self.weaponBlueprints[weaponName]:
+                    materialName = material.__class__.__name__
+                    pools.setdefault(materialName, deque()).append(task)
+                    recovered[materialName] = recovered.get(materialName, 0) + 1
+
+        def supply(blueprint):
+            tasks = []
+            for material in blueprint:
+                materialName = material.__class__.__name__
+                pool = pools.get(materialName)
+                tasks.append(pool.popleft() if pool else addTask("refine", materialName))
+            return tuple(tasks)
+
+        for (weaponName, enchantmentName), count in parsed.items():
+            for _ in range(count):
+                weapon = addTask("forge", weaponName, supply(self.weaponBlueprints[weaponName]))
+                if enchantmentName is not None:
+                    enchantment = addTask("craftEnchantment", enchantmentName,
+                                          supply(self.enchantmentBlueprints[enchantmentName]))
+                    addTask("enchant", f"{enchantmentName} {weaponName}", (weapon, enchantment))
+
+        plan = self.__schedule(kinds, items, predecessors)
+        plan["requirements"] = requirements
+        plan["recovered"] = recovered
+        if stock is not None:
+            plan["shortfall"] = {materialName: units - recovered.get(materialName, 0) - stock.get(materialName, 0)
+                                 for materialName, units in requirements.items()
+                                 if units - recovered.get(materialName, 0) > stock.get(materialName, 0)}
+        return plan
+
+    def __schedule(self, kinds, items, predecessors):
+        """List schedules the tasks, which are listed after all of their predecessors."""
+        count = len(kinds)
+        durations = [self.durations[kind] for kind in kinds]
+        successors = [[] for _ in range(count)]
+        pending = [len(inputs) for inputs in predecessors]
+        for task, inputs in enumerate(predecessors):
+            for inputTask in inputs:
+                successors[inputTask].append(task)
+        # The rank of a task is the length of the longest chain of work from its start,
+        # each task weighted by how loaded its kind of station is, so work feeding the
+        # busiest stations goes first. The unweighted lengths give the critical path.
+        work = dict.fromkeys(self.stations, 0)
+        for task in range(count):
+            work[taskStations[kinds[task]]] += durations[task]
+        loads = {station: work[station] / self.stations[station] for station in work}
+        heaviest = max(loads.values()) or 1
+        weights = [loads[taskStations[kind]] / heaviest for kind in kinds]
+        ranks = [duration * weight for duration, weight in zip(durations, weights)]
+        lengths = durations[:]
+        for task in range(count - 1, -1, -1):
+            if successors[task]:
+                ranks[task] += max(ranks[successor] for successor in successors[task])
+                lengths[task] += max(lengths[successor] for successor in successors[task])
+
+        stationKinds = list(self.stations)
+        ready = {station: [] for station in stationKinds}
+        freeStations = {station: list(range(self.stations[station])) for station in stationKinds}
+        busy = dict.fromkeys(stationKinds, 0)
+        for task in range(count):
+            if not pending[task]:
+                heappush(ready[taskStations[kinds[task]]], (-ranks[task], task))
+        running = []
+        schedule = []
+        now = 0
+        while True:
+            for station in stationKinds:
+                queue, free = ready[station], freeStations[station]
+                while queue and free:
+                    _, task = heappop(queue)
+                    number = heappop(free)
+                    end = now + durations[task]
+                    heappush(running, (end, task, station, number))
+                    schedule.append((now, end, station, number, kinds[task], items[task]))
+                    busy[station] += durations[task]
+            if not running:
+                break
+            # Every task ending at the next event time frees its station before any is assigned.
+            now = running[0][0]
+            while running and running[0][0] == now:
+                _, task, station, number = heappop(running)
+                heappush(freeStations[station], number)
+                for successor in successors[task]:
+                    pending[successor] -= 1
+                    if not pending[successor]:
+                        heappush(ready[taskStations[kinds[successor]]], (-ranks[successor], successor))
+
+        makespan = now
+        lowerBound = max([max(lengths, default=0)] + list(loads.values()))
+        stations = {station: {"count": self.stations[station], "busy": busy[station],
+                              "utilisation": busy[station] / (self.stations[station] * makespan) if makespan else 0.0}
+                    for station in stationKinds}
+        return {"tasks": count, "makespan": makespan, "lowerBound": lowerBound, "stations": stations,
+                "bottleneck": max(stationKinds, key=lambda station: stations[station]["utilisation"]),
+                "schedule": schedule}
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    stations = {"forge": int(sys.argv[2]) if len(sys.argv) > 2 else 4,
+                "enchanter": int(sys.argv[3]) if len(sys.argv) > 3 else 2,
+                "refinery": int(sys.argv[4]) if len(sys.argv) > 4 else 2}
+    planner = ProductionPlanner(stations)
+    start = time.perf_counter()
+    plan = planner.plan({"Holy Sword": count}, stock={"Steel": count, "Maple": count}, recycle={"Scythe": count // 10})
+    elapsed = time.perf_counter() - start
+    print(f"{count} Holy Swords, {plan['tasks']} tasks planned in {elapsed:.3f} s")
+    print(f"    requirements {plan['requirements']}")
+    print(f"    recovered    {plan['recovered']}")
+    print(f"    shortfall    {plan['shortfall']}")
+    print(f"    makespan {plan['makespan']}, lower bound {plan['lowerBound']:.1f}")
+    for station, usage in plan["stations"].items():
+        print(f"    {station:<10}{usage['count']:4d} stations  busy {usage['busy']:8d}  "
+              f"utilisation {usage['utilisation']:6.1%}")
+    print(f"    bottleneck: {plan['bottleneck']}")
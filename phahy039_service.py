@@ -0,0 +1,230 @@
+# File: phahy039_service.py
+# Description: an asyncio crafting service that serves many game clients from one workshop,
+# and a local load generator reporting its latency and throughput.
+# Run with: python phahy039_service.py [clients] [requestsPerClient]
+# Author: Huyen Thi Thu Pham
+
+
+import asyncio
+import sys
+import time
+
+from phahy039_main import Enchanter, Forge, Workshop, blueprintTables
+
+
+class CraftingService:
+    """
+    An asyncio front-end serving crafting requests for a Workshop.
+
+    Clients await coroutines while a single worker task crafts on their behalf, so the
+    workshop is only ever used from one place. Requests wait in a bounded queue and
+    clients are held back while it is full. Whenever the worker picks up requests it
+    drains everything already waiting, and requests for the same blueprint share one
+    batched craftMany call.
+
+    Attributes
+    ----------
+        workshop (Workshop): The workshop crafted items are stored in.
+        __forge (Forge): The forge crafting weapons into the workshop.
+        __enchanter (Enchanter): The enchanter crafting enchantments into the workshop.
+        __weaponBlueprints (dict): The weapon blueprints by name.
+        __enchantmentBlueprints (dict): The enchantment blueprints by name.
+        __queue (asyncio.Queue): The bounded queue of pending requests.
+        __maxBatch (int): The most requests handled by one pass of the worker.
+        __worker (asyncio.Task): The worker task while the service runs.
+
+    Methods
+    -------
+        start(self), stop(self):
+            Start or stop the worker, stop finishes the requests already queued.
+        craftWeapon(self, name):
+            Craft a weapon from its blueprint.
+        craftEnchantment(self, name):
+            Craft an enchantment from its blueprint.
+        enchant(self, weapon, enchantmentName, enchantment):
+            Imbue a weapon with an enchantment.
+    """
+    def __init__(self, workshop, weaponBlueprints=None, enchantmentBlueprints=None, maxQueue=1024, maxBatch=512):
+        self.workshop = workshop
+        self.__forge = Forge(workshop)
+        self.__enchanter = Enchanter(workshop)
+        self.__weaponBlueprints, self.__enchantmentBlueprints = blueprintTables(weaponBlueprints,
+                                                                                enchantmentBlueprints)
+        self.__queue = asyncio.Queue(maxQueue)
+        self.__maxBatch = maxBatch
+        self.__worker = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def start(self):
+        """Starts the worker task."""
+        if self.__worker is None:
+            self.__worker = asyncio.get_running_loop().create_task(self.__work())
+
+    async def stop(self):
+        """Finishes the requests already queued and stops the worker task."""
+        if self.__worker is not None:
+            await self.__queue.join()
+            self.__worker.cancel()
+            try:
+                await self.__worker
+            except asyncio.CancelledError:
+                pass
+            self.__worker = None
+
+    async def __submit(self, kind, *args):
+        future = asyncio.get_running_loop().create_future()
+        # Waits while the queue is full, holding the client back.
+        await self.__queue.put((kind, args, future))
+        return await future
+
+    async def craftWeapon(self, name):
+        """Crafts a weapon from its blueprint and returns it."""
+        return await self.__submit("weapon", name)
+
+    async def craftEnchantment(self, name):
+        """Crafts an enchantment from its blueprint and returns it."""
+        return await self.__submit("enchantment", name)
+
+    async def enchant(self, weapon, enchantmentName, enchantment):
+        """Imbues a weapon with an enchantment and returns the weapon."""
+        return await self.__submit("enchant", weapon, enchantmentName, enchantment)
+
+    async def __work(self):
+        while True:
+            requests = [await self.__queue.get()]
+            while len(requests) < self.__maxBatch and not self.__queue.empty():
+                requests.append(self.__queue.get_nowait())
+            try:
+                self.__handle(requests)
+            except Exception as error:
+                # The worker keeps serving, the requests left unanswered fail with the error.
+                for _, _, future in requests:
+                    if not future.done():
+                        future.set_exception(error)
+            finally:
+                for _ in requests:
+                    self.__queue.task_done()
+            # Let the clients whose requests were answered run before the next batch.
+            await asyncio.sleep(0)
+
+    def __handle(self, requests):
+        # Coalesce the craft requests by blueprint, keeping the order they arrived in.
+        groups = {}
+        for kind, args, future in requests:
+            if kind == "enchant":
+                self.__answer(future, self.__enchantWeapon, *args)
+            else:
+                groups.setdefault((kind, args[0]), []).append(future)
+
+        for (kind, name), futures in groups.items():
+            if kind == "weapon":
+                crafter, blueprints = self.__forge, self.__weaponBlueprints
+            else:
+                crafter, blueprints = self.__enchanter, self.__enchantmentBlueprints
+            try:
+                items = crafter.craftMany(blueprints, {name: len(futures)}, self.workshop.materials)
+            except ValueError:
+                # Not enough for the whole batch, so craft what can be crafted one at a time.
+                for future in futures:
+                    self.__answer(future, self.__craftOne, crafter, blueprints, name)
+                continue
+            except Exception as error:
+                # Any other error fails the requests of this blueprint only.
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            for future, item in zip(futures, items):
+                if not future.done():
+                    future.set_result(item)
+
+    def __answer(self, future, function, *args):
+        try:
+            result = function(*args)
+        except Exception as error:
+            if not future.done():
+                future.set_exception(error)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    def __craftOne(self, crafter, blueprints, name):
+        if name not in blueprints:
+            raise KeyError(f"Unknown blueprint: {name}.")
+        primaryMaterial, catalystMaterial = blueprints[name]
+        return crafter.craft(name, primaryMaterial, catalystMaterial, self.workshop.materials)
+
+    def __enchantWeapon(self, weapon, enchantmentName, enchantment):
+        self.__enchanter.enchant(weapon, enchantmentName, enchantment)
+        return weapon
+
+
+def percentile(sortedValues, fraction):
+    """Returns the value at a fraction of a sorted list, using the nearest rank."""
+    if not sortedValues:
+        return 0.0
+    rank = min(len(sortedValues) - 1, max(0, round(fraction * len(sortedValues)) - 1))
+    return sortedValues[rank]
+
+
+async def generateLoad(service, clients=100, requestsPerClient=50, names=None):
+    """
+    Runs many in-process clients each sending crafting requests one after another and
+    returns the p50 and p99 latency in milliseconds, the requests served per second and
+    how many requests failed.
+    """
+    names = list(names or blueprintTables()[0])
+    latencies = []
+    failures = 0
+
+    async def client(clientNumber):
+        nonlocal failures
+        for i in range(requestsPerClient):
+            name = names[(clientNumber + i) % len(names)]
+            start = time.perf_counter()
+            try:
+                await service.craftWeapon(name)
+            except (ValueError, KeyError):
+                failures += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(clientNumber) for clientNumber in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "failures": failures,
+        "p50Milliseconds": percentile(latencies, 0.50) * 1000,
+        "p99Milliseconds": percentile(latencies, 0.99) * 1000,
+        "requestsPerSecond": len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+
+def runLoadTest(clients=100, requestsPerClient=50, maxQueue=1024):
+    """Stocks a fresh workshop, serves a generated load from it and returns the report."""
+    workshop = Workshop(Forge(), Enchanter())
+    for primaryMaterial, catalystMaterial in blueprintTables()[0].values():
+        for material in (primaryMaterial, catalystMaterial):
+            workshop.addMaterial(material.__class__.__name__, clients * requestsPerClient)
+
+    async def run():
+        async with CraftingService(workshop, maxQueue=maxQueue) as service:
+            return await generateLoad(service, clients, requestsPerClient)
+
+    return asyncio.run(run())
+
+
+if __name__ == '__main__':
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    requestsPerClient = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    report = runLoadTest(clients, requestsPerClient)
+    print(f"{report['requests']} requests from {clients} clients, {report['failures']} failed")
+    print(f"    p50 {report['p50Milliseconds']:.3f} ms  p99 {report['p99Milliseconds']:.3f} ms  "
+          f"{report['requestsPerSecond']:.0f} requests/s")
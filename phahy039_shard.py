@@ -0,0 +1,496 @@
+# File: phahy039_shard.py
+# Description: a workshop partitioned across worker processes, each shard holding its own
+# weapons, enchantments and slice of the material ledger, with materials moved between
+# shards in batched transfers when one runs short.
+# Run with: python phahy039_shard.py [shards] [weaponsPerBlueprint]
+# Author: Huyen Thi Thu Pham
+
+
+import multiprocessing
+import sys
+import time
+import zlib
+
+from phahy039_main import Crafter, Enchanter, Forge, MaterialType, Workshop, blueprintTables
+from phahy039_simulation import mergeResults, shardStock, summarise
+
+
+def ownerOf(name, shards):
+    """
+    Returns the shard owning a blueprint name. crc32 is used rather than hash, which is
+    salted per process, so every process agrees on the owner.
+    """
+    return zlib.crc32(name.encode("utf-8")) % shards
+
+
+def checkBlueprint(crafter, name, blueprint):
+    """Raises a ValueError naming a blueprint that the crafter cannot craft from its materials."""
+    try:
+        crafter.checkBlueprint(name, *blueprint)
+    # An enchantment of materials without magic power fails with AttributeError.
+    except (ValueError, AttributeError) as error:
+        raise ValueError(f"Invalid blueprint {name}: {error}") from None
+
+
+class WorkshopShard:
+    """
+    The part of a sharded workshop held by one worker process.
+
+    Attributes
+    ----------
+        workshop (Workshop): The workshop holding the weapons, enchantments and materials of the shard.
+        __forge (Forge): The forge crafting weapons into the workshop.
+        __enchanter (Enchanter): The enchanter crafting enchantments into the workshop.
+        __blueprints (dict): The weapon and enchantment blueprint tables by kind.
+
+    Methods
+    -------
+        addMaterials(self, stock), takeMaterials(self, stock):
+            Add materials to the shard or take them out of it.
+        materials(self):
+            Return the material ledger as a dict.
+        craftOrders(self, kind, counts):
+            Craft a table of weapons or enchantments and report the needs of those that failed.
+        checkItems(self, weaponIds, enchantmentIds):
+            Raise ValueError unless every weapon and enchantment is in the shard.
+        takeEnchantments(self, enchantmentIds):
+            Remove enchantments from the shard and return them.
+        enchantMany(self, pairs):
+            Imbue weapons of the shard with enchantments.
+        summary(self):
+            Return the armoury, enchantments, material ledger and total damage of the shard.
+    """
+    # The methods a worker process runs on behalf of the ShardedWorkshop.
+    commands = frozenset(("addMaterials", "takeMaterials", "materials", "craftOrders", "checkItems",
+                          "takeEnchantments", "enchantMany", "summary"))
+
+    def __init__(self, weaponBlueprints, enchantmentBlueprints):
+        self.workshop = Workshop(Forge(), Enchanter())
+        self.__forge = Forge(self.workshop)
+        self.__enchanter = Enchanter(self.workshop)
+        self.__blueprints = {"weapon": weaponBlueprints, "enchantment": enchantmentBlueprints}
+
+    def addMaterials(self, stock):
+        """Adds a stock of {materialName: quantity} to the shard."""
+        for materialName, quantity in stock.items():
+            self.workshop.addMaterial(materialName, quantity)
+
+    def takeMaterials(self, stock):
+        """Takes a stock of {materialName: quantity} out of the shard, all or nothing."""
+        shortages = self.workshop.materials.consume([(MaterialType.idOf(materialName), quantity)
+                                                     for materialName, quantity in stock.items()])
+        if shortages:
+            raise ValueError(f"Insufficient materials to transfer: {', '.join(sorted(shortages))}.")
+        return stock
+
+    def materials(self):
+        """Returns the material ledger of the shard as a dict."""
+        return dict(self.workshop.materials)
+
+    def craftOrders(self, kind, counts):
+        """
+        Crafts counts of {name: count} weapons or enchantments, each blueprint all or nothing.
+
+        Returns the ids of the items crafted by name and the {materialName: quantity}
+        needed by the blueprints that could not be crafted, empty when all were. Every
+        blueprint is checked first, so a failure to craft is a shortage of materials.
+        """
+        blueprints = self.__blueprints[kind]
+        crafter = self.__forge if kind == "weapon" else self.__enchanter
+        registry = self.workshop.weapons if kind == "weapon" else self.workshop.enchantments
+        for name in counts:
+            checkBlueprint(crafter, name, blueprints[name])
+        crafted = {}
+        needs = {}
+        for name, count in counts.items():
+            try:
+                items = crafter.craftMany(blueprints, {name: count}, self.workshop.materials)
+            except ValueError:
+                for materialName, quantity in Crafter.demandOf(*blueprints[name]).items():
+                    needs[materialName] = needs.get(materialName, 0) + quantity * count
+                continue
+            crafted[name] = [registry.getId(item) for item in items]
+        return crafted, needs
+
+    def __weapon(self, weaponId):
+        weapon = self.workshop.weapons.get(weaponId)
+        if weapon is None:
+            raise ValueError(f"Weapon {weaponId} not found in the shard.")
+        return weapon
+
+    def __enchantment(self, enchantmentId):
+        enchantment = self.workshop.enchantments.get(enchantmentId)
+        if enchantment is None:
+            raise ValueError(f"Enchantment {enchantmentId} not found in the shard.")
+        return enchantment
+
+    def checkItems(self, weaponIds, enchantmentIds):
+        """Raises ValueError naming the first weapon or enchantment id that is not in the shard."""
+        for weaponId in weaponIds:
+            self.__weapon(weaponId)
+        for enchantmentId in enchantmentIds:
+            self.__enchantment(enchantmentId)
+
+    def takeEnchantments(self, enchantmentIds):
+        """Removes enchantments from the shard by id and returns them, all or nothing."""
+        enchantments = [self.__enchantment(enchantmentId) for enchantmentId in enchantmentIds]
+        if len(set(enchantmentIds)) != len(enchantmentIds):
+            raise ValueError("An enchantment can only be taken once.")
+        for enchantment in enchantments:
+            self.workshop.removeEnchantment(enchantment)
+        return enchantments
+
+    def enchantMany(self, pairs):
+        """
+        Imbues weapons of the shard with enchantments and returns the ids of the enchantments.
+
+        pairs holds (weaponId, enchantment) where the enchantment is the id of one of the
+        shard or an Enchantment moved from another shard, which is added to this one.
+        Every weapon and enchantment is looked up before any weapon is enchanted.
+        """
+        resolved = [(self.__weapon(weaponId),
+                     self.__enchantment(enchantment) if isinstance(enchantment, int) else enchantment)
+                    for weaponId, enchantment in pairs]
+        enchantmentIds = []
+        for weapon, enchantment in resolved:
+            self.workshop.addEnchantment(enchantment)
+            self.__enchanter.enchant(weapon, enchantment.getName(), enchantment)
+            enchantmentIds.append(self.workshop.enchantments.getId(enchantment))
+        return enchantmentIds
+
+    def summary(self):
+        """Returns the armoury, enchantments, material ledger and total damage of the shard."""
+        return summarise(self.workshop)
+
+
+def serveShard(connection, weaponBlueprints, enchantmentBlueprints):
+    """
+    Runs a WorkshopShard in a worker process.
+
+    Each message is a batch of (command, args) and is answered with one (ok, result) per
+    command, where result is the error raised when ok is False. A None message, or the
+    pipe closing, stops the worker.
+    """
+    shard = WorkshopShard(weaponBlueprints, enchantmentBlueprints)
+    while True:
+        try:
+            batch = connection.recv()
+        except EOFError:
+            break
+        if batch is None:
+            break
+        replies = []
+        for command, args in batch:
+            if command not in WorkshopShard.commands:
+                replies.append((False, ValueError(f"Unknown shard command: {command}.")))
+                continue
+            try:
+                replies.append((True, getattr(shard, command)(*args)))
+            except Exception as error:
+                # Any error goes back to the coordinator, so the worker keeps serving.
+                replies.append((False, error))
+        connection.send(replies)
+    connection.close()
+
+
+class ShardedWorkshop:
+    """
+    A workshop partitioned across worker processes connected by pipes.
+
+    Every weapon and enchantment blueprint is owned by one shard, chosen by ownerOf,
+    and is always crafted there. Crafted items stay on the shard that made them and are
+    known by a (shard, itemId) key. Materials are spread evenly over the shards. When a
+    shard runs short for an order, the stock of every shard is read and the missing
+    materials are taken from shards with spare, one batched transfer message per shard.
+    Commands for different shards are sent before any reply is awaited, so the shards
+    work in parallel.
+
+    Attributes
+    ----------
+        shards (int): The number of shards.
+        messages (int): The batches of commands sent to the shards.
+        transfers (int): The transfer messages sent to move materials between shards.
+        transferredUnits (int): The material units moved between shards.
+        __weaponBlueprints (dict): The weapon blueprints by name.
+        __enchantmentBlueprints (dict): The enchantment blueprints by name.
+        __crafters (dict): The forge and enchanter checking blueprints by kind.
+        __connections (list): The pipe to every worker process.
+        __processes (list): The worker processes.
+
+    Methods
+    -------
+        addMaterial(self, materialName, quantity), addMaterials(self, stock):
+            Spread materials evenly over the shards.
+        craftWeapon(self, name), craftWeapons(self, counts):
+            Craft weapons on their owning shards and return their keys.
+        craftEnchantment(self, name), craftEnchantments(self, counts):
+            Craft enchantments on their owning shards and return their keys.
+        enchant(self, weaponKey, enchantmentKey), enchantMany(self, pairs):
+            Imbue weapons with enchantments, moving each enchantment to its weapon's shard.
+        materials(self):
+            Return the total quantity of every material over all shards.
+        summary(self):
+            Return the merged armoury, enchantments, materials and total damage.
+        close(self):
+            Stop the worker processes.
+    """
+    def __init__(self, shards=4, weaponBlueprints=None, enchantmentBlueprints=None, context=None):
+        if shards < 1:
+            raise ValueError("A sharded workshop needs at least one shard.")
+        weaponBlueprints, enchantmentBlueprints = blueprintTables(weaponBlueprints, enchantmentBlueprints)
+        context = multiprocessing.get_context(context)
+        self.shards = shards
+        self.messages = 0
+        self.transfers = 0
+        self.transferredUnits = 0
+        self.__weaponBlueprints = weaponBlueprints
+        self.__enchantmentBlueprints = enchantmentBlueprints
+        self.__crafters = {"weapon": Forge(), "enchantment": Enchanter()}
+        self.__connections = []
+        self.__processes = []
+        for _ in range(shards):
+            connection, workerConnection = context.Pipe()
+            process = context.Process(target=serveShard, daemon=True,
+                                      args=(workerConnection, weaponBlueprints, enchantmentBlueprints))
+            process.start()
+            workerConnection.close()
+            self.__connections.append(connection)
+            self.__processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Stops the worker processes."""
+        for connection in self.__connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for process in self.__processes:
+            process.join()
+        self.__connections = []
+        self.__processes = []
+
+    def __send(self, batches):
+        """Sends {shard: [(command, args)]} and returns {shard: [result]}, raising the first error."""
+        if not self.__connections:
+            raise ValueError("The sharded workshop is closed.")
+        for shard, batch in batches.items():
+            self.__connections[shard].send(batch)
+            self.messages += 1
+        results = {}
+        error = None
+        for shard in batches:
+            results[shard] = []
+            for ok, result in self.__connections[shard].recv():
+                if not ok and error is None:
+                    error = result
+                results[shard].append(result)
+        if error is not None:
+            raise error
+        return results
+
+    def addMaterial(self, materialName, quantity):
+        """Spreads a quantity of a material, by name, evenly over the shards."""
+        self.addMaterials({materialName: quantity})
+
+    def addMaterials(self, stock):
+        """Spreads a stock of {materialName: quantity} evenly over the shards."""
+        for materialName in stock:
+            MaterialType.idOf(materialName)
+        self.__send({shard: [("addMaterials", (shardStock,))]
+                     for shard, shardStock in enumerate(shardStock(stock, self.shards))})
+
+    def materials(self):
+        """Returns the total quantity of every material over all shards."""
+        totals = {}
+        for stock in self.__stocks():
+            for materialName, quantity in stock.items():
+                totals[materialName] = totals.get(materialName, 0) + quantity
+        return dict(sorted(totals.items()))
+
+    def summary(self):
+        """Returns the merged armoury, enchantments, material ledger and total damage of every shard."""
+        results = self.__send({shard: [("summary", ())] for shard in range(self.shards)})
+        return mergeResults(results[shard][0] for shard in range(self.shards))
+
+    def __stocks(self):
+        results = self.__send({shard: [("materials", ())] for shard in range(self.shards)})
+        return [results[shard][0] for shard in range(self.shards)]
+
+    def craftWeapon(self, name):
+        """Crafts a weapon from its blueprint and returns its key."""
+        return self.craftWeapons({name: 1})[name][0]
+
+    def craftWeapons(self, counts):
+        """Crafts counts of {name: count} weapons and returns their keys by name."""
+        return self.__craft("weapon", self.__weaponBlueprints, counts)
+
+    def craftEnchantment(self, name):
+        """Crafts an enchantment from its blueprint and returns its key."""
+        return self.craftEnchantments({name: 1})[name][0]
+
+    def craftEnchantments(self, counts):
+        """Crafts counts of {name: count} enchantments and returns their keys by name."""
+        return self.__craft("enchantment", self.__enchantmentBlueprints, counts)
+
+    def __craft(self, kind, blueprints, counts):
+        """
+        Crafts an order on the owning shards. The blueprints a shard could not craft are
+        crafted again once the materials they need have been moved to it. A ValueError
+        names them if all shards together cannot cover them, the rest of the order being
+        kept. Every blueprint is checked before the order is sent, so an invalid one
+        raises a ValueError naming it and nothing is crafted.
+        """
+        unknown = [name for name in counts if name not in blueprints]
+        if unknown:
+            raise ValueError(f"Unknown blueprint: {', '.join(unknown)}.")
+        orders = {}
+        for name, count in counts.items():
+            if count < 0:
+                raise ValueError("Craft counts cannot be negative.")
+            checkBlueprint(self.__crafters[kind], name, blueprints[name])
+            orders.setdefault(ownerOf(name, self.shards), {})[name] = count
+
+        keys = {}
+        results = self.__send({shard: [("craftOrders", (kind, order))] for shard, order in orders.items()})
+        needs = {}
+        for shard, [(crafted, shardNeeds)] in results.items():
+            for name, itemIds in crafted.items():
+                keys[name] = [(shard, itemId) for itemId in itemIds]
+            if shardNeeds:
+                needs[shard] = shardNeeds
+
+        if needs:
+            failed = {shard: {name: count for name, count in orders[shard].items() if name not in keys}
+                      for shard in needs}
+            self.__rebalance(needs, [name for order in failed.values() for name in order])
+            # The materials have been moved, so every failed order can now be crafted.
+            results = self.__send({shard: [("craftOrders", (kind, order))] for shard, order in failed.items()})
+            for shard, [(crafted, _)] in results.items():
+                for name, itemIds in crafted.items():
+                    keys[name] = [(shard, itemId) for itemId in itemIds]
+            uncrafted = [name for name in counts if name not in keys]
+            if uncrafted:
+                raise ValueError(f"Could not craft after moving materials: {', '.join(uncrafted)}.")
+        return {name: keys[name] for name in counts}
+
+    def __rebalance(self, needs, names):
+        """
+        Moves materials so every shard holds what its failed orders need.
+
+        needs maps a shard to its {materialName: quantity}. Shards keep what their own
+        failed orders need and give away the rest, largest spare first. Nothing is moved
+        unless every need can be covered.
+        """
+        stocks = self.__stocks()
+        shortfalls = {}
+        spares = [dict(stock) for stock in stocks]
+        for shard, shardNeeds in needs.items():
+            for materialName, quantity in shardNeeds.items():
+                available = stocks[shard].get(materialName, 0)
+                spares[shard][materialName] = max(0, available - quantity)
+                if quantity > available:
+                    shortfalls.setdefault(shard, {})[materialName] = quantity - available
+
+        for materialName in {materialName for shortfall in shortfalls.values() for materialName in shortfall}:
+            missing = sum(shortfall.get(materialName, 0) for shortfall in shortfalls.values())
+            if missing > sum(spare.get(materialName, 0) for spare in spares):
+                raise ValueError(f"Insufficient materials for crafting: {', '.join(names)}.")
+
+        takes = {}
+        gives = {}
+        for shard, shortfall in shortfalls.items():
+            for materialName, quantity in shortfall.items():
+                donors = sorted(range(self.shards), key=lambda donor: -spares[donor].get(materialName, 0))
+                for donor in donors:
+                    if not quantity:
+                        break
+                    moved = min(quantity, spares[donor].get(materialName, 0))
+                    if moved:
+                        spares[donor][materialName] -= moved
+                        take = takes.setdefault(donor, {})
+                        take[materialName] = take.get(materialName, 0) + moved
+                        give = gives.setdefault(shard, {})
+                        give[materialName] = give.get(materialName, 0) + moved
+                        quantity -= moved
+                        self.transferredUnits += moved
+
+        self.__send({donor: [("takeMaterials", (take,))] for donor, take in takes.items()})
+        self.__send({shard: [("addMaterials", (give,))] for shard, give in gives.items()})
+        self.transfers += len(takes) + len(gives)
+
+    def enchant(self, weaponKey, enchantmentKey):
+        """Imbues a weapon with an enchantment and returns the new key of the enchantment."""
+        return self.enchantMany([(weaponKey, enchantmentKey)])[0]
+
+    def enchantMany(self, pairs):
+        """
+        Imbues weapons with enchantments, given as (weaponKey, enchantmentKey) pairs, and
+        returns the new key of every enchantment. An enchantment on another shard than
+        its weapon is moved to the weapon's shard, in one message per shard.
+
+        Every key is checked on its shard before any enchantment is moved, so a key that
+        names no item raises a ValueError and leaves every shard as it was.
+        """
+        pairs = list(pairs)
+        if len({enchantmentKey for _, enchantmentKey in pairs}) != len(pairs):
+            raise ValueError("An enchantment can only be given to one weapon.")
+        checks = {}
+        for (weaponShard, weaponId), (enchantmentShard, enchantmentId) in pairs:
+            if not (0 <= weaponShard < self.shards and 0 <= enchantmentShard < self.shards):
+                raise ValueError(f"No such shard in keys {(weaponShard, weaponId)}, {(enchantmentShard, enchantmentId)}.")
+            checks.setdefault(weaponShard, ([], []))[0].append(weaponId)
+            checks.setdefault(enchantmentShard, ([], []))[1].append(enchantmentId)
+        self.__send({shard: [("checkItems", ids)] for shard, ids in checks.items()})
+
+        moving = {}
+        for weaponKey, (shard, enchantmentId) in pairs:
+            if shard != weaponKey[0]:
+                moving.setdefault(shard, []).append(enchantmentId)
+        moved = {}
+        if moving:
+            results = self.__send({shard: [("takeEnchantments", (enchantmentIds,))]
+                                   for shard, enchantmentIds in moving.items()})
+            for shard, enchantmentIds in moving.items():
+                moved.update(zip(((shard, enchantmentId) for enchantmentId in enchantmentIds), results[shard][0]))
+
+        batches = {}
+        for weaponKey, enchantmentKey in pairs:
+            enchantment = moved.get(enchantmentKey, enchantmentKey[1])
+            batches.setdefault(weaponKey[0], []).append((weaponKey[1], enchantment))
+        results = self.__send({shard: [("enchantMany", (batch,))] for shard, batch in batches.items()})
+        enchantmentIds = {shard: iter(result[0]) for shard, result in results.items()}
+        return [(weaponKey[0], next(enchantmentIds[weaponKey[0]])) for weaponKey, _ in pairs]
+
+
+if __name__ == '__main__':
+    shards = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    perBlueprint = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    weaponBlueprints, enchantmentBlueprints = blueprintTables()
+    # Exactly the materials of the order, so the shards owning busy blueprints run short.
+    stock = {}
+    for blueprints in (weaponBlueprints, enchantmentBlueprints):
+        for primaryMaterial, catalystMaterial in blueprints.values():
+            for materialName, quantity in Crafter.demandOf(primaryMaterial, catalystMaterial).items():
+                stock[materialName] = stock.get(materialName, 0) + quantity * perBlueprint
+
+    start = time.perf_counter()
+    with ShardedWorkshop(shards) as workshop:
+        workshop.addMaterials(stock)
+        weaponKeys = workshop.craftWeapons({name: perBlueprint for name in weaponBlueprints})
+        enchantmentKeys = workshop.craftEnchantments({name: perBlueprint for name in enchantmentBlueprints})
+        workshop.enchantMany(zip(weaponKeys["Sword"], enchantmentKeys["Holy"]))
+        summary = workshop.summary()
+        elapsed = time.perf_counter() - start
+        print(f"{shards} shards, {sum(summary['weapons'].values())} weapons and "
+              f"{sum(summary['enchantments'].values())} enchantments crafted in {elapsed:.3f} s")
+        print(f"    {workshop.messages} messages, {workshop.transfers} transfers moving "
+              f"{workshop.transferredUnits} material units")
+        print(f"    {sum(summary['enchantedWeapons'].values())} weapons enchanted, "
+              f"total damage {summary['totalDamage']:.2f}")
@@ -0,0 +1,151 @@
+# File: phahy039_simulation.py
+# Description: "what-if" crafting simulations run in parallel across CPU cores by sharding
+# a workshop's inventory into independent sub-workshops.
+# Run with: python phahy039_simulation.py [stockPerMaterial] [shards] [seed]
+# Author: Huyen Thi Thu Pham
+
+
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from phahy039_main import Enchanter, Forge, Workshop, blueprintTables
+
+
+def shardStock(stock, shards):
+    """
+    Splits a material stock of {materialName: quantity} into a list of one stock per
+    shard. Every material is split as evenly as possible, the first shards taking the
+    remainder, so the split only depends on the stock and the number of shards.
+    """
+    shardStocks = [{} for _ in range(shards)]
+    for materialName in sorted(stock):
+        share, remainder = divmod(stock[materialName], shards)
+        for shard, shardStock in enumerate(shardStocks):
+            shardStock[materialName] = share + (1 if shard < remainder else 0)
+    return shardStocks
+
+
+def simulateShard(shard, stock, weaponBlueprints, enchantmentBlueprints, seed, maxCrafts=None):
+    """
+    Runs the crafting simulation of one shard in its own workshop and returns its result.
+
+    Blueprints are picked at random, with a generator seeded from the seed and the shard
+    number, and crafted until none of them can be crafted any more or maxCrafts items
+    were made. The crafted weapons are then enchanted with the crafted enchantments in
+    the order both were made.
+    """
+    rng = random.Random(seed * 1_000_003 + shard)
+    workshop = Workshop(Forge(), Enchanter())
+    forge = Forge(workshop)
+    enchanter = Enchanter(workshop)
+    for materialName, quantity in stock.items():
+        workshop.addMaterial(materialName, quantity)
+
+    candidates = [(forge, name, materials) for name, materials in sorted(weaponBlueprints.items())]
+    candidates += [(enchanter, name, materials) for name, materials in sorted(enchantmentBlueprints.items())]
+    crafts = 0
+    while candidates and (maxCrafts is None or crafts < maxCrafts):
+        index = rng.randrange(len(candidates))
+        crafter, name, (primaryMaterial, catalystMaterial) = candidates[index]
+        try:
+            crafter.craft(name, primaryMaterial, catalystMaterial, workshop.materials)
+        except ValueError:
+            # Out of materials for this blueprint, so it is no longer picked.
+            candidates.pop(index)
+            continue
+        crafts += 1
+
+    for weapon, enchantment in zip(workshop.weapons, workshop.enchantments):
+        enchanter.enchant(weapon, weapon.name, enchantment)
+    return summarise(workshop)
+
+
+def summarise(workshop):
+    """Returns the armoury, enchantments, material ledger and total damage of a workshop."""
+    weapons = {}
+    enchantedWeapons = {}
+    for weapon in workshop.weapons:
+        weapons[weapon.name] = weapons.get(weapon.name, 0) + 1
+        if weapon.enchantment:
+            key = f"{weapon.enchantment.name} {weapon.name}"
+            enchantedWeapons[key] = enchantedWeapons.get(key, 0) + 1
+    enchantments = {}
+    for enchantment in workshop.enchantments:
+        enchantments[enchantment.name] = enchantments.get(enchantment.name, 0) + 1
+    return {
+        "weapons": weapons,
+        "enchantments": enchantments,
+        "enchantedWeapons": enchantedWeapons,
+        "materials": dict(workshop.materials),
+        "totalDamage": sum(workshop.calculateDamages()[1]),
+    }
+
+
+def mergeResults(results):
+    """
+    Merges the results of the shards, in shard order, into one result. Counts are summed
+    with their keys sorted and the damage is added shard by shard, so the merge gives the
+    same result however the shards were run.
+    """
+    merged = {"weapons": {}, "enchantments": {}, "enchantedWeapons": {}, "materials": {}, "totalDamage": 0.0}
+    for result in results:
+        for table in ("weapons", "enchantments", "enchantedWeapons", "materials"):
+            for key, count in result[table].items():
+                merged[table][key] = merged[table].get(key, 0) + count
+        merged["totalDamage"] += result["totalDamage"]
+    for table in ("weapons", "enchantments", "enchantedWeapons", "materials"):
+        merged[table] = dict(sorted(merged[table].items()))
+    return merged
+
+
+def runSimulation(stock, shards=8, seed=0, workers=None, maxCrafts=None,
+                  weaponBlueprints=None, enchantmentBlueprints=None):
+    """
+    Shards a material stock, simulates every shard and merges the results.
+
+    With workers of 0 the shards run one after another in this process, otherwise they
+    run in a ProcessPoolExecutor of that many processes (all cores when None). Both
+    give identical results for the same stock, shards and seed.
+    """
+    weaponBlueprints, enchantmentBlueprints = blueprintTables(weaponBlueprints, enchantmentBlueprints)
+    stocks = shardStock(stock, shards)
+    arguments = (range(shards), stocks, [weaponBlueprints] * shards, [enchantmentBlueprints] * shards,
+                 [seed] * shards, [maxCrafts] * shards)
+    if workers == 0:
+        results = list(map(simulateShard, *arguments))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(simulateShard, *arguments))
+    return mergeResults(results)
+
+
+def defaultStock(quantity):
+    """Returns a stock holding quantity of every material used by the blueprints."""
+    stock = {}
+    for blueprints in blueprintTables():
+        for primaryMaterial, catalystMaterial in blueprints.values():
+            stock[primaryMaterial.__class__.__name__] = quantity
+            stock[catalystMaterial.__class__.__name__] = quantity
+    return stock
+
+
+if __name__ == '__main__':
+    quantity = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    shards = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    stock = defaultStock(quantity)
+
+    start = time.perf_counter()
+    serial = runSimulation(stock, shards, seed, workers=0)
+    serialSeconds = time.perf_counter() - start
+    start = time.perf_counter()
+    parallel = runSimulation(stock, shards, seed)
+    parallelSeconds = time.perf_counter() - start
+
+    print(f"{sum(serial['weapons'].values())} weapons, {sum(serial['enchantments'].values())} enchantments, "
+          f"total damage {serial['totalDamage']:.2f}")
+    print(f"    serial   {serialSeconds:8.3f} s")
+    print(f"    parallel {parallelSeconds:8.3f} s  ({serialSeconds / parallelSeconds:.2f} x)")
+    print(f"    identical results: {serial == parallel}")
@@ -0,0 +1,399 @@
+# File: phahy039_snapshot.py
+# Description: a compact, versioned binary snapshot of a workshop's weapons, enchantments
+# and materials ledger, loaded lazily from a memory-mapped file.
+# Run with: python phahy039_snapshot.py [weaponCount]
+# Author: Huyen Thi Thu Pham
+
+
+import mmap
+import os
+import struct
+import sys
+import time
+
+from phahy039_main import Enchantment, Material, Weapon, Workshop, blueprintTables
+
+
+# The file starts with the magic bytes and format version, then the number of records
+# and the offset of each section. All numbers are little-endian.
+MAGIC = b"PHWS"
+VERSION = 1
+HEADER = struct.Struct("<4sHxx5I5Q")
+# A material type: class name string id, number of stats and up to two stats.
+MATERIAL = struct.Struct("<IHxxdd")
+# A string: the offset and length of its UTF-8 bytes in the string data.
+STRING = struct.Struct("<QI")
+# An enchantment: name and effect string ids, primary and catalyst material ids and magic damage.
+ENCHANTMENT = struct.Struct("<IIHHd")
+# A weapon: name string id, primary and catalyst material ids, damage, enchanted flag,
+# enchantment id and enchantment name string id, the last two -1 for none.
+WEAPON = struct.Struct("<iHHdB3xii")
+# A ledger entry: material name string id and quantity.
+LEDGER = struct.Struct("<Iq")
+
+
+def materialClasses(base=Material):
+    """Returns every concrete material class by name."""
+    classes = {}
+    for subclass in base.__subclasses__():
+        classes[subclass.__name__] = subclass
+        classes.update(materialClasses(subclass))
+    return classes
+
+
+class StringTable:
+    """Interns strings for the writer, giving each distinct string a small id."""
+
+    def __init__(self):
+        self.strings = []
+        self.ids = {}
+
+    def intern(self, string):
+        if string is None:
+            return -1
+        stringId = self.ids.get(string)
+        if stringId is None:
+            stringId = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return stringId
+
+
+def writeSnapshot(workshop, path, chunkSize=65536):
+    """
+    Writes the weapons, enchantments and materials ledger of a workshop to a snapshot
+    file and returns the number of bytes written.
+
+    Names, effects and material class names are written once to the string table and
+    materials once to the material type table, the records only hold their ids.
+    Enchantments on weapons that are not stored in the workshop are written too, so
+    every weapon keeps its enchantment. Weapon records are packed chunkSize at a time.
+    """
+    strings = StringTable()
+    materials = []
+    materialIds = {}
+    enchantments = []
+    enchantmentIds = {}
+
+    def materialId(material):
+        # Materials are interned, so the instance itself identifies its class and stats.
+        code = materialIds.get(material)
+        if code is None:
+            code = materialIds[material] = len(materials)
+            materials.append(material)
+        return code
+
+    def enchantmentId(enchantment):
+        if enchantment is None:
+            return -1
+        code = enchantmentIds.get(id(enchantment))
+        if code is None:
+            code = enchantmentIds[id(enchantment)] = len(enchantments)
+            enchantments.append(enchantment)
+        return code
+
+    for enchantment in workshop.enchantments:
+        enchantmentId(enchantment)
+
+    # Imported here, as only writers need it and it is slow to import in every reader.
+    import tempfile
+    with tempfile.TemporaryFile() as weaponRecords:
+        # Weapons are packed first, as they may add enchantments, materials and strings.
+        count = 0
+        chunk = []
+        for weapon in workshop.weapons:
+            chunk.append(WEAPON.pack(
+                strings.intern(weapon.getName()), materialId(weapon.getPrimaryMaterial()),
+                materialId(weapon.getCatalystMaterial()), float(weapon.getDamage()), weapon.isEnchanted(),
+                enchantmentId(weapon.getEnchantment()), strings.intern(getattr(weapon, "enchantmentName", None))))
+            if len(chunk) >= chunkSize:
+                weaponRecords.write(b"".join(chunk))
+                count += len(chunk)
+                chunk = []
+        weaponRecords.write(b"".join(chunk))
+        count += len(chunk)
+
+        enchantmentData = b"".join(ENCHANTMENT.pack(
+            strings.intern(enchantment.name), strings.intern(enchantment.getEffect()),
+            materialId(enchantment.getPrimaryMaterial()), materialId(enchantment.getCatalystMaterial()),
+            float(enchantment.getMagicDamage())) for enchantment in enchantments)
+        ledgerData = b"".join(LEDGER.pack(strings.intern(name), quantity)
+                              for name, quantity in workshop.materials.items())
+        materialData = []
+        for material in materials:
+            stats = material.getStats()
+            if len(stats) > 2:
+                raise ValueError(f"Materials with more than two stats cannot be saved: {material.__class__.__name__}.")
+            materialData.append(MATERIAL.pack(strings.intern(material.__class__.__name__), len(stats),
+                                              *(tuple(stats) + (0.0, 0.0))[:2]))
+        materialData = b"".join(materialData)
+
+        encoded = [string.encode("utf-8") for string in strings.strings]
+        stringIndex = []
+        offset = 0
+        for data in encoded:
+            stringIndex.append(STRING.pack(offset, len(data)))
+            offset += len(data)
+        stringIndex = b"".join(stringIndex)
+        stringData = b"".join(encoded)
+
+        # The sections follow the header in this order, the weapons last.
+        sections = [materialData, stringIndex, stringData, enchantmentData, ledgerData]
+        offsets = []
+        position = HEADER.size
+        for section in sections:
+            offsets.append(position)
+            position += len(section)
+        weaponOffset = position
+
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, len(materials), len(strings.strings), len(enchantments),
+                                   count, len(workshop.materials), offsets[0], offsets[1], offsets[3],
+                                   offsets[4], weaponOffset))
+            for section in sections:
+                file.write(section)
+            weaponRecords.seek(0)
+            while True:
+                data = weaponRecords.read(chunkSize * WEAPON.size)
+                if not data:
+                    break
+                file.write(data)
+            return file.tell()
+
+
+class Snapshot:
+    """
+    A workshop snapshot opened from a memory-mapped file.
+
+    Opening reads the header and the small material type table only. Strings,
+    enchantments and weapons are unpacked from the mapped file when they are first
+    accessed, so the time to open does not depend on the number of weapons. Strings and
+    enchantments are cached once unpacked, so weapons sharing an enchantment share one
+    Enchantment object, as they did when the snapshot was written.
+
+    Attributes
+    ----------
+        materials (list): The material type table.
+        weapons (SnapshotWeapons): The lazily unpacked weapons.
+        __file: The snapshot file.
+        __map (mmap): The memory map of the file.
+        __strings (dict): The strings unpacked so far, by id.
+        __enchantments (dict): The enchantments unpacked so far, by id.
+
+    Methods
+    -------
+        string(self, stringId):
+            Return a string of the string table.
+        enchantment(self, enchantmentId):
+            Return an enchantment of the enchantment table.
+        weaponCount(self):
+            Return the number of weapon records.
+        weaponRecord(self, index):
+            Return the raw fields of a weapon record.
+        weapon(self, index):
+            Return a weapon built from its record.
+        enchantments(self):
+            Return every enchantment.
+        ledger(self):
+            Return the materials ledger.
+        toWorkshop(self, forge, enchanter, armoury):
+            Load everything into a new Workshop.
+        close(self):
+            Unmap and close the file.
+    """
+    def __init__(self, path):
+        self.__file = open(path, "rb")
+        try:
+            self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.__file.close()
+            raise ValueError("Snapshot file is empty.")
+        try:
+            self.__readHeader()
+        except (ValueError, struct.error):
+            self.close()
+            raise
+
+    def __readHeader(self):
+        if len(self.__map) < HEADER.size:
+            raise ValueError("Snapshot file is truncated.")
+        (magic, version, materialCount, self.__stringCount, self.__enchantmentCount, self.__weaponCount,
+         self.__ledgerCount, materialOffset, self.__stringOffset, self.__enchantmentOffset,
+         self.__ledgerOffset, self.__weaponOffset) = HEADER.unpack_from(self.__map, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a workshop snapshot file.")
+        if version != VERSION:
+            raise ValueError(f"Unsupported snapshot version: {version}.")
+        if self.__weaponOffset + self.__weaponCount * WEAPON.size > len(self.__map):
+            raise ValueError("Snapshot file is truncated.")
+        self.__stringDataOffset = self.__stringOffset + self.__stringCount * STRING.size
+        self.__strings = {}
+        self.__enchantments = {}
+
+        classes = materialClasses()
+        self.materials = []
+        for nameId, statCount, *stats in MATERIAL.iter_unpack(
+                self.__map[materialOffset:materialOffset + materialCount * MATERIAL.size]):
+            name = self.string(nameId)
+            if name not in classes:
+                raise ValueError(f"Unknown material in snapshot: {name}.")
+            self.materials.append(classes[name](*stats[:statCount]))
+        self.weapons = SnapshotWeapons(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Unmaps and closes the snapshot file. Weapons already built stay usable."""
+        if not self.__map.closed:
+            self.__map.close()
+        self.__file.close()
+
+    def string(self, stringId):
+        """Returns the string with the given id, or None for -1."""
+        if stringId < 0:
+            return None
+        string = self.__strings.get(stringId)
+        if string is None:
+            offset, length = STRING.unpack_from(self.__map, self.__stringOffset + stringId * STRING.size)
+            start = self.__stringDataOffset + offset
+            string = self.__strings[stringId] = self.__map[start:start + length].decode("utf-8")
+        return string
+
+    def enchantment(self, enchantmentId):
+        """Returns the enchantment with the given id, or None for -1."""
+        if enchantmentId < 0:
+            return None
+        enchantment = self.__enchantments.get(enchantmentId)
+        if enchantment is None:
+            if enchantmentId >= self.__enchantmentCount:
+                raise IndexError("Enchantment id out of range.")
+            nameId, effectId, primaryId, catalystId, magicDamage = ENCHANTMENT.unpack_from(
+                self.__map, self.__enchantmentOffset + enchantmentId * ENCHANTMENT.size)
+            enchantment = Enchantment(self.string(nameId), self.materials[primaryId],
+                                      self.materials[catalystId], self.string(effectId))
+            enchantment.setMagicDamage(magicDamage)
+            self.__enchantments[enchantmentId] = enchantment
+        return enchantment
+
+    def enchantments(self):
+        """Returns every enchantment of the snapshot."""
+        return [self.enchantment(enchantmentId) for enchantmentId in range(self.__enchantmentCount)]
+
+    def ledger(self):
+        """Returns the materials ledger as a dict of {materialName: quantity}."""
+        data = self.__map[self.__ledgerOffset:self.__ledgerOffset + self.__ledgerCount * LEDGER.size]
+        return {self.string(nameId): quantity for nameId, quantity in LEDGER.iter_unpack(data)}
+
+    def weaponCount(self):
+        """Returns the number of weapon records."""
+        return self.__weaponCount
+
+    def weaponRecord(self, index):
+        """
+        Returns the raw (nameId, primaryId, catalystId, damage, enchanted, enchantmentId,
+        enchantmentNameId) fields of a weapon record, unpacked in place from the map.
+        """
+        if not 0 <= index < self.__weaponCount:
+            raise IndexError("Snapshot weapon index out of range.")
+        return WEAPON.unpack_from(self.__map, self.__weaponOffset + index * WEAPON.size)
+
+    def weapon(self, index):
+        """Returns a new Weapon built from the record at an index."""
+        nameId, primaryId, catalystId, damage, enchanted, enchantmentId, enchantmentNameId = self.weaponRecord(index)
+        weapon = Weapon(self.string(nameId), self.materials[primaryId], self.materials[catalystId])
+        if damage:
+            weapon.setDamage(damage)
+        if enchantmentId >= 0:
+            weapon.setEnchantment(self.enchantment(enchantmentId))
+        weapon.setEnchanted(bool(enchanted))
+        if enchantmentNameId >= 0:
+            weapon.enchantmentName = self.string(enchantmentNameId)
+        return weapon
+
+    def toWorkshop(self, forge=None, enchanter=None, armoury=None):
+        """Loads every weapon, enchantment and the materials ledger into a new Workshop."""
+        workshop = Workshop(forge, enchanter, armoury)
+        for enchantment in self.enchantments():
+            workshop.addEnchantment(enchantment)
+        for weapon in self.weapons:
+            workshop.addWeapon(weapon)
+        for name, quantity in self.ledger().items():
+            workshop.addMaterial(name, quantity)
+        return workshop
+
+
+class SnapshotWeapons:
+    """A read-only sequence of the weapons of a Snapshot, each built when it is indexed."""
+
+    def __init__(self, snapshot):
+        self.__snapshot = snapshot
+
+    def __len__(self):
+        return self.__snapshot.weaponCount()
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        return self.__snapshot.weapon(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.__snapshot.weapon(index)
+
+
+def snapshotWorkshop(count):
+    """Builds a workshop holding count weapons cycled from the weapon blueprints, half of them enchanted."""
+    weaponBlueprints, enchantmentBlueprints = blueprintTables()
+    workshop = Workshop(None, None)
+    blueprints = list(weaponBlueprints.items())
+    enchantments = [Enchantment(name, primary, catalyst, "Default Effect")
+                    for name, (primary, catalyst) in enchantmentBlueprints.items()]
+    for enchantment in enchantments:
+        workshop.addEnchantment(enchantment)
+    for i in range(count):
+        name, (primary, catalyst) = blueprints[i % len(blueprints)]
+        weapon = Weapon(name, primary, catalyst)
+        if i % 2:
+            weapon.setEnchantment(enchantments[i % len(enchantments)])
+        workshop.addWeapon(weapon)
+    workshop.addMaterial("Steel", count)
+    return workshop
+
+
+if __name__ == '__main__':
+    import pickle
+    import tempfile
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    workshop = snapshotWorkshop(count)
+    directory = tempfile.mkdtemp()
+    snapshotPath = os.path.join(directory, "workshop.snapshot")
+    picklePath = os.path.join(directory, "workshop.pickle")
+
+    start = time.perf_counter()
+    size = writeSnapshot(workshop, snapshotPath)
+    writeSeconds = time.perf_counter() - start
+    start = time.perf_counter()
+    with open(picklePath, "wb") as file:
+        pickle.dump((list(workshop.weapons), list(workshop.enchantments), workshop.materials), file)
+    pickleWriteSeconds = time.perf_counter() - start
+    start = time.perf_counter()
+    with Snapshot(snapshotPath) as snapshot:
+        openSeconds = time.perf_counter() - start
+        last = snapshot.weapons[-1]
+    start = time.perf_counter()
+    with open(picklePath, "rb") as file:
+        pickle.load(file)
+    pickleReadSeconds = time.perf_counter() - start
+
+    print(f"Snapshot of {count} weapons:")
+    print(f"    snapshot {size:12d} bytes  write {writeSeconds:8.3f} s  open {openSeconds * 1000:8.3f} ms")
+    print(f"    pickle   {os.path.getsize(picklePath):12d} bytes  write {pickleWriteSeconds:8.3f} s  "
+          f"load {pickleReadSeconds * 1000:8.3f} ms")
+    print(f"    last weapon: {last.name}, {last.calculateDamage():.2f} damage")
+    os.remove(snapshotPath)
+    os.remove(picklePath)
+    os.rmdir(directory)
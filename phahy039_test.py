@@ -6,8 +6,115 @@
 # This is my own work as defined by the University's Academic Misconduct Policy.
 
 
+import asyncio
+import contextlib
+import io
+import itertools
+import multiprocessing
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+import phahy039_main
 from phahy039_main import *
+from phahy039_main import enchantmentBlueprints, weaponBlueprints
+from phahy039_service import CraftingService, runLoadTest
+from phahy039_planner import ProductionPlanner, materialRequirements, parseOrder, recipeGraph
+from phahy039_optimizer import craftLoadout, pairInventory, planLoadout
+from phahy039_battle import BattleSimulator, Combatant, combatantsOf, loadoutsOf
+from phahy039_bench import benchmarkSuite, compareSuites, suiteSizes
+from phahy039_feed import (ENCHANTMENT_ADDED, FEED_OVERFLOW, MATERIAL_CHANGED, WEAPON_ADDED, WEAPON_CHANGED,
+                            WEAPON_ENCHANTED, WEAPON_REMOVED, ChangeFeed, coalesce)
+from phahy039_ingest import batched, ingestBlueprints, ingestDeliveries, readRecords
+from phahy039_journal import Journal, replay
+from phahy039_metrics import Histogram, Instrumentation
+from phahy039_snapshot import Snapshot, snapshotWorkshop, writeSnapshot
+from phahy039_shard import ShardedWorkshop, WorkshopShard, ownerOf, serveShard
+from phahy039_simulation import defaultStock, runSimulation, shardStock
+
+
+class MaterialTestCase(unittest.TestCase):
+
+    def test_interning(self):
+        # Materials with the same class and stats share one instance
+        self.assertIs(Maple(), Maple())
+        self.assertIs(Maple(strength=5), Maple())
+        self.assertIs(Steel(10, 1.8), Steel())
+        self.assertIsNot(Maple(strength=6), Maple())
+        self.assertIsNot(Oak(strength=5), Maple())
+
+    def test_immutable(self):
+        steel = Steel()
+        self.assertFalse(hasattr(steel, "__dict__"))
+        with self.assertRaises(AttributeError):
+            steel.purity = 2.0
+        self.assertEqual(steel.getStats(), (10, 1.8))
+
+    def test_pickle(self):
+        # Unpickled materials are interned too
+        self.assertIs(pickle.loads(pickle.dumps(Diamond(strength=3.0, magicPower=4.5))),
+                      Diamond(strength=3.0, magicPower=4.5))
+
+
+class MaterialLedgerTestCase(unittest.TestCase):
+
+    def test_material_ids(self):
+        # Every material class has its own dense id, shared by its instances
+        materialIds = [material.materialId for material in (Maple(), Oak(), Ash(), Steel(), Onyx())]
+        self.assertEqual(len(set(materialIds)), 5)
+        self.assertEqual(Maple(7).materialId, Maple.materialId)
+        self.assertEqual(MaterialType.materialNames[Steel.materialId], "Steel")
+        self.assertEqual(MaterialType.idOf("Steel"), Steel.materialId)
+
+    def test_dict_view(self):
+        ledger = MaterialLedger({"Steel": 3})
+        ledger["Maple"] = 0
+        ledger["Mithril"] = 2
+        self.assertEqual(ledger, {"Steel": 3, "Maple": 0, "Mithril": 2})
+        self.assertEqual(list(ledger), ["Steel", "Maple", "Mithril"])
+        self.assertIn("Maple", ledger)
+        self.assertIsNone(ledger.get("Oak"))
+        with self.assertRaises(KeyError):
+            ledger["Oak"]
+        del ledger["Steel"]
+        self.assertNotIn("Steel", ledger)
+        self.assertEqual(ledger.quantityOf(Steel.materialId), 0)
+        self.assertEqual(pickle.loads(pickle.dumps(ledger)), ledger)
+
+    def test_consume(self):
+        ledger = MaterialLedger({"Steel": 1, "Maple": 2})
+        self.assertEqual(ledger.consume(((Steel.materialId, 1), (Oak.materialId, 1))), {"Oak"})
+        self.assertEqual(ledger, {"Steel": 1, "Maple": 2})
+        self.assertEqual(ledger.consume(((Steel.materialId, 1), (Maple.materialId, 2))), set())
+        self.assertEqual(ledger, {"Steel": 0, "Maple": 0})
+
+    def test_vectors(self):
+        ledger = MaterialLedger({"Steel": 1})
+        ledger.addVector(ledger.vectorOf({"Steel": 2, "Ruby": 5}))
+        self.assertEqual(ledger, {"Steel": 3, "Ruby": 5})
+        self.assertEqual(ledger.subtractVector(ledger.vectorOf({"Steel": 4, "Ruby": 1})), {"Steel"})
+        self.assertEqual(ledger.subtractVector(ledger.vectorOf([("Steel", 3), (Ruby.materialId, 1)])), set())
+        self.assertEqual(ledger, {"Steel": 0, "Ruby": 4})
+
+    def test_vectorsOnlyTouchTheirMaterials(self):
+        # A MaterialStore only locks the materials of a vector, so the other entries are
+        # neither read nor written back.
+        store = MaterialStore({"Steel": -1, "Ruby": 4})
+        self.assertEqual(store.subtractVector(store.vectorOf({"Ruby": 3})), set())
+        store.addVector(store.vectorOf({"Ruby": 2}))
+        self.assertEqual(store, {"Steel": -1, "Ruby": 3})
+
+    def test_workshop_materials(self):
+        workshop = Workshop(Forge(), Enchanter())
+        self.assertIsInstance(workshop.materials, MaterialLedger)
+        workshop.addMaterial(Steel(), 2)
+        workshop.addMaterial("Maple", 1)
+        workshop.forge.craft("Sword", Steel(), Maple(), workshop.materials)
+        self.assertEqual(workshop.displayMaterials(), "Steel: 1 remaining.\nMaple: 0 remaining.\n")
 
 
 class WorkshopTestCase(unittest.TestCase):
@@ -34,6 +141,84 @@ class WorkshopTestCase(unittest.TestCase):
         # Verify that the weapon is no longer in the workshop's list of weapons
         self.assertNotIn(weapon, self.workshop.weapons)
 
+    def test_removeWeapons(self):
+        weapons = [Weapon(f"Sword {i}", Steel(), Maple()) for i in range(10)]
+        for weapon in weapons:
+            self.workshop.addWeapon(weapon)
+        # Remove every other weapon in one call
+        self.workshop.removeWeapons(weapons[::2])
+        # The remaining weapons keep their insertion order
+        self.assertEqual(list(self.workshop.weapons), weapons[1::2])
+        self.assertEqual(self.workshop.weapons[-1], weapons[9])
+
+    def test_registryIds(self):
+        weapon = Weapon("Sword", Steel(), Maple())
+        self.workshop.addWeapon(weapon)
+        weaponId = self.workshop.weapons.getId(weapon)
+        # Adding the same weapon twice keeps a single entry
+        self.workshop.addWeapon(weapon)
+        self.assertEqual(len(self.workshop.weapons), 1)
+        self.assertIs(self.workshop.weapons.get(weaponId), weapon)
+        self.workshop.removeWeapon(weapon)
+        self.assertIsNone(self.workshop.weapons.get(weaponId))
+        with self.assertRaises(ValueError):
+            self.workshop.weapons.remove(weapon)
+
+    def test_addTwice(self):
+        # An item already stored is not stored again, unlike appending to a list,
+        # and the observers are only told about it once
+        added = []
+        observer = WorkshopObserver()
+        observer.weaponAdded = added.append
+        observer.enchantmentAdded = added.append
+        self.workshop.addObserver(observer)
+        weapon = Weapon("Sword", Steel(), Maple())
+        enchantment = Enchantment("Holy", Diamond(), Diamond(), "light")
+        for _ in range(2):
+            self.workshop.addWeapon(weapon)
+            self.workshop.addEnchantment(enchantment)
+        self.assertEqual(added, [weapon, enchantment])
+        self.assertEqual((len(self.workshop.weapons), len(self.workshop.enchantments)), (1, 1))
+
+    def test_pickleStoredWeapon(self):
+        # The workshops observing a weapon are not pickled with it
+        for workshop in (self.workshop, ConcurrentWorkshop(Forge(), Enchanter())):
+            weapon = Weapon("Sword", Steel(), Maple())
+            weapon.calculateDamage()
+            weapon.enchantmentName = "Holy Sword"
+            workshop.addWeapon(weapon)
+            data = pickle.dumps(weapon)
+            self.assertLess(len(data), 1000)
+            copy = pickle.loads(data)
+            self.assertEqual((copy.getName(), copy.getDamage(), copy.enchantmentName),
+                             (weapon.getName(), weapon.getDamage(), weapon.enchantmentName))
+            self.assertIs(copy.getPrimaryMaterial(), Steel())
+            # The copy is not stored, so changing it tells no workshop.
+            changed = []
+            observer = WorkshopObserver()
+            observer.weaponChanged = changed.append
+            workshop.addObserver(observer)
+            copy.setName("Copy")
+            self.assertEqual(changed, [])
+
+    def test_registryPositions(self):
+        items = [Weapon(f"Sword {i}", Steel(), Maple()) for i in range(10)]
+        registry = Registry(items)
+        self.assertIs(registry[3], items[3])
+        self.assertEqual(registry[2:5], items[2:5])
+        self.assertEqual(registry[::-3], items[::-3])
+        # Removing the first, last or a middle item keeps the positions right
+        for item in (items[0], items[1], items[9], items[5]):
+            registry.remove(item)
+            items.remove(item)
+            self.assertEqual(registry[:], items)
+            self.assertIs(registry[-1], items[-1])
+        items.append(Weapon("Sword", Steel(), Maple()))
+        registry.add(items[-1])
+        self.assertIs(registry[len(items) - 1], items[-1])
+        with self.assertRaises(IndexError):
+            registry[len(registry)]
+
     def test_addEnchantment(self):
         # Create materials
         diamond = Diamond(strength=3.0, magicPower=4.5)
@@ -145,6 +330,1008 @@ class WorkshopTestCase(unittest.TestCase):
                          "Steel: 3 remaining.\n"
         self.assertEqual(self.workshop.displayMaterials(), expectedOutput)
 
+    def test_writeTo(self):
+        holy = Enchantment("Holy", Diamond(), Diamond(), "pulses a blinding beam of light")
+        for i in range(20):
+            weapon = Weapon("Sword", Steel(), Maple())
+            if i % 2 == 0:
+                Enchanter().enchant(weapon, f"Holy Sword {i}", holy)
+            self.workshop.addWeapon(weapon)
+        self.workshop.addMaterial(Steel(), 4)
+        # Enchanted weapons past the armoury names use the name they were enchanted with
+        self.assertIn("The Holy Sword 18 is imbued with a Holy enchantment", self.workshop.displayWeapons())
+        # The streamed reports match the display methods, even with a tiny buffer
+        for report, display in [("weapons", self.workshop.displayWeapons),
+                                ("materials", self.workshop.displayMaterials)]:
+            output = io.StringIO()
+            written = self.workshop.writeTo(output, report, bufferSize=50)
+            self.assertEqual(output.getvalue(), display())
+            self.assertEqual(written, len(display()))
+        with self.assertRaises(ValueError):
+            self.workshop.writeTo(io.StringIO(), "armour")
+
+
+class MainModuleTestCase(unittest.TestCase):
+
+    def test_import_is_silent(self):
+        # Importing the module runs no demo
+        result = subprocess.run([sys.executable, "-c", "import phahy039_main"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        self.assertEqual(result.stdout, "")
+
+    def test_lazy_tables(self):
+        self.assertIn("weaponBlueprints", dir(phahy039_main))
+        self.assertIs(phahy039_main.weaponBlueprints, phahy039_main.weaponBlueprints)
+        self.assertEqual(weaponBlueprints["Sword"], [Steel(), Maple()])
+        with self.assertRaises(AttributeError):
+            phahy039_main.recipes
+        self.assertEqual(blueprintTables(None, {}), (weaponBlueprints, {}))
+
+    def test_imports_leave_tables_unbuilt(self):
+        # The modules using the tables look them up when called, not when imported.
+        modules = ["phahy039_" + name for name in ("service", "simulation", "optimizer", "snapshot", "metrics",
+                                                  "planner", "battle", "shard", "feed", "journal", "ingest")]
+        # A star import of the main module leaves them unbuilt as well.
+        statement = (f"import {', '.join(modules)}, phahy039_main\n"
+                     f"from phahy039_main import *\n"
+                     f"print(sorted(set(vars(phahy039_main)) & set(phahy039_main.lazyTables)))")
+        result = subprocess.run([sys.executable, "-c", statement], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        self.assertEqual(result.stdout, "[]\n")
+
+    def test_all(self):
+        # Every class and function of the module is exported, but not the modules it
+        # imports nor the lazy tables.
+        exported = set(phahy039_main.__all__)
+        defined = {name for name, value in vars(phahy039_main).items()
+                   if getattr(value, "__module__", None) == "phahy039_main" and not name.startswith("_")}
+        self.assertLessEqual(defined, exported)
+        self.assertFalse(exported & {"math", "sys", "threading", "array", "lazyTables"})
+        self.assertFalse(exported & set(phahy039_main.lazyTables))
+
+    def test_main(self):
+        with io.StringIO() as output, contextlib.redirect_stdout(output):
+            workshop = main()
+            self.assertIn("Enchanted Armoury", output.getvalue())
+        self.assertEqual(len(workshop.weapons), 7)
+        self.assertTrue(all(weapon.isEnchanted() for weapon in workshop.weapons))
+
+
+class ReportCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workshop = Workshop(Forge(), Enchanter())
+        self.weapons = [Weapon(f"Sword {i}", Steel(), Maple()) for i in range(12)]
+        for weapon in self.weapons:
+            self.workshop.addWeapon(weapon)
+        self.cache = self.workshop.enableReportCache()
+        self.holy = Enchantment("Holy", Diamond(), Diamond(), "pulses a blinding beam of light")
+
+    def test_render(self):
+        # Verify the cached report always matches a full render
+        self.assertEqual(self.workshop.displayWeapons(), "".join(self.workshop.iterWeapons()))
+        self.workshop.enchanter.enchant(self.weapons[10], "Holy Sword", self.holy)
+        self.assertEqual(self.workshop.displayWeapons(), "".join(self.workshop.iterWeapons()))
+        self.workshop.removeWeapon(self.weapons[0])
+        self.workshop.addWeapon(Weapon("Bow", Oak(), Maple()))
+        self.weapons[3].setName("Renamed Sword")
+        self.assertEqual(self.workshop.displayWeapons(), "".join(self.workshop.iterWeapons()))
+        self.assertIn("The Holy Sword is imbued with a Holy enchantment", self.workshop.displayWeapons())
+
+    def test_incremental(self):
+        self.workshop.displayWeapons()
+        # Count the lines built by a render after enchanting a single weapon
+        built = []
+        weaponLine = self.workshop.weaponLine
+        self.workshop.weaponLine = lambda *args: built.append(args[0]) or weaponLine(*args)
+        self.workshop.enchanter.enchant(self.weapons[11], "Holy Sword", self.holy)
+        self.workshop.displayWeapons()
+        # Only the enchanted weapon and the leading lines are rebuilt
+        self.assertEqual(len(built), 1 + len(Workshop.enchantedWeaponNames))
+        self.assertIs(built[0], self.weapons[11])
+
+    def test_enchantmentChanged(self):
+        self.workshop.enchanter.enchant(self.weapons[10], "Holy Sword", self.holy)
+        self.workshop.displayWeapons()
+        # Changing the effect of an enchantment rebuilds the lines of its weapons
+        self.holy.setEffect("burns with a holy fire")
+        self.assertIn("Holy enchantment and burns with a holy fire", self.workshop.displayWeapons())
+        self.assertEqual(self.workshop.displayWeapons(), "".join(self.workshop.iterWeapons()))
+        # The observers are not pickled with the enchantment
+        self.assertEqual(pickle.loads(pickle.dumps(self.holy)).getEffect(), "burns with a holy fire")
+
+    def test_blocks(self):
+        # Blocks of two weapons, so changes fall in, across and between blocks
+        cache = type("SmallBlockCache", (ReportCache,), {"blockSize": 2})(self.workshop)
+        self.workshop.enchanter.enchant(self.weapons[9], "Holy Sword", self.holy)
+        self.assertEqual(cache.render(), "".join(self.workshop.iterWeapons()))
+        for weapon in (self.weapons[0], self.weapons[8], self.weapons[9], self.weapons[10]):
+            self.workshop.removeWeapon(weapon)
+            self.workshop.addWeapon(Weapon("Bow", Oak(), Maple()))
+            self.workshop.enchanter.enchant(self.workshop.weapons[-1], "Holy Bow", self.holy)
+            self.assertEqual(cache.render(), "".join(self.workshop.iterWeapons()))
+        self.holy.setEffect("glows")
+        self.assertEqual(cache.render(), "".join(self.workshop.iterWeapons()))
+
+
+class DamageIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workshop = Workshop(Forge(), Enchanter())
+        # Bow 20, Wand 12, Dagger 7.8, Sword 90 and Axe 19.8 damage
+        self.bow = self.workshop.addWeapon(Weapon("Bow", Oak(), Maple()))
+        self.wand = self.workshop.addWeapon(Weapon("Wand", Ash(), Oak()))
+        self.dagger = self.workshop.addWeapon(Weapon("Dagger", Bronze(), Bronze()))
+        self.index = self.workshop.enableDamageIndex()
+        self.sword = self.workshop.addWeapon(Weapon("Sword", Steel(), Maple()))
+        self.axe = self.workshop.addWeapon(Weapon("Axe", Iron(), Ash()))
+
+    def test_queries(self):
+        self.assertEqual(self.workshop.topK(2), [self.sword, self.bow])
+        self.assertEqual(self.workshop.damageRange(12, 20), [self.wand, self.axe, self.bow])
+        self.assertAlmostEqual(self.workshop.damagePercentile(50), 19.8)
+        self.assertEqual(self.workshop.damagePercentile(100), 90)
+        self.assertEqual(self.workshop.topK(0), [])
+
+    def test_updates(self):
+        # Enchanting the dagger raises it to 72 damage, second only to the sword
+        holy = Enchantment("Holy", Diamond(), Diamond(), "pulses a blinding beam of light")
+        self.workshop.enchanter.enchant(self.dagger, "Holy Dagger", holy)
+        self.assertEqual(self.workshop.topK(2), [self.sword, self.dagger])
+        self.workshop.removeWeapon(self.dagger)
+        self.workshop.removeWeapon(self.bow)
+        self.assertEqual(self.workshop.topK(10), [self.sword, self.axe, self.wand])
+        self.assertEqual(len(self.index), 3)
+
+
+class WeaponIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workshop = Workshop(Forge(), Enchanter())
+        self.sword = self.workshop.addWeapon(Weapon("Sword", Steel(), Maple()))
+        self.axe = self.workshop.addWeapon(Weapon("Axe", Steel(), Ash()))
+        self.index = self.workshop.enableWeaponIndex()
+        self.bow = self.workshop.addWeapon(Weapon("Bow", Oak(), Maple()))
+        self.holy = Enchantment("Holy", Diamond(), Diamond(), "pulses a blinding beam of light")
+
+    def test_find(self):
+        self.assertEqual(self.workshop.findWeapons(primary="Steel"), [self.sword, self.axe])
+        self.assertEqual(self.workshop.findWeapons(primary=Steel, catalyst=Maple()), [self.sword])
+        self.assertEqual(self.workshop.findWeapons(enchanted=False), [self.sword, self.axe, self.bow])
+        self.assertEqual(self.workshop.findWeapons(primary="Bronze"), [])
+        self.assertEqual(self.workshop.findWeapons(), [self.sword, self.axe, self.bow])
+
+    def test_updates(self):
+        self.workshop.enchanter.enchant(self.axe, "Holy Axe", self.holy)
+        self.bow.setEnchantment(self.holy)
+        self.assertEqual(self.workshop.findWeapons(enchantment="Holy"), [self.axe, self.bow])
+        self.assertEqual(self.workshop.findWeapons(primary="Steel", enchanted=True), [self.axe])
+        self.assertEqual(self.index.count("enchanted", False), 1)
+        self.workshop.removeWeapon(self.axe)
+        self.assertEqual(self.workshop.findWeapons(enchantment="Holy"), [self.bow])
+        self.assertEqual(len(self.index), 2)
+
+    def test_crafting(self):
+        self.workshop.addMaterial("Bronze", 2)
+        dagger = Forge(self.workshop).craft("Dagger", Bronze(), Bronze(), self.workshop.materials)
+        self.assertEqual(self.workshop.findWeapons(catalyst="Bronze"), [dagger])
+
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "workshop.snapshot")
+        self.workshop = snapshotWorkshop(40)
+        enchanter = Enchanter()
+        enchanter.enchant(self.workshop.weapons[0], "Holy Greatsword", self.workshop.enchantments[1])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_roundTrip(self):
+        writeSnapshot(self.workshop, self.path)
+        with Snapshot(self.path) as snapshot:
+            self.assertEqual(len(snapshot.weapons), 40)
+            loaded = snapshot.toWorkshop(Forge(), Enchanter())
+        self.assertEqual(loaded.displayWeapons(), self.workshop.displayWeapons())
+        self.assertEqual(loaded.displayEnchantments(), self.workshop.displayEnchantments())
+        self.assertEqual(loaded.materials, self.workshop.materials)
+        self.assertEqual(loaded.calculateDamages(), self.workshop.calculateDamages())
+        self.assertEqual(loaded.weapons[0].enchantmentName, "Holy Greatsword")
+
+    def test_lazyAccess(self):
+        self.workshop = Workshop(None, None, Armoury(self.workshop.weapons))
+        writeSnapshot(self.workshop, self.path)
+        with Snapshot(self.path) as snapshot:
+            last = snapshot.weapons[-1]
+            self.assertEqual(last.name, self.workshop.weapons[-1].name)
+            self.assertIs(last.getPrimaryMaterial(), self.workshop.weapons[-1].getPrimaryMaterial())
+            # Weapons sharing an enchantment share the loaded enchantment too.
+            self.assertIs(snapshot.weapons[1].enchantment,
+                          snapshot.weapons[1 + 2 * len(enchantmentBlueprints)].enchantment)
+            self.assertEqual(snapshot.weaponRecord(2)[4], 0)
+            with self.assertRaises(IndexError):
+                snapshot.weaponRecord(40)
+
+    def test_invalidFile(self):
+        with open(self.path, "wb") as file:
+            file.write(b"not a snapshot" * 10)
+        with self.assertRaises(ValueError):
+            Snapshot(self.path)
+        writeSnapshot(self.workshop, self.path)
+        with open(self.path, "r+b") as file:
+            file.write(b"PHWS\x09\x00")
+        with self.assertRaises(ValueError):
+            Snapshot(self.path)
+
+
+class JournalTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "workshop.journal")
+        self.workshop = Workshop(Forge(), Enchanter())
+        for materialName in ("Steel", "Maple", "Oak", "Diamond", "Ruby"):
+            self.workshop.addMaterial(materialName, 10)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def craft(self):
+        forge = Forge(self.workshop)
+        enchanter = Enchanter(self.workshop)
+        sword = forge.craft("Sword", Steel(), Maple(), self.workshop.materials)
+        bow = forge.craft("Bow", Oak(), Maple(), self.workshop.materials)
+        holy = enchanter.craft("Holy", Diamond(), Diamond(), self.workshop.materials)
+        enchanter.enchant(sword, "Holy Greatsword", holy)
+        forge.disassemble(bow, self.workshop.materials)
+        # An enchantment that is never stored in the workshop is logged with its weapon.
+        spear = forge.craft("Spear", Steel(), Oak(), self.workshop.materials)
+        spear.setEnchantment(Enchantment("Pyro", Ruby(), Ruby(), "applies a devastating burning effect"))
+        self.workshop.addMaterial("Oak", 5)
+
+    def assertSameWorkshop(self, recovered):
+        self.assertEqual(recovered.displayWeapons(), self.workshop.displayWeapons())
+        self.assertEqual(recovered.displayEnchantments(), self.workshop.displayEnchantments())
+        self.assertEqual(recovered.materials, self.workshop.materials)
+        self.assertEqual(recovered.calculateDamages(), self.workshop.calculateDamages())
+
+    def test_replay(self):
+        with Journal(self.path, self.workshop) as journal:
+            self.craft()
+        recovered, _ = replay(self.path)
+        self.assertSameWorkshop(recovered)
+        self.assertEqual(recovered.weapons[0].enchantmentName, "Holy Greatsword")
+
+    def test_crash(self):
+        journal = Journal(self.path, self.workshop, groupSize=10**6, syncInterval=10**6)
+        self.craft()
+        journal.commit()
+        committed = self.workshop.displayWeapons()
+        # Changes that were never committed are lost, and a torn last frame is ignored.
+        Forge(self.workshop).craft("Sword", Steel(), Maple(), self.workshop.materials)
+        with open(self.path, "ab") as file:
+            file.write(b"\x40\x00\x00\x00torn")
+        recovered, _ = replay(self.path)
+        self.assertEqual(recovered.displayWeapons(), committed)
+        journal.close()
+
+    def test_intDamage(self):
+        # An Oak and Maple Bow deals an int damage, which is restored as it was.
+        with Journal(self.path, self.workshop):
+            bow = Forge(self.workshop).craft("Bow", Oak(), Maple(), self.workshop.materials)
+        recovered, _ = replay(self.path)
+        self.assertEqual(recovered.weapons[0].getDamage(), bow.getDamage())
+        self.assertEqual(recovered.weapons[0].getDamage(), 20)
+        self.assertSameWorkshop(recovered)
+
+    def test_removedBeforeCommit(self):
+        # Items removed before their first commit are left out unless they were stored again.
+        journal = Journal(self.path, self.workshop, syncInterval=10**6)
+        forge = Forge(self.workshop)
+        sword = forge.craft("Sword", Steel(), Maple(), self.workshop.materials)
+        bow = forge.craft("Bow", Oak(), Maple(), self.workshop.materials)
+        holy = Enchanter(self.workshop).craft("Holy", Diamond(), Diamond(), self.workshop.materials)
+        self.workshop.removeWeapon(sword)
+        self.workshop.removeWeapon(bow)
+        self.workshop.removeEnchantment(holy)
+        self.workshop.addWeapon(bow)
+        journal.close()
+        recovered, _ = replay(self.path)
+        self.assertEqual([weapon.getName() for weapon in recovered.weapons], ["Bow"])
+        self.assertEqual(len(recovered.enchantments), 0)
+        self.assertSameWorkshop(recovered)
+
+    def waitForReplay(self, done):
+        """Replays the log until done is true of the recovered workshop, as the flusher commits in the background."""
+        deadline = time.monotonic() + 5
+        recovered, _ = replay(self.path)
+        while not done(recovered) and time.monotonic() < deadline:
+            time.sleep(0.01)
+            recovered, _ = replay(self.path)
+        return recovered
+
+    def test_idle(self):
+        # The flusher commits what was changed before the workshop went idle.
+        journal = Journal(self.path, self.workshop, syncInterval=0.01)
+        self.craft()
+        self.workshop.removeMaterial(Ruby(), 3)
+        recovered = self.waitForReplay(lambda recovered: recovered.materials == self.workshop.materials)
+        self.assertSameWorkshop(recovered)
+        journal.close()
+
+    def test_groupSize(self):
+        # Materials added through the workshop count towards a group.
+        journal = Journal(self.path, self.workshop, groupSize=2, syncInterval=10**6)
+        self.workshop.addMaterial("Steel", 1)
+        self.workshop.removeMaterial(Steel(), 2)
+        recovered = self.waitForReplay(lambda recovered: recovered.materials["Steel"] == 9)
+        self.assertEqual(recovered.materials, self.workshop.materials)
+        journal.close()
+
+    def test_checkpoint(self):
+        journal = Journal(self.path, self.workshop, groupSize=1, checkpointEvery=3)
+        self.craft()
+        journal.close()
+        journal = Journal.recover(self.path, Forge(), Enchanter())
+        self.assertSameWorkshop(journal.workshop)
+        # The recovered workshop keeps being journaled.
+        Forge(journal.workshop).craft("Sword", Steel(), Maple(), journal.workshop.materials)
+        journal.close()
+        recovered, _ = replay(self.path)
+        self.assertEqual(len(recovered.weapons), 3)
+        self.assertEqual(recovered.materials["Steel"], self.workshop.materials["Steel"] - 1)
+
+
+class ChangeFeedTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.workshop = Workshop(Forge(), Enchanter())
+        self.forge = Forge(self.workshop)
+        self.enchanter = Enchanter(self.workshop)
+        for materialName in ("Steel", "Maple", "Diamond"):
+            self.workshop.addMaterial(materialName, 10)
+        self.sword = self.forge.craft("Sword", Steel(), Maple(), self.workshop.materials)
+        self.feed = ChangeFeed(self.workshop, capacity=8)
+
+    def test_read(self):
+        cursor = self.feed.cursor()
+        holy = self.enchanter.craft("Holy", Diamond(), Diamond(), self.workshop.materials)
+        self.enchanter.enchant(self.sword, "Holy", holy)
+        events, cursor = self.feed.read(cursor)
+        self.assertEqual([(kind, item, value) for _, kind, item, value in events],
+                         [(ENCHANTMENT_ADDED, holy, None), (WEAPON_ENCHANTED, self.sword, holy),
+                          (WEAPON_CHANGED, self.sword, None), (MATERIAL_CHANGED, "Diamond", -2)])
+        self.assertEqual([sequence for sequence, _, _, _ in events], [0, 1, 2, 3])
+        self.assertEqual(self.feed.read(cursor), ([], 4))
+        self.assertEqual(self.feed.read(0, limit=1)[1], 1)
+        with self.assertRaises(ValueError):
+            self.feed.read(5)
+
+    def test_materialsRecordedOnce(self):
+        # Recording a delta flushes at once, and the flush must not record it again.
+        feed = ChangeFeed(self.workshop, batchSize=1)
+        batches = []
+        feed.subscribe(batches.append)
+        cursor = feed.cursor()
+        self.workshop.addMaterial("Steel", 5)
+        events, _ = feed.read(cursor)
+        self.assertEqual([(kind, item, value) for _, kind, item, value in events], [(MATERIAL_CHANGED, "Steel", 5)])
+        self.assertEqual([[(kind, item, value) for _, kind, item, value in batch] for batch in batches],
+                         [[(MATERIAL_CHANGED, "Steel", 5)]])
+        feed.close()
+
+    def test_coalesce(self):
+        cursor = self.feed.cursor()
+        dagger = self.forge.craft("Sword", Steel(), Maple(), self.workshop.materials)
+        self.enchanter.enchant(self.sword, "Holy", Enchantment("Holy", Diamond(), Diamond(), "light"))
+        self.workshop.removeWeapon(dagger)
+        self.workshop.addMaterial("Steel", 1)
+        events, _ = self.feed.read(cursor)
+        self.assertEqual([(kind, item) for _, kind, item, _ in coalesce(events)],
+                         [(WEAPON_ENCHANTED, self.sword), (MATERIAL_CHANGED, "Maple")])
+        self.assertEqual(coalesce(events)[1][3], -1)
+        # A weapon removed and crafted again is only a change.
+        self.assertEqual([kind for _, kind, _, _ in coalesce([(0, WEAPON_REMOVED, dagger, None),
+                                                               (1, WEAPON_ADDED, dagger, None)])], [WEAPON_CHANGED])
+
+    def test_overflow(self):
+        cursor = self.feed.cursor()
+        weapons = self.forge.craftMany(weaponBlueprints, {"Sword": 5}, self.workshop.materials)
+        self.workshop.removeWeapons(weapons)
+        events, cursor = self.feed.read(cursor)
+        # Ten weapon events and two material events, only the last eight are kept.
+        self.assertEqual(events[0][1:], (FEED_OVERFLOW, None, 4))
+        self.assertEqual(len(events), 9)
+        self.assertEqual(cursor, 12)
+        self.assertEqual(coalesce(events)[0][1:], (FEED_OVERFLOW, None, 4))
+
+    def test_subscribe(self):
+        batches = []
+        feed = ChangeFeed(self.workshop, batchSize=3)
+        feed.subscribe(batches.append)
+        self.forge.craft("Sword", Steel(), Maple(), self.workshop.materials)
+        self.assertEqual(batches, [])
+        weapon = self.forge.craft("Sword", Steel(), Maple(), self.workshop.materials)
+        self.workshop.removeWeapon(weapon)
+        # The third event flushed the batch, in which the second weapon cancelled out.
+        self.assertEqual([[kind for _, kind, _, _ in batch] for batch in batches],
+                         [[WEAPON_ADDED, MATERIAL_CHANGED, MATERIAL_CHANGED]])
+        self.workshop.removeWeapon(self.sword)
+        feed.close()
+        self.assertEqual([kind for _, kind, _, _ in batches[1]], [WEAPON_REMOVED])
+        self.workshop.removeWeapon(self.workshop.weapons[0])
+        self.assertEqual(len(batches), 2)
+
+    def test_armouryWeapon(self):
+        workshop = Workshop(Forge(), Enchanter(), Armoury())
+        weapon = workshop.addWeapon(Weapon("Sword", Steel(), Maple()))
+        feed = ChangeFeed(workshop)
+        cursor = feed.cursor()
+        holy = Enchantment("Holy", Diamond(), Diamond(), "light")
+        weapon.setEnchantment(holy)
+        self.assertTrue(weapon.isEnchanted())
+        self.assertEqual([event[1:] for event in feed.read(cursor)[0]], [(WEAPON_ENCHANTED, weapon, holy)])
+
+
+class IngestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.workshop = Workshop(Forge(), Enchanter())
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w") as file:
+            file.write(text)
+        return path
+
+    def test_deliveries(self):
+        path = self.write("deliveries.csv", "material,quantity\nSteel,3\nMaple,2\nSteel,4\n")
+        self.assertEqual(ingestDeliveries(self.workshop, path, batchSize=2), 9)
+        self.assertEqual(self.workshop.materials, {"Steel": 7, "Maple": 2})
+
+    def test_blueprints(self):
+        self.workshop.addMaterial("Steel", 3)
+        self.workshop.addMaterial("Maple", 1)
+        self.workshop.addMaterial("Diamond", 4)
+        path = self.write("orders.jsonl", '{"kind": "weapon", "name": "Sword", "primary": "Steel", "catalyst": "Maple"}\n'
+                                          '\n'
+                                          '{"kind": "enchantment", "name": "Holy", "primary": "Diamond", '
+                                          '"catalyst": "Diamond", "count": 2}\n'
+                                          '{"kind": "weapon", "name": "Sword", "primary": "Steel", "catalyst": "Steel"}\n')
+        report = ingestBlueprints(self.workshop, path)
+        self.assertEqual(report, {"weapons": 2, "enchantments": 2, "failed": 0, "invalid": 0})
+        self.assertEqual([weapon.getCatalystMaterial() for weapon in self.workshop.weapons], [Maple(), Steel()])
+        self.assertEqual(self.workshop.materials["Steel"], 0)
+        # A batch the stock cannot cover is crafted one item at a time.
+        path = self.write("more.csv", "kind,name,primary,catalyst,count\nweapon,Bow,Oak,Maple,3\n")
+        self.workshop.addMaterial("Oak", 2)
+        self.workshop.addMaterial("Maple", 1)
+        self.assertEqual(ingestBlueprints(self.workshop, path), {"weapons": 1, "enchantments": 0, "failed": 2,
+                                                                 "invalid": 0})
+
+    def test_invalidBlueprints(self):
+        # A blueprint whose materials cannot make the item is skipped without using any stock.
+        self.workshop.addMaterial("Ruby", 4)
+        self.workshop.addMaterial("Steel", 1)
+        self.workshop.addMaterial("Maple", 1)
+        path = self.write("orders.csv", "kind,name,primary,catalyst,count\nweapon,Sword,Ruby,Ruby,2\n"
+                                        "weapon,Sword,Steel,Maple,1\n")
+        self.assertEqual(ingestBlueprints(self.workshop, path), {"weapons": 1, "enchantments": 0, "failed": 0,
+                                                                 "invalid": 1})
+        self.assertEqual(self.workshop.materials, {"Ruby": 4, "Steel": 0, "Maple": 0})
+
+    def test_errors(self):
+        path = self.write("deliveries.jsonl", '{"material": "Steel", "quantity": 1}\n{"material": "Mithril", "quantity": 1}\n')
+        with self.assertRaisesRegex(ValueError, "deliveries.jsonl:2: Unknown material"):
+            ingestDeliveries(self.workshop, path)
+        # Wood is a kind of material, not one that can be delivered.
+        path = self.write("deliveries.csv", "material,quantity\nOak,1\nWood,3\n")
+        with self.assertRaisesRegex(ValueError, "deliveries.csv:3: Unknown material: Wood"):
+            ingestDeliveries(self.workshop, path)
+        with self.assertRaises(ValueError):
+            list(readRecords(self.write("deliveries.txt", "")))
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.workshop = Workshop(Forge(), Enchanter())
+        self.workshop.addMaterial("Steel", 2)
+        self.workshop.addMaterial("Maple", 1)
+        self.instrumentation = Instrumentation()
+
+    def tearDown(self):
+        self.instrumentation.disable()
+
+    def test_disabled_methods_are_untouched(self):
+        craft = Forge.__dict__["craft"]
+        with self.instrumentation:
+            self.assertIsNot(Forge.__dict__["craft"], craft)
+            with self.assertRaises(ValueError):
+                Instrumentation().enable()
+        self.assertIs(Forge.__dict__["craft"], craft)
+        self.workshop.forge.craft("Sword", Steel(), Maple(), self.workshop.materials)
+        self.assertEqual(self.instrumentation.toDict()["operations"]["forge_craft"]["calls"], 0)
+
+    def test_counters(self):
+        with self.instrumentation:
+            self.workshop.forge.craft("Sword", Steel(), Maple(), self.workshop.materials)
+            with self.assertRaises(ValueError):
+                self.workshop.forge.craft("Sword", Steel(), Maple(), self.workshop.materials)
+            self.workshop.displayWeapons()
+        metrics = self.instrumentation.toDict()
+        self.assertEqual(metrics["operations"]["forge_craft"]["calls"], 2)
+        self.assertEqual(metrics["operations"]["forge_craft"]["errors"], 1)
+        # Both crafts calculated the damage of their weapon before checking the stock.
+        self.assertEqual(metrics["operations"]["weapon_calculateDamage"]["calls"], 2)
+        self.assertEqual(metrics["operations"]["workshop_displayWeapons"]["calls"], 1)
+        self.assertEqual(metrics["operations"]["forge_craft"]["buckets"][-1], (float("inf"), 2))
+        self.assertEqual({name: material["consumed"] for name, material in metrics["materials"].items()},
+                         {"Maple": 1, "Steel": 1})
+        self.assertGreater(metrics["materials"]["Steel"]["rate"], 0)
+
+    def test_prometheus(self):
+        with self.instrumentation:
+            Enchanter().craftMany({"Holy": [Diamond(), Diamond()]}, {"Holy": 2}, {"Diamond": 4})
+        text = self.instrumentation.toPrometheus()
+        self.assertIn("# TYPE phahy039_operation_seconds histogram\n", text)
+        self.assertIn('phahy039_operation_seconds_count{operation="enchanter_craftMany"} 1\n', text)
+        self.assertIn('phahy039_operation_seconds_bucket{operation="enchanter_craftMany",le="+Inf"} 1\n', text)
+        self.assertIn('phahy039_materials_consumed_total{material="Diamond"} 4\n', text)
+
+    def test_histogram(self):
+        histogram = Histogram((1.0, 2.0, 4.0))
+        self.assertIsNone(histogram.quantile(0.5))
+        for seconds in (0.5, 1.0, 1.5, 3.0, 5.0):
+            histogram.observe(seconds)
+        self.assertEqual(histogram.cumulativeCounts(), [2, 3, 4, 5])
+        self.assertAlmostEqual(histogram.quantile(0.4), 1.0)
+        self.assertAlmostEqual(histogram.quantile(0.5), 1.5)
+        self.assertEqual(histogram.quantile(1), 4.0)
+
+
+class BenchmarkSuiteTestCase(unittest.TestCase):
+
+    def test_suite(self):
+        self.assertEqual(suiteSizes(10_000), [100, 1000, 10_000])
+        suite = benchmarkSuite([100], operations=20, repeat=1)
+        benchmarks = {result["benchmark"] for result in suite["results"]}
+        self.assertIn("memory_per_weapon", benchmarks)
+        self.assertIn("workshop_removeWeapon", benchmarks)
+        self.assertTrue(all(result["size"] == 100 and result["value"] > 0 for result in suite["results"]))
+        # Every result is within tolerance of itself.
+        self.assertEqual(compareSuites(suite, suite), [])
+
+    def test_regressions(self):
+        baseline = {"version": 1, "results": [{"benchmark": "forge_craft", "size": 100, "value": 10.0},
+                                              {"benchmark": "forge_craft", "size": 1000, "value": 10.0}]}
+        results = {"version": 1, "results": [{"benchmark": "forge_craft", "size": 100, "value": 12.0},
+                                             {"benchmark": "forge_craft", "size": 1000, "value": 13.0},
+                                             {"benchmark": "forge_craft", "size": 10_000, "value": 99.0}]}
+        self.assertEqual(compareSuites(results, baseline), [("forge_craft", 1000, 10.0, 13.0)])
+        with self.assertRaises(ValueError):
+            compareSuites(dict(results, version=2), baseline)
+
+
+class BattleSimulatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.simulator = BattleSimulator(trials=2000, seed=3, maxRounds=50)
+
+    def test_duel(self):
+        knight = Combatant("Knight", 1000, 180)
+        ogre = Combatant("Ogre", 1400, 200)
+        win, draw, loss = self.simulator.duel(knight, ogre)
+        self.assertAlmostEqual(win + draw + loss, 1.0)
+        self.assertLess(win, loss)
+        # Identical fighters share their kill distribution, so neither has the edge.
+        win, draw, loss = self.simulator.duel(knight, Combatant("Twin", 1000, 180))
+        self.assertAlmostEqual(win, loss)
+        # A fighter that cannot land a kill within maxRounds only draws or loses.
+        self.assertEqual(self.simulator.duel(Combatant("Mouse", 10 ** 9, 1), knight)[0], 0.0)
+        # The same seed gives the same results.
+        self.assertEqual(BattleSimulator(trials=2000, seed=3, maxRounds=50).duel(knight, ogre), self.simulator.duel(knight, ogre))
+
+    def test_win_rates(self):
+        loadouts = loadoutsOf({"Sword": [Steel(), Maple()], "Dagger": [Bronze(), Bronze()]},
+                              {"Holy": [Diamond(), Diamond()]})
+        self.assertEqual([loadout.name for loadout in loadouts], ["Sword", "Holy Sword", "Dagger", "Holy Dagger"])
+        matrix = self.simulator.winRates(loadouts, loadouts)
+        self.assertEqual(matrix["rows"], matrix["columns"])
+        self.assertGreater(matrix["wins"][1][0], 0.5)
+        self.assertLess(matrix["wins"][2][0], 0.5)
+        ranking = self.simulator.balance(loadouts)
+        self.assertEqual(ranking[0][0], "Holy Sword")
+        self.assertEqual(set(ranking[0][2]), {"Goblin", "Orc", "Troll", "Wyvern", "Dragon"})
+
+    def test_armouries(self):
+        workshop = Workshop(Forge(), Enchanter())
+        for weapon in (Weapon("Sword", Steel(), Maple()), Weapon("Sword", Steel(), Maple()),
+                       Weapon("Dagger", Bronze(), Bronze())):
+            workshop.addWeapon(weapon)
+        combatants = combatantsOf(workshop.weapons)
+        self.assertEqual([(combatant.name, combatant.count) for combatant in combatants],
+                         [("Sword", 2), ("Dagger", 1)])
+        win, draw, loss = self.simulator.armouryWinRate(combatants, combatants)
+        self.assertAlmostEqual(win, loss)
+        distribution = self.simulator.damageDistribution(combatants[0])
+        self.assertLessEqual(distribution["p5"], distribution["p50"])
+        self.assertLessEqual(distribution["p50"], distribution["p95"])
+        result = self.simulator.teamFight(combatants, [Combatant("Goblin", 100, 1)], fights=50)
+        self.assertEqual((result["win"], result["meanRounds"]), (1.0, 1.0))
+
+
+class ConcurrentWorkshopTestCase(unittest.TestCase):
+
+    def test_concurrentCrafting(self):
+        workshop = ConcurrentWorkshop(None, None)
+        forge = Forge(workshop)
+        workshop.addMaterial("Steel", 150)
+        workshop.addMaterial("Maple", 100)
+        workshop.addMaterial("Bronze", 100)
+        blueprints = [("Sword", Steel(), Maple()), ("Dagger", Bronze(), Bronze()), ("Staff", Steel(), Bronze())]
+
+        def craftUntilEmpty(start):
+            for i in range(200):
+                name, primary, catalyst = blueprints[(start + i) % len(blueprints)]
+                try:
+                    forge.craft(name, primary, catalyst, workshop.materials)
+                except ValueError:
+                    pass
+
+        switchInterval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=craftUntilEmpty, args=(i,)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switchInterval)
+
+        # Verify no material went negative and every unit consumed went into a weapon
+        self.assertTrue(all(quantity >= 0 for quantity in workshop.materials.values()))
+        used = {"Steel": 0, "Maple": 0, "Bronze": 0}
+        for weapon in workshop.weapons:
+            used[weapon.getPrimaryMaterial().__class__.__name__] += 1
+            used[weapon.getCatalystMaterial().__class__.__name__] += 1
+        self.assertEqual(used["Steel"] + workshop.materials["Steel"], 150)
+        self.assertEqual(used["Maple"] + workshop.materials["Maple"], 100)
+        self.assertEqual(used["Bronze"] + workshop.materials["Bronze"], 100)
+
+    def test_sameMaterialTwice(self):
+        materials = MaterialStore({"Bronze": 1})
+        # A dagger needs two pieces of bronze, so a single piece is not enough
+        with self.assertRaises(ValueError):
+            Forge().craft("Dagger", Bronze(), Bronze(), materials)
+        self.assertEqual(materials["Bronze"], 1)
+
+
+class CraftingServiceTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.workshop = Workshop(Forge(), Enchanter())
+        self.workshop.addMaterial("Steel", 3)
+        self.workshop.addMaterial("Maple", 10)
+        self.workshop.addMaterial("Diamond", 2)
+
+    async def test_coalescing(self):
+        forgeBatches = []
+        craftMany = Forge.craftMany
+
+        def countingCraftMany(forge, blueprints, counts, materials):
+            forgeBatches.append(counts)
+            return craftMany(forge, blueprints, counts, materials)
+
+        Forge.craftMany = countingCraftMany
+        try:
+            async with CraftingService(self.workshop, maxQueue=4) as service:
+                results = await asyncio.gather(*(service.craftWeapon("Sword") for _ in range(5)),
+                                               return_exceptions=True)
+        finally:
+            Forge.craftMany = craftMany
+        # Only three swords can be made, the others fail on their own
+        weapons = [result for result in results if isinstance(result, Weapon)]
+        self.assertEqual(len(weapons), 3)
+        self.assertEqual(sum(isinstance(result, ValueError) for result in results), 2)
+        self.assertEqual(len(self.workshop.weapons), 3)
+        self.assertEqual(self.workshop.materials["Steel"], 0)
+        # The concurrent requests were crafted in batches, not one call each
+        self.assertLess(len(forgeBatches), 5)
+
+    async def test_enchant(self):
+        async with CraftingService(self.workshop) as service:
+            weapon, enchantment = await asyncio.gather(service.craftWeapon("Sword"), service.craftEnchantment("Holy"))
+            await service.enchant(weapon, "Holy Greatsword", enchantment)
+            with self.assertRaises(KeyError):
+                await service.craftWeapon("Mace")
+        self.assertIs(weapon.getEnchantment(), enchantment)
+        self.assertIn(enchantment, self.workshop.enchantments)
+
+    async def test_failingRequest(self):
+        # A Maple/Maple enchantment raises AttributeError, which must not stop the worker
+        enchantmentBlueprints = {"Wooden": [Maple(), Maple()], "Holy": [Diamond(), Diamond()]}
+        async with CraftingService(self.workshop, enchantmentBlueprints=enchantmentBlueprints) as service:
+            with self.assertRaises(AttributeError):
+                await asyncio.wait_for(service.craftEnchantment("Wooden"), 1)
+            enchantment = await asyncio.wait_for(service.craftEnchantment("Holy"), 1)
+            results = await asyncio.wait_for(asyncio.gather(service.craftEnchantment("Wooden"),
+                                                            service.craftWeapon("Sword"),
+                                                            return_exceptions=True), 1)
+        self.assertEqual(enchantment.getName(), "Holy")
+        self.assertIsInstance(results[0], AttributeError)
+        self.assertIsInstance(results[1], Weapon)
+        self.assertEqual(self.workshop.materials["Maple"], 9)
+
+    def test_loadTest(self):
+        report = runLoadTest(clients=10, requestsPerClient=5)
+        self.assertEqual(report["requests"], 50)
+        self.assertEqual(report["failures"], 0)
+        self.assertLessEqual(report["p50Milliseconds"], report["p99Milliseconds"])
+
+
+class SimulationTestCase(unittest.TestCase):
+
+    def test_shardStock(self):
+        stocks = shardStock({"Steel": 10, "Maple": 2}, 3)
+        self.assertEqual(stocks, [{"Maple": 1, "Steel": 4}, {"Maple": 1, "Steel": 3}, {"Maple": 0, "Steel": 3}])
+
+    def test_parallelMatchesSerial(self):
+        stock = defaultStock(30)
+        serial = runSimulation(stock, shards=3, seed=7, workers=0)
+        parallel = runSimulation(stock, shards=3, seed=7, workers=2)
+        self.assertEqual(serial, parallel)
+        # Every material unit is either left in stock or went into a crafted item
+        self.assertEqual(sum(serial["materials"].values()) + 2 * sum(serial["weapons"].values())
+                         + 2 * sum(serial["enchantments"].values()), sum(stock.values()))
+        self.assertNotEqual(serial, runSimulation(stock, shards=3, seed=8, workers=0))
+
+
+class ShardedWorkshopTestCase(unittest.TestCase):
+
+    def test_ownerOf(self):
+        # The owner does not depend on the process, unlike hash which is salted.
+        self.assertEqual(ownerOf("Sword", 4), 3)
+        self.assertTrue(all(0 <= ownerOf(name, 3) < 3 for name in weaponBlueprints))
+
+    def test_shard(self):
+        shard = WorkshopShard(weaponBlueprints, enchantmentBlueprints)
+        shard.addMaterials({"Steel": 3, "Maple": 1})
+        crafted, needs = shard.craftOrders("weapon", {"Sword": 1, "Scythe": 2})
+        self.assertEqual(list(crafted), ["Sword"])
+        self.assertEqual(needs, {"Steel": 2, "Ash": 2})
+        with self.assertRaises(ValueError):
+            shard.takeMaterials({"Steel": 3})
+        self.assertEqual(shard.takeMaterials({"Steel": 2}), {"Steel": 2})
+        self.assertEqual(shard.materials(), {"Steel": 0, "Maple": 0})
+
+    def test_shardEnchantAllOrNothing(self):
+        shard = WorkshopShard(weaponBlueprints, enchantmentBlueprints)
+        shard.addMaterials({"Steel": 1, "Maple": 1, "Onyx": 2})
+        [swordId] = shard.craftOrders("weapon", {"Sword": 1})[0]["Sword"]
+        [cursedId] = shard.craftOrders("enchantment", {"Cursed": 1})[0]["Cursed"]
+        with self.assertRaises(ValueError):
+            shard.enchantMany([(swordId, cursedId), (999, cursedId)])
+        with self.assertRaises(ValueError):
+            shard.takeEnchantments([cursedId, 999])
+        self.assertEqual(shard.summary()["enchantedWeapons"], {})
+        self.assertEqual(shard.summary()["enchantments"], {"Cursed": 1})
+
+    def test_craftAcrossShards(self):
+        with ShardedWorkshop(3) as workshop:
+            workshop.addMaterials({"Steel": 30, "Maple": 12, "Ash": 6, "Onyx": 9})
+            # The owner of each blueprint holds a third of the stock, so materials are moved to it.
+            keys = workshop.craftWeapons({"Sword": 12, "Scythe": 6})
+            self.assertEqual([shard for shard, _ in keys["Sword"]], [ownerOf("Sword", 3)] * 12)
+            self.assertGreater(workshop.transfers, 0)
+            self.assertEqual(workshop.materials(), {"Ash": 0, "Maple": 0, "Onyx": 9, "Steel": 12})
+
+            with self.assertRaises(ValueError):
+                workshop.craftWeapons({"Scythe": 1})
+            with self.assertRaises(ValueError):
+                workshop.craftWeapons({"Frost Sword": 1})
+            self.assertEqual(workshop.materials(), {"Ash": 0, "Maple": 0, "Onyx": 9, "Steel": 12})
+
+            enchantmentKeys = workshop.craftEnchantments({"Cursed": 4})["Cursed"]
+            self.assertNotEqual(enchantmentKeys[0][0], keys["Sword"][0][0])
+            # Each enchantment is moved to the shard of its weapon.
+            moved = workshop.enchantMany(zip(keys["Sword"], enchantmentKeys))
+            self.assertEqual([shard for shard, _ in moved], [ownerOf("Sword", 3)] * 4)
+            summary = workshop.summary()
+            self.assertEqual(summary["weapons"], {"Scythe": 6, "Sword": 12})
+            self.assertEqual(summary["enchantments"], {"Cursed": 4})
+            self.assertEqual(summary["enchantedWeapons"], {"Cursed Sword": 4})
+            self.assertEqual(summary["materials"]["Onyx"], 1)
+
+    def test_enchantUnknownWeapon(self):
+        with ShardedWorkshop(3) as workshop:
+            workshop.addMaterials({"Steel": 3, "Maple": 3, "Onyx": 6})
+            swordKey = workshop.craftWeapon("Sword")
+            cursedKey = workshop.craftEnchantment("Cursed")
+            # A bad weapon key is found before the enchantment leaves its shard.
+            with self.assertRaises(ValueError):
+                workshop.enchant((swordKey[0], 999), cursedKey)
+            with self.assertRaises(ValueError):
+                workshop.enchantMany([(swordKey, cursedKey), (swordKey, cursedKey)])
+            self.assertEqual(workshop.summary()["enchantments"], {"Cursed": 1})
+            self.assertEqual(workshop.enchant(swordKey, cursedKey)[0], swordKey[0])
+            self.assertEqual(workshop.summary()["enchantedWeapons"], {"Cursed Sword": 1})
+
+    def test_invalidBlueprint(self):
+        weapons = {"Sword": [Steel(), Maple()], "Bad": [Ruby(), Ruby()]}
+        enchantments = {"Cursed": [Onyx(), Onyx()], "Woody": [Maple(), Maple()]}
+        with ShardedWorkshop(2, weapons, enchantments) as workshop:
+            workshop.addMaterials({"Steel": 2, "Maple": 2, "Ruby": 4, "Onyx": 4})
+            with self.assertRaisesRegex(ValueError, "Bad"):
+                workshop.craftWeapons({"Sword": 1, "Bad": 1})
+            with self.assertRaisesRegex(ValueError, "Woody"):
+                workshop.craftEnchantments({"Woody": 1})
+            # Nothing was crafted and the shards still serve.
+            self.assertEqual(workshop.materials(), {"Maple": 2, "Onyx": 4, "Ruby": 4, "Steel": 2})
+            self.assertEqual(len(workshop.craftWeapons({"Sword": 2})["Sword"]), 2)
+
+    def test_workerSurvivesUnexpectedError(self):
+        connection, workerConnection = multiprocessing.Pipe()
+        worker = threading.Thread(target=serveShard, daemon=True,
+                                  args=(workerConnection, weaponBlueprints, enchantmentBlueprints))
+        worker.start()
+        try:
+            connection.send([("addMaterials", (None,)), ("addMaterials", ({"Steel": 1},))])
+            # A worker killed by the error would never reply.
+            self.assertTrue(connection.poll(5))
+            [(ok, error), (added, _)] = connection.recv()
+            self.assertFalse(ok)
+            self.assertIsInstance(error, AttributeError)
+            self.assertTrue(added)
+            connection.send([("materials", ())])
+            self.assertEqual(connection.recv(), [(True, {"Steel": 1})])
+        finally:
+            connection.send(None)
+            worker.join(5)
+
+
+class OptimizerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.weaponBlueprints = {"Sword": [Steel(), Maple()], "Scythe": [Steel(), Ash()], "Bow": [Oak(), Maple()]}
+        self.enchantmentBlueprints = {"Holy": [Diamond(), Diamond()], "Lava": [Ruby(), Onyx()],
+                                      "Cursed": [Onyx(), Onyx()]}
+        self.stock = {"Steel": 3, "Maple": 2, "Ash": 2, "Oak": 2, "Diamond": 3, "Ruby": 1, "Onyx": 3}
+
+    def bruteForce(self):
+        # Try every craftable set of weapons and enchantments, paired strongest to strongest
+        best = 0
+        weaponNames = list(self.weaponBlueprints)
+        enchantmentNames = list(self.enchantmentBlueprints)
+        for weaponCounts in itertools.product(range(4), repeat=len(weaponNames)):
+            for enchantmentCounts in itertools.product(range(4), repeat=len(enchantmentNames)):
+                materials = dict(self.stock)
+                try:
+                    weapons = Forge().craftMany(self.weaponBlueprints, dict(zip(weaponNames, weaponCounts)), materials)
+                    enchantments = Enchanter().craftMany(self.enchantmentBlueprints,
+                                                         dict(zip(enchantmentNames, enchantmentCounts)), materials)
+                except ValueError:
+                    continue
+                total = sum(weapon.calculateDamage() * enchantment.calculateMagicDamage()
+                            for weapon, enchantment in pairInventory(weapons, enchantments))
+                best = max(best, total)
+        return best
+
+    def test_planLoadout(self):
+        plan = planLoadout(self.stock, self.weaponBlueprints, self.enchantmentBlueprints)
+        self.assertTrue(plan["optimal"])
+        self.assertAlmostEqual(plan["totalDamage"], self.bruteForce())
+        self.assertGreaterEqual(plan["upperBound"] + 1e-9, plan["totalDamage"])
+
+    def test_craftLoadout(self):
+        workshop = Workshop(Forge(), Enchanter())
+        for materialName, quantity in self.stock.items():
+            workshop.addMaterial(materialName, quantity)
+        plan = planLoadout(self.stock, self.weaponBlueprints, self.enchantmentBlueprints)
+        weapons = craftLoadout(workshop, plan, self.weaponBlueprints, self.enchantmentBlueprints)
+        # Verify the crafted loadout deals the planned damage
+        self.assertEqual(len(workshop.weapons), len(weapons))
+        self.assertAlmostEqual(sum(workshop.calculateDamages()[1]), plan["totalDamage"])
+
+    def test_largeStock(self):
+        stock = {materialName: 5000 for materialName in
+                 ["Maple", "Oak", "Ash", "Bronze", "Iron", "Steel", "Ruby", "Sapphire",
+                  "Emerald", "Diamond", "Amethyst", "Onyx"]}
+        plan = planLoadout(stock, weaponBlueprints, enchantmentBlueprints)
+        self.assertLessEqual(plan["totalDamage"], plan["upperBound"] + 1e-6)
+        self.assertGreater(plan["totalDamage"], 0.999 * plan["upperBound"])
+
+
+class ProductionPlannerTestCase(unittest.TestCase):
+
+    def test_requirements(self):
+        order = {"Holy Sword": 3, ("Dagger", None): 2, "Sword": 1}
+        self.assertEqual(parseOrder(order), {("Sword", "Holy"): 3, ("Dagger", None): 2, ("Sword", None): 1})
+        graph = recipeGraph(order)
+        self.assertEqual(graph["Holy Sword"], {"Sword": 1, "Holy": 1})
+        self.assertEqual(graph["Dagger"], {"refined Bronze": 2})
+        self.assertEqual(materialRequirements(order), {"Steel": 4, "Maple": 4, "Diamond": 6, "Bronze": 4})
+        with self.assertRaises(ValueError):
+            parseOrder({"Frost Sword": 1})
+
+    def test_schedule(self):
+        planner = ProductionPlanner({"refinery": 1, "forge": 1, "enchanter": 1},
+                                    {"refine": 1, "disassemble": 1, "forge": 2, "craftEnchantment": 2, "enchant": 1})
+        plan = planner.plan({"Holy Sword": 2}, stock={"Steel": 2, "Maple": 2}, recycle={"Scythe": 1})
+        # 3 refinements of Steel and Maple, 4 of Diamond, 1 disassembly, 2 forgings, 2 crafts and 2 enchants.
+        self.assertEqual(plan["tasks"], 3 + 4 + 1 + 2 + 2 + 2)
+        self.assertEqual(plan["recovered"], {"Steel": 1, "Ash": 1})
+        self.assertEqual(plan["shortfall"], {"Diamond": 4})
+        self.assertEqual(plan["bottleneck"], "refinery")
+        self.assertGreaterEqual(plan["makespan"], plan["lowerBound"])
+        self.assertEqual(plan["makespan"], max(end for _, end, _, _, _, _ in plan["schedule"]))
+        # No station runs two tasks at once.
+        for station in ("refinery", "forge", "enchanter"):
+            spans = sorted((start, end) for start, end, kind, _, _, _ in plan["schedule"] if kind == station)
+            self.assertTrue(all(end <= start for (_, end), (start, _) in zip(spans, spans[1:])))
+        # Every weapon is enchanted after it is forged.
+        forged = [end for _, end, _, _, task, _ in plan["schedule"] if task == "forge"]
+        enchanted = [start for start, _, _, _, task, _ in plan["schedule"] if task == "enchant"]
+        self.assertLessEqual(min(forged), min(enchanted))
+
+    def test_bottleneck_is_kept_busy(self):
+        plan = ProductionPlanner({"refinery": 2, "forge": 4, "enchanter": 2}).plan({"Holy Sword": 500})
+        self.assertEqual(plan["bottleneck"], "enchanter")
+        self.assertLess(plan["makespan"], plan["lowerBound"] * 1.01)
+
+
+class ArmouryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.armoury = Armoury()
+        self.workshop = Workshop(Forge(), Enchanter(), self.armoury)
+        self.listWorkshop = Workshop(Forge(), Enchanter())
+        for name, primary, catalyst in [("Sword", Steel(), Maple()), ("Shield", Bronze(), Oak()),
+                                        ("Axe", Iron(), Ash()), ("Dagger", Bronze(), Bronze())]:
+            self.workshop.addWeapon(Weapon(name, primary, catalyst))
+            self.listWorkshop.addWeapon(Weapon(name, primary, catalyst))
+
+    def test_views(self):
+        # Verify the views read back the weapons stored in the columns
+        self.assertEqual(len(self.armoury), 4)
+        self.assertEqual([weapon.name for weapon in self.armoury], ["Sword", "Shield", "Axe", "Dagger"])
+        self.assertIsInstance(self.armoury[0].getPrimaryMaterial(), Steel)
+        # A view stays the same object while it is referenced
+        self.assertIs(self.armoury[1], self.armoury[1])
+        # Weapons and their views are slotted, so they carry no __dict__
+        self.assertFalse(hasattr(self.armoury[0], "__dict__"))
+        self.assertFalse(hasattr(Weapon("Sword", Steel(), Maple()), "__dict__"))
+
+    def test_enchantAndDisplay(self):
+        holy = Enchantment("Holy", Diamond(), Diamond(), "pulses a blinding beam of light")
+        Enchanter().enchant(self.armoury[0], "Holy Greatsword", holy)
+        Enchanter().enchant(self.listWorkshop.weapons[0], "Holy Greatsword", holy)
+        self.assertTrue(self.armoury[0].isEnchanted())
+        self.assertEqual(self.armoury[0].enchantmentName, "Holy Greatsword")
+        # Verify the columnar workshop renders the same report as the list backed one
+        self.assertEqual(self.workshop.displayWeapons(), self.listWorkshop.displayWeapons())
+        self.assertEqual(self.workshop.calculateDamages(), self.listWorkshop.calculateDamages())
+
+    def test_removeWeapon(self):
+        shield = self.armoury[1]
+        axe = self.armoury[2]
+        self.workshop.removeWeapon(shield)
+        self.assertNotIn(shield, self.armoury)
+        # The following views move up a row
+        self.assertIs(self.armoury[1], axe)
+        self.assertEqual(axe.name, "Axe")
+        with self.assertRaises(ValueError):
+            shield.getName()
+
+    def test_removeWeapons(self):
+        sword, shield, axe, dagger = list(self.armoury)
+        self.workshop.removeWeapons([sword, axe])
+        self.assertEqual(len(self.armoury), 2)
+        self.assertIs(self.armoury[0], shield)
+        self.assertIs(self.armoury[1], dagger)
+        self.assertNotIn(sword, self.armoury)
+
+    def test_countByMaterial(self):
+        self.assertEqual(self.armoury.countByMaterial(),
+                         {"Steel": 1, "Maple": 1, "Bronze": 3, "Oak": 1, "Iron": 1, "Ash": 1})
+
 
 class ForgeTestCase(unittest.TestCase):
     def setUp(self):
@@ -152,6 +1339,19 @@ class ForgeTestCase(unittest.TestCase):
         self.enchanter = Enchanter()
         self.workshop = Workshop(self.forge, self.enchanter)
 
+    def test_craftManyInvalidBlueprint(self):
+        # A blueprint that cannot be built fails before any material is reserved
+        self.workshop.addMaterial("Ruby", 2)
+        self.workshop.addMaterial("Maple", 2)
+        with self.assertRaises(ValueError):
+            Forge(self.workshop).craftMany({"Gem Sword": [Ruby(), Ruby()]}, {"Gem Sword": 1},
+                                           self.workshop.materials)
+        with self.assertRaises(AttributeError):
+            Enchanter(self.workshop).craftMany({"Wooden": [Maple(), Maple()]}, {"Wooden": 1},
+                                               self.workshop.materials)
+        self.assertEqual(dict(self.workshop.materials), {"Ruby": 2, "Maple": 2})
+        self.assertEqual((len(self.workshop.weapons), len(self.workshop.enchantments)), (0, 0))
+
     def test_craft(self):
         maple = Maple(strength=5)
         steel = Steel(strength=10, purity=1.8)
@@ -177,6 +1377,28 @@ class ForgeTestCase(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.forge.craft("Sword", maple, steel, {"Steel": 5})
 
+    def test_craftMany(self):
+        blueprints = {"Sword": [Steel(), Maple()], "Scythe": [Steel(), Ash()], "Bow": [Oak(), Maple()]}
+        materials = {"Steel": 5, "Maple": 10, "Ash": 2, "Oak": 4}
+        forge = Forge(workshop=self.workshop)
+        weapons = forge.craftMany(blueprints, {"Sword": 3, "Scythe": 2, "Bow": 4}, materials)
+        # Verify every weapon was crafted and added to the workshop
+        self.assertEqual([weapon.name for weapon in weapons], ["Sword"] * 3 + ["Scythe"] * 2 + ["Bow"] * 4)
+        self.assertEqual(len(self.workshop.weapons), 9)
+        self.assertEqual(weapons[0].getDamage(), 90)
+        self.assertEqual(materials, {"Steel": 0, "Maple": 3, "Ash": 0, "Oak": 0})
+
+    def test_craftManyInsufficient(self):
+        blueprints = {"Sword": [Steel(), Maple()], "Bow": [Oak(), Maple()], "Axe": [Iron(), Ash()]}
+        materials = {"Steel": 1, "Maple": 10, "Oak": 10, "Iron": 1, "Ash": 1}
+        # Steel is short for the swords, so nothing at all is crafted
+        with self.assertRaises(ValueError) as context:
+            self.forge.craftMany(blueprints, {"Sword": 2, "Bow": 1, "Axe": 1, "Mace": 1}, materials)
+        self.assertIn("Sword", str(context.exception))
+        self.assertIn("Mace", str(context.exception))
+        self.assertNotIn("Bow", str(context.exception))
+        self.assertEqual(materials, {"Steel": 1, "Maple": 10, "Oak": 10, "Iron": 1, "Ash": 1})
+
     def test_disassemble(self):
         weapon = Weapon("Sword", Maple(strength=5), Steel(strength=10, purity=1.8))
         # Create a materials dictionary representing the available materials in the workshop
@@ -208,6 +1430,16 @@ class EnchanterTestCase(unittest.TestCase):
         self.assertEqual(materials["Diamond"], 1)
         self.assertEqual(materials["Ruby"], 1)
 
+    def test_craftMany(self):
+        blueprints = {"Holy": [Diamond(), Diamond()], "Lava": [Ruby(), Onyx()]}
+        materials = {"Diamond": 4, "Ruby": 1, "Onyx": 1}
+        enchantments = self.enchanter.craftMany(blueprints, {"Holy": 2, "Lava": 1}, materials)
+        self.assertEqual([enchantment.name for enchantment in enchantments], ["Holy", "Holy", "Lava"])
+        self.assertEqual(enchantments[2].getEffect(), "melts the armour off an enemy")
+        self.assertEqual(materials, {"Diamond": 0, "Ruby": 0, "Onyx": 0})
+        with self.assertRaises(ValueError):
+            self.enchanter.craftMany(blueprints, {"Holy": 1}, materials)
+
     def test_disassemble(self):
         enchantment = Enchantment("Holy", Diamond(strength=2.1, magicPower=2.2), Diamond(strength=2.1, magicPower=2.2), "pulses a blinding beam of light")
         materials = {"Diamond": 2, "Ruby": 0}
@@ -255,6 +1487,36 @@ class WeaponTestCase(unittest.TestCase):
         weapon = Weapon("Sword", primaryMaterial, catalystMaterial)
         self.assertEqual(round(weapon.calculateDamage(), 2), 90)
 
+    def test_calculateDamages(self):
+        # Build one weapon for every pairing of wood and metal, some of them enchanted.
+        woodsAndMetals = [Maple(), Oak(), Ash(), Bronze(), Iron(), Steel(strength=10, purity=1.8)]
+        weapons = [Weapon("Test", primary, catalyst) for primary in woodsAndMetals for catalyst in woodsAndMetals]
+        holy = Enchantment("Holy", Diamond(), Diamond(), "pulses a blinding beam of light")
+        for weapon in weapons[::3]:
+            weapon.enchantment = holy
+        baseDamages, enchantedDamages = calculateDamages(weapons)
+        # Verify the batch results match the scalar methods exactly
+        for weapon, baseDamage, enchantedDamage in zip(weapons, baseDamages, enchantedDamages):
+            self.assertEqual(baseDamage, weapon.calculateDamage())
+            if weapon.enchantment:
+                self.assertEqual(enchantedDamage, weapon.calculateDamage() * holy.calculateMagicDamage())
+            else:
+                self.assertEqual(enchantedDamage, baseDamage)
+        # Gemstones cannot be forged into weapons
+        with self.assertRaises(ValueError):
+            calculateDamages([Weapon("Gem", Ruby(), Maple())])
+
+    def test_damageTable(self):
+        weapon = Weapon("Sword", Steel(), Maple())
+        weapon.calculateDamage()
+        # The damage of the pair of materials is remembered
+        self.assertEqual(damageTable[(Steel(), Maple())], 90)
+        # Registering new stats for a material forgets the remembered damages
+        Weapon("Sword", Steel(strength=12, purity=1.7), Maple()).calculateDamage()
+        Steel(strength=12.5, purity=1.7)
+        self.assertNotIn((Steel(), Maple()), damageTable)
+        self.assertEqual(weapon.calculateDamage(), 90)
+
     def test_attack(self):
         # Verify that when a weapon is created
         # the attack method returns a string indicating that it deals 20.00 damage.